@@ -0,0 +1,115 @@
+import os
+import threading
+
+from flask import g, jsonify, request
+
+from metrics import inc, set_gauge
+
+# Concurrent requests allowed per endpoint in each worker process, e.g.
+# "register=1,recognize=2,parcel_collect=2". Keep the sum below gunicorn's --threads so
+# that some threads are always free for cheap reads like /status and /track/<face_uuid>.
+DEFAULT_LIMITS = 'register=1,recognize=2,parcel_collect=2'
+ADMISSION_LIMITS = os.environ.get('ADMISSION_LIMITS', DEFAULT_LIMITS)
+# Requests allowed to wait for a slot per endpoint; more are rejected immediately
+ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', 4))
+# How long a queued request waits for a slot before it is rejected
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 5))
+# Retry-After (seconds) sent with 503 responses
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 2))
+
+
+class Gate:
+    """At most `limit` requests inside at once, at most `queue_size` waiting for a turn."""
+
+    def __init__(self, endpoint, limit, queue_size=ADMISSION_QUEUE_SIZE, timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.endpoint = endpoint
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = {'queue_full': 0, 'timeout': 0}
+        self._cond = threading.Condition()
+
+    def _publish(self):
+        set_gauge('parcel_admission_in_flight', self.active, endpoint=self.endpoint)
+        set_gauge('parcel_admission_queued', self.waiting, endpoint=self.endpoint)
+
+    def _reject(self, reason):
+        self.rejected[reason] += 1
+        inc('parcel_admission_rejected_total', endpoint=self.endpoint, reason=reason)
+        return False
+
+    def acquire(self):
+        """Take a slot, waiting up to `timeout` in the queue. False if rejected."""
+        with self._cond:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                self._publish()
+                return True
+            if self.waiting >= self.queue_size:
+                return self._reject('queue_full')
+            self.waiting += 1
+            self._publish()
+            admitted = self._cond.wait_for(lambda: self.active < self.limit, self.timeout)
+            self.waiting -= 1
+            if admitted:
+                self.active += 1
+            self._publish()
+            return admitted or self._reject('timeout')
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._publish()
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {'limit': self.limit, 'in_flight': self.active, 'queued': self.waiting,
+                    'queue_size': self.queue_size, 'rejected': dict(self.rejected)}
+
+
+def parse_limits(text):
+    limits = {}
+    for part in text.split(','):
+        endpoint, _, limit = part.strip().partition('=')
+        if endpoint and limit:
+            limits[endpoint] = int(limit)
+    return limits
+
+
+gates = {endpoint: Gate(endpoint, limit) for endpoint, limit in parse_limits(ADMISSION_LIMITS).items() if limit > 0}
+
+
+def _before_request():
+    gate = gates.get(request.endpoint)
+    if gate is None:
+        return None
+    if not gate.acquire():
+        response = jsonify({'error': 'Server busy, please retry shortly'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(ADMISSION_RETRY_AFTER)
+        return response
+    g.admission_gate = gate
+    return None
+
+
+def _teardown_request(exc):
+    gate = g.pop('admission_gate', None)
+    if gate is not None:
+        gate.release()
+
+
+def init_admission(app):
+    """Limit concurrent requests to the endpoints in ADMISSION_LIMITS; overload gets a fast
+    503 with Retry-After instead of tying up every worker thread."""
+    for gate in gates.values():
+        gate._publish()
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
+
+
+def stats():
+    """Limits, in-flight and queued requests and rejection counts per controlled endpoint."""
+    return {endpoint: gate.stats() for endpoint, gate in gates.items()}
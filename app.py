@@ -1,33 +1,91 @@
 import os
+import io
+import csv
 import json
-from flask import Flask, request, jsonify, render_template, send_from_directory
+import threading
+from flask import Flask, Response, request, jsonify, send_from_directory, send_file
 from flask_cors import CORS
 from flask_compress import Compress
 
-from models import init_db, get_session, User, Parcel, FaceSample, TrackingVariation
+from models import init_db, get_session, User, Parcel, FaceSample, ArchivedParcel
+from sqlalchemy import func, case
 import uuid
-from face_recog import get_embedding_from_base64, find_best_match, save_base64_image, get_embedding_from_file
-from notifications import send_sms
+from notifications import send_sms, start_dispatcher
 from datetime import datetime
-from forecast import forecast_next_days
-import cv2
-import numpy as np
+from forecast import get_forecast, forecast_capacity, start_refit_scheduler
+from tracking import canonicalize_tracking_code
+from storage import allocator, commit_with_slot, commit_batch_with_slots, StorageFullError
+from counters import ensure_counters, read_summary
+from archive import archived_parcels_for_owner
+from arrivals import start_digest_scheduler
+from assets import init_assets, asset_url, asset_response, page_response
+from versions import init_versions, conditional, owner_scope, user_id_for_face_uuid
+from events import start_event_hub, claim_stream, release_stream, stream as event_stream
+from metrics import init_metrics, stage, render as render_metrics
+from querylog import init_querylog
+from profiling import init_profiling, is_admin, list_profiles, profile_path
+from admission import init_admission, ADMISSION_RETRY_AFTER
 import random
 import re
 
 app = Flask(__name__)
 CORS(app)
 Compress(app)  # Enable gzip compression for responses
+init_metrics(app)  # Per-endpoint latency histograms for /metrics (and Server-Timing if enabled)
+init_querylog(app)  # Query counts per request, slow-query log and N+1 warnings
+init_profiling(app)  # cProfile single requests on demand (X-Profile: 1 + X-Admin-Token)
+init_admission(app)  # Concurrency limits and 503 + Retry-After for /register, /recognize, /parcel/collect
+# Pages and /assets/ files are precompressed by assets.py; Flask-Compress skips responses
+# that already carry a Content-Encoding
+app.add_template_global(asset_url)
 
 UPLOADS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 
+# Largest number of parcels accepted by /parcel/add_batch in one request
+MAX_BATCH_SIZE = 5000
+
 # Initialize DB (creates file if not present)
 init_db()
+# Build the in-memory free-slot list from storage_locations and stored parcels
+allocator.load()
+# Backfill parcel_counters for databases that predate it (kept current by counters.py afterwards)
+ensure_counters()
+# Per-database epoch for the data_versions ETags (versions.py)
+init_versions()
+# Hash and precompress static/css and static/js into static/dist (see scripts/build_assets.py)
+init_assets()
+# Refit cached Prophet forecasts in the background as new days of data arrive
+start_refit_scheduler()
+# Send queued SMS from sms_outbox, and batch arrival notices into one digest per owner
+start_dispatcher()
+start_digest_scheduler()
+# Poll parcel_events once per process and fan new events out to /events streams
+start_event_hub()
+
+
+def warm_up():
+    """Load the libraries that routes import on first use (OpenCV, NumPy, the face model
+    and the forecasting models), so the first /recognize or /forecast does not pay for it.
+    Also maps the embedding index, building the first snapshot if there is none."""
+    import face_recog
+    import forecast_models
+    import embedding_index
+    face_recog.load_model()
+    if embedding_index.EMBEDDING_INDEX:
+        embedding_index.index().refresh()
+
+
+# APP_WARMUP=1 warms up in a background thread; the worker starts serving immediately
+if os.environ.get('APP_WARMUP', '0') == '1':
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
 
 
 def augment_and_save(src_path, user_id, face_uuid, sample_num):
     """Create an augmented version of the image and save as FaceSample"""
+    import cv2
+    import numpy as np
+    from face_recog import embed_file
     img = cv2.imread(src_path)
     if img is None:
         return None
@@ -50,18 +108,19 @@ def augment_and_save(src_path, user_id, face_uuid, sample_num):
     
     # Get embedding
     try:
-        emb_arr = get_embedding_from_file(out_path)
+        emb_arr, emb_model = embed_file(out_path)
         emb_json = json.dumps(list(map(float, emb_arr.tolist())))
     except Exception as e:
         print(f'Warning: failed to get embedding for synthetic: {e}')
-        emb_json = None
+        emb_json = emb_model = None
     
     return FaceSample(
         user_id=user_id,
         face_uuid=face_uuid,
         sample_uuid=sample_uuid,
         image_path=out_path,
-        embedding_json=emb_json
+        embedding_json=emb_json,
+        embedding_model=emb_model
     )
 
 
@@ -81,54 +140,86 @@ def generate_synthetic_samples(user_id, photo_path, face_uuid, num_samples=5):
     return created
 
 
-def generate_tracking_variations(tracking_code, num_variations=5):
-    """Generate synthetic variations of a tracking code"""
-    if not tracking_code:
-        return []
-    
-    variations = [tracking_code]  # Include original
-    code_upper = tracking_code.upper()
-    
-    # Generate variations
-    for i in range(num_variations - 1):
-        variation = code_upper
-        # Add random prefix/suffix
-        if random.random() < 0.5:
-            variation = random.choice(['TRK', 'PKG', 'SHP']) + '-' + variation
-        if random.random() < 0.5:
-            variation = variation + '-' + str(random.randint(100, 999))
-        # Random case changes for letters
-        if random.random() < 0.3:
-            variation = ''.join([c.lower() if random.random() < 0.3 else c for c in variation])
-        # Add separators
-        if random.random() < 0.4 and '-' not in variation:
-            mid = len(variation) // 2
-            variation = variation[:mid] + '-' + variation[mid:]
-        
-        if variation not in variations:
-            variations.append(variation)
-    
-    return variations
+def _request_embedding(image_b64):
+    """(embedding, model tag) of the request's image. Under asgi.py it was already computed
+    on the CPU executor before the request reached Flask; otherwise it is computed here."""
+    precomputed = request.environ.get('face.embedding')
+    if isinstance(precomputed, Exception):
+        raise precomputed
+    if precomputed is not None:
+        return precomputed
+    from face_recog import embed_base64
+    return embed_base64(image_b64)
+
+
+def _request_photo(image_b64, prefix):
+    """Save the request's image under uploads/ and return the path. Under asgi.py it was
+    already decoded and denoised on the CPU executor; otherwise that happens here."""
+    from face_recog import save_base64_image, save_image_bytes
+    photo = request.environ.get('face.photo')
+    if photo is not None:
+        return save_image_bytes(photo, prefix)
+    return save_base64_image(image_b64, prefix=prefix)
+
+
+def _load_candidates(session, model):
+    """Return (user id, name, embedding) for every user's main embedding and all of their
+    face samples produced by `model`, the candidates for find_best_match."""
+    users = session.query(User.id, User.name, User.embedding_json, User.embedding_model).all()
+    samples_by_user = {}
+    for user_id, embedding_json in (session.query(FaceSample.user_id, FaceSample.embedding_json)
+                                     .filter(FaceSample.embedding_model == model).order_by(FaceSample.id)):
+        samples_by_user.setdefault(user_id, []).append(embedding_json)
+    candidates = []
+
+    # Check against both main user embedding AND all face samples
+    for user_id, name, embedding_json, embedding_model in users:
+        main = [embedding_json] if embedding_model == model else []
+        for raw in main + samples_by_user.get(user_id, []):
+            try:
+                candidates.append((user_id, name, json.loads(raw)))
+            except Exception:
+                continue
+    return candidates
+
+
+def _match_face(session, emb, model, threshold):
+    """Best match for `emb` among the stored embeddings of the same `model`, from the
+    memory-mapped embedding index (embedding_index.py), or by loading every candidate
+    when EMBEDDING_INDEX=0."""
+    import embedding_index
+    if embedding_index.EMBEDDING_INDEX:
+        return embedding_index.best_match(emb, model, threshold=threshold)
+    from face_recog import find_best_match
+    with stage('load_candidates'):
+        candidates = _load_candidates(session, model)
+    return find_best_match(emb, candidates, threshold=threshold)
 
 
 @app.route('/')
 def index():
-    return render_template('home.html')
+    return page_response('home.html')
 
 
 @app.route('/admin')
 def admin():
-    return render_template('index.html')
+    return page_response('index.html')
 
 
 @app.route('/student')
 def student():
-    return render_template('student.html')
+    return page_response('student.html')
 
 
 @app.route('/staff')
 def staff():
-    return render_template('staff.html')
+    return page_response('staff.html')
+
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    """Hashed, precompressed static files built by assets.build_assets()."""
+    return asset_response(filename)
 
 
 @app.route('/favicon.ico')
@@ -148,24 +239,25 @@ def register():
         return jsonify({'error': 'Missing name or image'}), 400
 
     # Save original image
-    photo_path = save_base64_image(image_b64, prefix='user')
+    photo_path = _request_photo(image_b64, 'user')
 
     # Compute embedding
     try:
-        emb = get_embedding_from_base64(image_b64)
+        emb, emb_model = _request_embedding(image_b64)
     except Exception as e:
         return jsonify({'error': f'Failed to get embedding: {str(e)}'}), 500
 
     session = get_session()
     # create or assign a stable face_uuid for this registered user (6 chars)
     user_face_uuid = uuid.uuid4().hex[:6].upper()
-    user = User(name=name, phone=phone or '', face_uuid=user_face_uuid, embedding_json=json.dumps(list(map(float, emb.tolist()))), photo_path=photo_path)
+    user = User(name=name, phone=phone or '', face_uuid=user_face_uuid, embedding_json=json.dumps(list(map(float, emb.tolist()))), embedding_model=emb_model, photo_path=photo_path)
     session.add(user)
     session.commit()
     
     # Generate synthetic samples automatically
     try:
-        num_created = generate_synthetic_samples(user.id, photo_path, user_face_uuid, num_samples=5)
+        with stage('synthetic_samples'):
+            num_created = generate_synthetic_samples(user.id, photo_path, user_face_uuid, num_samples=5)
         print(f'Generated {num_created} synthetic samples for user {user.id}')
     except Exception as e:
         print(f'Warning: Failed to generate synthetic samples: {e}')
@@ -181,36 +273,15 @@ def recognize():
         return jsonify({'error': 'Missing image'}), 400
 
     try:
-        emb = get_embedding_from_base64(image_b64)
+        emb, emb_model = _request_embedding(image_b64)
     except Exception as e:
         return jsonify({'error': f'Failed to get embedding: {str(e)}'}), 500
 
     session = get_session()
-    users = session.query(User).all()
-    candidates = []
-    
-    # Check against both main user embedding AND all face samples
-    for u in users:
-        # Add main user embedding
-        try:
-            ue = json.loads(u.embedding_json)
-            candidates.append((u.id, u.name, ue))
-        except Exception:
-            pass
-        
-        # Add all face sample embeddings for this user
-        samples = session.query(FaceSample).filter_by(user_id=u.id).all()
-        for sample in samples:
-            try:
-                se = json.loads(sample.embedding_json)
-                candidates.append((u.id, u.name, se))
-            except Exception:
-                continue
-
     # threshold: tune this value for your model. Higher -> stricter matching.
     # Lowered to 0.35 to handle different cameras better
     threshold = float(request.args.get('threshold', 0.35))
-    match = find_best_match(emb, candidates, threshold=threshold)
+    match = _match_face(session, emb, emb_model, threshold)
     if match:
         # include face_uuid for matched user
         session = get_session()
@@ -233,7 +304,8 @@ def recognize():
 def parcel_add():
     """Add a parcel and assign a storage slot. Accepts JSON: tracking_code (optional), owner_id (optional), note.
     If owner_id not provided, parcel will be created without owner and can be assigned later.
-    Automatically generates synthetic tracking code variations and assigns storage location.
+    Stores the canonical tracking key used by /search and takes a free storage location/slot
+    from the allocator. Returns 409 if storage is full.
     """
     data = request.get_json(force=True)
     tracking = data.get('tracking_code')
@@ -241,57 +313,121 @@ def parcel_add():
     note = data.get('note')
 
     session = get_session()
-    # Simple slot assignment: next numeric slot
-    last = session.query(Parcel).order_by(Parcel.id.desc()).first()
-    next_slot = None
-    if last and last.slot:
-        try:
-            # simple numeric increment if slot is numeric
-            next_slot = str(int(last.slot) + 1)
-        except Exception:
-            next_slot = f"S{(last.id or 0) + 1}"
-    else:
-        next_slot = '1'
-    
-    # Generate storage location
-    storage_locations = ["Shelf A-{}".format(i) for i in range(1, 6)] + \
-                       ["Shelf B-{}".format(i) for i in range(1, 6)] + \
-                       ["Locker {}".format(i) for i in range(10, 20)] + \
-                       ["Bay C-{}".format(i) for i in range(1, 4)]
-    storage_location = random.choice(storage_locations)
-    
     # Random estimated delivery days (1-10 days)
     estimated_days = random.randint(1, 10)
 
     p = Parcel(
         tracking_code=tracking, 
+        tracking_key=canonicalize_tracking_code(tracking),
         owner_id=owner_id, 
-        slot=next_slot, 
-        storage_location=storage_location,
         estimated_delivery_days=estimated_days,
         note=note
     )
-    session.add(p)
-    session.commit()
-    
-    # Generate synthetic tracking code variations
-    if tracking:
-        variations = generate_tracking_variations(tracking, num_variations=5)
-        for var_code in variations:
-            tv = TrackingVariation(parcel_id=p.id, original_code=tracking, variation_code=var_code)
-            session.add(tv)
-        session.commit()
-        print(f'Generated {len(variations)} tracking variations for parcel {p.id}')
+    # Takes the next free slot from the allocator and commits
+    try:
+        with stage('allocate_commit'):
+            assignment = commit_with_slot(session, p)
+    except StorageFullError as e:
+        return jsonify({'error': str(e)}), 409
     
     return jsonify({
         'status': 'ok', 
         'parcel_id': p.id, 
         'slot': p.slot,
-        'storage_location': storage_location,
+        'storage_location': assignment.storage_location,
         'estimated_delivery_days': estimated_days
     })
 
 
+def _read_batch_rows():
+    """Return the rows of a /parcel/add_batch request as a list of dicts.
+    Accepts a JSON array, a JSON object with a 'parcels' array, or CSV as an uploaded
+    'file' field or as a text/csv request body (header row: tracking_code,owner_id,note)."""
+    if 'file' in request.files:
+        text = request.files['file'].read().decode('utf-8-sig')
+        return list(csv.DictReader(io.StringIO(text)))
+    if request.mimetype in ('text/csv', 'application/csv'):
+        text = request.get_data(as_text=True)
+        return list(csv.DictReader(io.StringIO(text)))
+    data = request.get_json(force=True)
+    if isinstance(data, dict):
+        data = data.get('parcels')
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array of parcels or a CSV upload')
+    return data
+
+
+@app.route('/parcel/add_batch', methods=['POST'])
+def parcel_add_batch():
+    """Add many parcels at once, e.g. a courier drop-off.
+    Each row takes the same fields as /parcel/add (tracking_code, owner_id, note). Slots for the
+    whole batch are allocated together and all parcels are inserted in one transaction.
+    Rows that fail validation are reported and skipped; results are returned in input order.
+    Returns 409 (and inserts nothing) if storage cannot hold every valid row.
+    """
+    try:
+        rows = _read_batch_rows()
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify({'error': str(e)}), 400
+    if not rows:
+        return jsonify({'error': 'No parcels in batch'}), 400
+    if len(rows) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Batch too large (max {MAX_BATCH_SIZE} parcels)'}), 413
+
+    results = []
+    parcels = []
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            results.append({'row': i, 'status': 'error', 'error': 'Row must be an object'})
+            continue
+        # Numbers are accepted as codes, as /parcel/add does
+        tracking = str(row.get('tracking_code') or '').strip() or None
+        owner_id = row.get('owner_id')
+        if owner_id in ('', None):
+            owner_id = None
+        else:
+            try:
+                owner_id = int(owner_id)
+            except (TypeError, ValueError):
+                results.append({'row': i, 'status': 'error', 'error': 'owner_id must be an integer'})
+                continue
+        p = Parcel(
+            tracking_code=tracking,
+            tracking_key=canonicalize_tracking_code(tracking),
+            owner_id=owner_id,
+            estimated_delivery_days=random.randint(1, 10),
+            note=str(row.get('note') or '') or None
+        )
+        parcels.append(p)
+        results.append({'row': i, 'status': 'ok', 'parcel': p})
+
+    session = get_session()
+    # Keep ids and slots loaded after commit instead of refreshing every parcel for the response
+    session.expire_on_commit = False
+    try:
+        if parcels:
+            with stage('allocate_commit'):
+                commit_batch_with_slots(session, parcels)
+    except StorageFullError as e:
+        return jsonify({'error': str(e)}), 409
+
+    for r in results:
+        p = r.pop('parcel', None)
+        if p is not None:
+            r.update({
+                'parcel_id': p.id,
+                'slot': p.slot,
+                'storage_location': p.storage_location,
+                'estimated_delivery_days': p.estimated_delivery_days
+            })
+    return jsonify({
+        'status': 'ok',
+        'created': len(parcels),
+        'failed': len(results) - len(parcels),
+        'results': results
+    })
+
+
 @app.route('/parcel/collect', methods=['POST'])
 def parcel_collect():
     """Collect a parcel by recognizing a face. Request body: { image: base64, parcel_id: optional }
@@ -305,34 +441,13 @@ def parcel_collect():
         return jsonify({'error': 'Missing image'}), 400
 
     try:
-        emb = get_embedding_from_base64(img)
+        emb, emb_model = _request_embedding(img)
     except Exception as e:
         return jsonify({'error': f'Failed to get embedding: {str(e)}'}), 500
 
     session = get_session()
-    users = session.query(User).all()
-    candidates = []
-    
-    # Check against both main user embedding AND all face samples
-    for u in users:
-        # Add main user embedding
-        try:
-            ue = json.loads(u.embedding_json)
-            candidates.append((u.id, u.name, ue))
-        except Exception:
-            pass
-        
-        # Add all face sample embeddings for this user
-        samples = session.query(FaceSample).filter_by(user_id=u.id).all()
-        for sample in samples:
-            try:
-                se = json.loads(sample.embedding_json)
-                candidates.append((u.id, u.name, se))
-            except Exception:
-                continue
-
     # Lowered threshold to 0.35 for better camera compatibility
-    match = find_best_match(emb, candidates, threshold=float(request.args.get('threshold', 0.35)))
+    match = _match_face(session, emb, emb_model, float(request.args.get('threshold', 0.35)))
     if not match:
         return jsonify({'status': 'not_found'}), 404
 
@@ -352,15 +467,16 @@ def parcel_collect():
         parcel.status = 'collected'
         parcel.collected_time = datetime.utcnow()
         # save a checkout photo
-        photo_path = save_base64_image(img, prefix='checkout')
+        photo_path = _request_photo(img, 'checkout')
         session.add(parcel)
         session.commit()
+        allocator.release(parcel.storage_location, parcel.slot)
 
         # Send SMS to owner if phone exists
         owner = session.query(User).filter(User.id == user_id).first()
         if owner and owner.phone:
             body = f'Your parcel (id={parcel.id}, slot={parcel.slot}) was collected.'
-            send_sms(owner.phone, body)
+            send_sms(owner.phone, body, idempotency_key=f'parcel-collected-{parcel.id}')
 
         return jsonify({'status': 'collected', 'parcel_id': parcel.id, 'slot': parcel.slot, 'user': match})
 
@@ -378,34 +494,160 @@ def notify_test():
     if not phone or not body:
         return jsonify({'error': 'Missing phone or body'}), 400
     ok = send_sms(phone, body)
-    return jsonify({'status': 'ok' if ok else 'skipped'})
+    return jsonify({'status': 'queued' if ok else 'skipped'})
 
 
 @app.route('/forecast', methods=['GET'])
 def forecast():
-    days = int(request.args.get('days', 7))
+    """Forecast parcel arrivals for the next `days` days (default 7).
+    Optional `model`: auto, prophet, moving_average, seasonal_naive, holt_winters or weekday_ratio.
+    Returns predictions with the model used, when they were generated and how long
+    import/fit took; `stale` means a background refit for newer data is in progress."""
+    days = max(1, min(int(request.args.get('days', 7)), 90))
     session = get_session()
-    preds = forecast_next_days(session, days=days)
-    return jsonify({'status': 'ok', 'predictions': preds})
+    try:
+        result = get_forecast(session, days=days, model=request.args.get('model'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    finally:
+        session.close()
+    return jsonify(dict(result, status='ok'))
+
+
+@app.route('/forecast/capacity', methods=['GET'])
+def forecast_capacity_view():
+    """Projected occupancy of every storage location for the next `days` days (default 7),
+    with the first day each one is expected to exceed its capacity."""
+    days = max(1, min(int(request.args.get('days', 7)), 60))
+    session = get_session()
+    try:
+        locations = forecast_capacity(session, days=days)
+    finally:
+        session.close()
+    return jsonify({
+        'status': 'ok',
+        'days': days,
+        'locations': locations,
+        'overflowing': [l['storage_location'] for l in locations if l['overflow_date']]
+    })
+
+
+def event_stream_args(last_event_id, owner_id, face_uuid):
+    """(last_event_id, owner_id) for an /events stream from the raw request values. Raises
+    ValueError for non-integers and LookupError for an unknown face_uuid. Shared with asgi.py."""
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+        owner_id = int(owner_id) if owner_id else None
+    except ValueError:
+        raise ValueError('last_event_id and owner_id must be integers')
+    if face_uuid:
+        owner_id = user_id_for_face_uuid(face_uuid)
+        if owner_id is None:
+            raise LookupError('Face UUID not found')
+    return last_event_id, owner_id
+
+
+@app.route('/events', methods=['GET'])
+def events():
+    """Server-Sent Events stream of parcel-added, parcel-collected and user-registered.
+    Optional ?owner_id= or ?face_uuid= limits it to one user's events. A reconnecting client
+    sends Last-Event-ID (or ?last_event_id=) and first receives the events it missed.
+    Each open stream holds a worker thread, so past EVENTS_MAX_STREAMS per process new ones
+    get 503 with Retry-After (asgi.py serves /events without threads and has no such limit)."""
+    try:
+        last_event_id, owner_id = event_stream_args(
+            request.headers.get('Last-Event-ID') or request.args.get('last_event_id'),
+            request.args.get('owner_id'), request.args.get('face_uuid'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    if not claim_stream():
+        response = jsonify({'error': 'Too many open event streams, please retry shortly'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(ADMISSION_RETRY_AFTER)
+        return response
+    response = Response(event_stream(last_event_id, owner_id), mimetype='text/event-stream')
+    response.call_on_close(release_stream)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # no proxy buffering
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Request and stage latency histograms and face match counters, in Prometheus text format."""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/admin/profiles', methods=['GET'])
+def admin_profiles():
+    """Recent request profiles saved by profiling.py, newest first."""
+    if not is_admin(request.headers):
+        return jsonify({'error': 'forbidden'}), 403
+    return jsonify({'profiles': list_profiles()})
+
+
+@app.route('/admin/profiles/<name>', methods=['GET'])
+def admin_profile_download(name):
+    """Download one .prof file (open with snakeviz, or pstats)."""
+    if not is_admin(request.headers):
+        return jsonify({'error': 'forbidden'}), 403
+    path = profile_path(name)
+    if path is None:
+        return jsonify({'error': 'profile not found'}), 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=name)
 
 
 @app.route('/status', methods=['GET'])
+@conditional(lambda: ['parcels', 'users'])
 def status():
-    """Return a small health/status object with counts."""
+    """Return a small health/status object with counts (read from parcel_counters)."""
+    session = get_session()
+    try:
+        summary = read_summary(session, days=1)
+    finally:
+        session.close()
+    return jsonify({
+        'status': 'ok',
+        'users': summary['users'],
+        'parcels': summary['parcels'],
+    })
+
+
+@app.route('/dashboard/summary', methods=['GET'])
+def dashboard_summary():
+    """Totals for the staff dashboard: parcels by status, stored parcels per storage location
+    (with capacity), and arrivals per day for the last `days` days (default 30).
+    Served from parcel_counters, so the cost does not grow with the number of parcels."""
+    days = max(1, min(int(request.args.get('days', 30)), 366))
     session = get_session()
-    user_count = session.query(User).count()
     try:
-        parcel_count = session.query(Parcel).count()
-    except Exception:
-        parcel_count = 0
+        summary = read_summary(session, days=days)
+    finally:
+        session.close()
+    capacities = allocator.capacities()
+    locations = {}
+    for name in sorted(set(capacities) | set(summary['by_location'])):
+        locations[name] = {'stored': summary['by_location'].get(name, 0), 'capacity': capacities.get(name)}
     return jsonify({
         'status': 'ok',
-        'users': user_count,
-        'parcels': parcel_count,
+        'users': summary['users'],
+        'parcels': summary['parcels'],
+        'by_status': summary['by_status'],
+        'by_location': locations,
+        'by_arrival_date': summary['by_arrival_date'],
+        'free_slots': allocator.free_count(),
     })
 
 
+def _track_scopes(face_uuid):
+    user_id = user_id_for_face_uuid(face_uuid)
+    return [owner_scope(user_id)] if user_id is not None else None
+
+
 @app.route('/track/<face_uuid>', methods=['GET'])
+@conditional(_track_scopes, daily=True)
 def track_orders(face_uuid):
     """Track parcels by face_uuid. Returns user info and all their parcels with delivery estimates."""
     session = get_session()
@@ -454,21 +696,61 @@ def track_orders(face_uuid):
             'phone': user.phone
         },
         'parcels': parcel_list,
-        'total_parcels': len(parcel_list)
+        'total_parcels': len(parcel_list),
+        # Archived (long-collected) parcels are not included; fetch them page by page here
+        'history_url': f'/track/{face_uuid}/history'
+    })
+
+
+def _archived_parcel_dict(p):
+    return {
+        'id': p.id,
+        'tracking_code': p.tracking_code,
+        'owner_id': p.owner_id,
+        'status': p.status,
+        'slot': p.slot,
+        'storage_location': p.storage_location,
+        'arrival_time': p.arrival_time.isoformat() if p.arrival_time else None,
+        'collected_time': p.collected_time.isoformat() if p.collected_time else None,
+        'note': p.note,
+        'archived': True
+    }
+
+
+@app.route('/track/<face_uuid>/history', methods=['GET'])
+def track_history(face_uuid):
+    """Archived parcels for a face_uuid, newest first. Query params: page (default 1), per_page (default 20, max 100)"""
+    page = max(1, int(request.args.get('page', 1)))
+    per_page = max(1, min(int(request.args.get('per_page', 20)), 100))
+    session = get_session()
+    user = session.query(User).filter(User.face_uuid == face_uuid).first()
+    if not user:
+        return jsonify({'error': 'Face UUID not found'}), 404
+
+    parcels, has_more = archived_parcels_for_owner(session, user.id, page=page, per_page=per_page)
+    return jsonify({
+        'status': 'ok',
+        'face_uuid': face_uuid,
+        'parcels': [_archived_parcel_dict(p) for p in parcels],
+        'page': page,
+        'per_page': per_page,
+        'has_more': has_more
     })
 
 
 @app.route('/search', methods=['POST'])
 def search_parcel():
     """Search for parcel by tracking code and face_uuid.
-    Matches against both original and synthetic tracking code variations.
-    Body: { tracking_code: string, face_uuid: string }
+    The tracking code is canonicalized the same way as on intake, so case, spacing and
+    separators do not matter and the lookup is a single indexed equality probe.
+    Body: { tracking_code: string, face_uuid: string, include_history: bool (optional) }
+    With include_history, archived parcels are searched when no live parcel matches.
     """
     data = request.get_json(force=True)
-    tracking_input = data.get('tracking_code', '').strip().upper()
+    tracking_key = canonicalize_tracking_code(data.get('tracking_code', ''))
     face_uuid = data.get('face_uuid', '').strip().upper()
     
-    if not tracking_input or not face_uuid:
+    if not tracking_key or not face_uuid:
         return jsonify({'error': 'Both tracking_code and face_uuid are required'}), 400
     
     session = get_session()
@@ -478,22 +760,14 @@ def search_parcel():
     if not user:
         return jsonify({'error': 'Invalid face UUID'}), 404
     
-    # Search for matching tracking variation
-    tracking_var = session.query(TrackingVariation).filter(
-        TrackingVariation.variation_code.ilike(f'%{tracking_input}%')
+    parcel = session.query(Parcel).filter(
+        Parcel.tracking_key == tracking_key,
+        Parcel.owner_id == user.id
     ).first()
-    
-    if not tracking_var:
-        # Try direct match on parcel tracking_code
-        parcel = session.query(Parcel).filter(
-            Parcel.tracking_code.ilike(f'%{tracking_input}%'),
-            Parcel.owner_id == user.id
-        ).first()
-    else:
-        # Get parcel from variation
-        parcel = session.query(Parcel).filter(
-            Parcel.id == tracking_var.parcel_id,
-            Parcel.owner_id == user.id
+    if not parcel and data.get('include_history'):
+        parcel = session.query(ArchivedParcel).filter(
+            ArchivedParcel.tracking_key == tracking_key,
+            ArchivedParcel.owner_id == user.id
         ).first()
     
     if not parcel:
@@ -516,15 +790,24 @@ def search_parcel():
             'slot': parcel.slot,
             'arrival_time': parcel.arrival_time.isoformat() if parcel.arrival_time else None,
             'collected_time': parcel.collected_time.isoformat() if parcel.collected_time else None,
-            'note': parcel.note
+            'note': parcel.note,
+            'archived': isinstance(parcel, ArchivedParcel)
         }
     })
 
 
+def _track_orders_scopes():
+    owner_id = request.args.get('owner_id')
+    return [owner_scope(owner_id)] if owner_id else ['parcels']
+
+
 @app.route('/track_orders', methods=['GET'])
+@conditional(_track_orders_scopes, daily=True)
 def track_orders_all():
-    """Get all parcels or filter by owner_id. Query params: owner_id (optional)"""
+    """Get all parcels or filter by owner_id. Query params: owner_id (optional),
+    include_archived (optional, 1 to append archived parcels)"""
     owner_id = request.args.get('owner_id')
+    include_archived = request.args.get('include_archived') in ('1', 'true', 'yes')
     session = get_session()
     
     if owner_id:
@@ -564,6 +847,12 @@ def track_orders_all():
             'note': p.note
         })
     
+    if include_archived:
+        archived = session.query(ArchivedParcel)
+        if owner_id:
+            archived = archived.filter(ArchivedParcel.owner_id == owner_id)
+        parcel_list.extend(_archived_parcel_dict(p) for p in archived.order_by(ArchivedParcel.id.desc()))
+    
     return jsonify({
         'status': 'ok',
         'parcels': parcel_list,
@@ -592,6 +881,7 @@ def mark_collected():
     parcel.status = 'collected'
     parcel.collected_time = datetime.utcnow()
     session.commit()
+    allocator.release(parcel.storage_location, parcel.slot)
     
     return jsonify({
         'status': 'ok',
@@ -603,14 +893,20 @@ def mark_collected():
 
 
 @app.route('/api/users')
+@conditional(lambda: ['parcels', 'users'])
 def api_users():
     session = get_session()
     try:
         users = session.query(User).all()
+        counts = {
+            owner_id: (total, stored or 0)
+            for owner_id, total, stored in session.query(
+                Parcel.owner_id, func.count(Parcel.id), func.sum(case((Parcel.status == 'stored', 1), else_=0))
+            ).group_by(Parcel.owner_id)
+        }
         result = []
         for u in users:
-            parcel_count = session.query(Parcel).filter_by(owner_id=u.id).count()
-            stored_count = session.query(Parcel).filter_by(owner_id=u.id, status='stored').count()
+            parcel_count, stored_count = counts.get(u.id, (0, 0))
             result.append({
                 'id': u.id,
                 'name': u.name,
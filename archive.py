@@ -0,0 +1,81 @@
+import os
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, delete, select, literal
+
+from models import get_session, Parcel, ArchivedParcel
+from versions import bump, owner_scope
+
+logger = logging.getLogger(__name__)
+
+# Collected parcels older than this many days are moved to parcels_archive
+ARCHIVE_AFTER_DAYS = int(os.environ.get('PARCEL_ARCHIVE_DAYS', 30))
+# Parcels moved per transaction
+ARCHIVE_BATCH_SIZE = int(os.environ.get('PARCEL_ARCHIVE_BATCH_SIZE', 500))
+
+class ArchiveConflictError(RuntimeError):
+    """Parcel ids about to be archived are already in parcels_archive."""
+
+
+_COLUMNS = ['id', 'tracking_code', 'tracking_key', 'owner_id', 'status', 'slot', 'storage_location',
+            'estimated_delivery_days', 'arrival_time', 'collected_time', 'note']
+
+
+def archive_collected(older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, max_batches=None):
+    """Move collected parcels older than `older_than_days` from parcels to parcels_archive.
+
+    Works in chunks of `batch_size`, each copied and deleted in its own transaction, so the
+    job can be stopped at any point and simply run again to continue. Rows are moved with
+    Core statements, which leaves parcel_counters untouched: the counters keep all-time
+    totals by status and arrival date. The data versions of parcels and of each affected
+    owner are bumped (see versions.py). Returns the number of parcels archived.
+
+    Raises ArchiveConflictError, leaving the batch in place, if a parcel id is already
+    archived: ids are only unique across both tables while parcels uses AUTOINCREMENT
+    (run scripts/migrate_parcel_ids.py on databases created before it did).
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    moved = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        session = get_session()
+        try:
+            ids = [row[0] for row in session.query(Parcel.id)
+                   .filter(Parcel.status == 'collected', Parcel.collected_time < cutoff)
+                   .order_by(Parcel.id)
+                   .limit(batch_size)]
+            if not ids:
+                break
+            taken = [row[0] for row in session.query(ArchivedParcel.id).filter(ArchivedParcel.id.in_(ids))]
+            if taken:
+                raise ArchiveConflictError(
+                    f'{len(taken)} parcel id(s) already archived (e.g. {taken[0]}); '
+                    'run scripts/migrate_parcel_ids.py')
+            source = select(*[getattr(Parcel, c) for c in _COLUMNS], literal(datetime.utcnow())).where(Parcel.id.in_(ids))
+            session.execute(
+                insert(ArchivedParcel)
+                .from_select(_COLUMNS + ['archived_time'], source)
+            )
+            owners = {row[0] for row in session.query(Parcel.owner_id).filter(Parcel.id.in_(ids)).distinct()}
+            session.execute(delete(Parcel).where(Parcel.id.in_(ids)))
+            # Core statements skip the flush listeners, so bump the ETag versions here
+            bump(session.connection(), {'parcels'} | {owner_scope(o) for o in owners if o is not None})
+            session.commit()
+        finally:
+            session.close()
+        moved += len(ids)
+        batches += 1
+        logger.info('Archived %d parcels (%d so far)', len(ids), moved)
+    return moved
+
+
+def archived_parcels_for_owner(session, owner_id, page=1, per_page=20):
+    """Return (parcels, has_more) for one page of an owner's archived parcels, newest first."""
+    rows = (session.query(ArchivedParcel)
+            .filter(ArchivedParcel.owner_id == owner_id)
+            .order_by(ArchivedParcel.collected_time.desc(), ArchivedParcel.id.desc())
+            .offset((page - 1) * per_page)
+            .limit(per_page + 1)
+            .all())
+    return rows[:per_page], len(rows) > per_page
@@ -0,0 +1,103 @@
+import os
+import time
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, insert, inspect
+from sqlalchemy.orm import Session
+
+from models import get_session, Parcel, PendingArrival, User
+from notifications import send_sms
+
+logger = logging.getLogger(__name__)
+
+# Arrivals for the same owner within this many seconds of the first one go out as one SMS
+ARRIVAL_DIGEST_WINDOW = int(os.environ.get('ARRIVAL_DIGEST_WINDOW', 300))
+# How often the digest thread looks for owners whose window has closed
+ARRIVAL_DIGEST_POLL = float(os.environ.get('ARRIVAL_DIGEST_POLL', 15))
+
+_scheduler = None
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_arrivals(session, flush_context):
+    # A parcel arrives for its owner when it is stored with an owner, either on insert or
+    # when an owner is set later. Recorded in the same transaction as the parcel itself.
+    rows = []
+    for obj in session.new:
+        if isinstance(obj, Parcel) and obj.owner_id and (obj.status or 'stored') == 'stored':
+            rows.append({'owner_id': obj.owner_id, 'parcel_id': obj.id})
+    for obj in session.dirty:
+        if isinstance(obj, Parcel) and obj.owner_id and obj.status == 'stored':
+            if inspect(obj).attrs.owner_id.history.has_changes():
+                rows.append({'owner_id': obj.owner_id, 'parcel_id': obj.id})
+    if rows:
+        session.connection().execute(insert(PendingArrival), rows)
+
+
+def digest_body(locations):
+    """'3 parcels waiting at Locker 12, Shelf A-3' for the storage locations of the waiting parcels."""
+    counts = Counter(loc or 'the mailroom' for loc in locations)
+    places = sorted(counts, key=lambda loc: (-counts[loc], loc))
+    n = len(locations)
+    return f"{n} parcel{'s' if n != 1 else ''} waiting at {', '.join(places)}"
+
+
+def flush_due_digests(window=ARRIVAL_DIGEST_WINDOW):
+    """Send one SMS per owner whose oldest pending arrival is at least `window` seconds old,
+    covering all of that owner's pending arrivals, and clear them. Parcels collected in the
+    meantime are left out. Returns the number of digests queued.
+
+    The SMS is queued before the events are deleted, under a key derived from the event ids,
+    so a crash or a second worker flushing the same owner does not send it twice."""
+    cutoff = datetime.utcnow() - timedelta(seconds=window)
+    session = get_session()
+    sent = 0
+    try:
+        owners = [row[0] for row in session.query(PendingArrival.owner_id)
+                  .group_by(PendingArrival.owner_id)
+                  .having(func.min(PendingArrival.created_at) <= cutoff)]
+        for owner_id in owners:
+            events = (session.query(PendingArrival.id, PendingArrival.parcel_id)
+                      .filter(PendingArrival.owner_id == owner_id)
+                      .order_by(PendingArrival.id)
+                      .all())
+            if not events:
+                continue
+            ids = [e.id for e in events]
+            locations = [row[0] for row in session.query(Parcel.storage_location)
+                         .filter(Parcel.id.in_({e.parcel_id for e in events}), Parcel.status == 'stored')]
+            owner = session.query(User).filter(User.id == owner_id).first()
+            if locations and owner and owner.phone:
+                send_sms(owner.phone, digest_body(locations),
+                         idempotency_key=f'arrival-digest-{owner_id}-{ids[0]}-{ids[-1]}')
+                sent += 1
+            session.query(PendingArrival).filter(PendingArrival.id.in_(ids)).delete(synchronize_session=False)
+            session.commit()
+    finally:
+        session.close()
+    return sent
+
+
+def _digest_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            sent = flush_due_digests()
+            if sent:
+                logger.info('Queued %d arrival digests', sent)
+        except Exception:
+            logger.exception('Arrival digest flush failed')
+
+
+def start_digest_scheduler(interval=ARRIVAL_DIGEST_POLL):
+    """Start a daemon thread that flushes due arrival digests every `interval` seconds.
+    Does nothing with interval 0 or if already running."""
+    global _scheduler
+    if interval <= 0 or _scheduler is not None:
+        return False
+    _scheduler = threading.Thread(target=_digest_loop, args=(interval,), name='arrival-digests', daemon=True)
+    _scheduler.start()
+    return True
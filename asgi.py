@@ -0,0 +1,282 @@
+"""
+ASGI entry point: uvicorn asgi:app --workers 1
+
+One event loop holds every open connection. The Flask app runs unchanged on a bounded
+pool of threads (ASGI_WSGI_THREADS), so DB reads never block the loop, and /events is
+served natively from the loop, so open streams don't hold a thread each. For /register,
+/recognize and /parcel/collect the image is decoded, denoised and embedded first on a
+separate, smaller pool (ASGI_CPU_WORKERS); once ASGI_CPU_QUEUE more are waiting, new ones
+get a fast 503 with Retry-After.
+"""
+import io
+import os
+import sys
+import json
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import events
+from app import app as flask_app, event_stream_args
+from admission import ADMISSION_RETRY_AFTER
+from metrics import inc
+
+logger = logging.getLogger(__name__)
+
+# Threads running Flask requests (DB reads and writes, matching, everything but the embedding)
+ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 16))
+# Embeddings computed at once. TensorFlow and OpenCV release the GIL, so threads are enough,
+# and they share the one loaded model
+ASGI_CPU_WORKERS = int(os.environ.get('ASGI_CPU_WORKERS', 2))
+# Embeddings allowed to wait for a CPU worker; more are rejected with 503
+ASGI_CPU_QUEUE = int(os.environ.get('ASGI_CPU_QUEUE', 8))
+
+# Paths whose embedding is computed on the CPU pool, with the endpoint names used in metrics
+EMBEDDING_PATHS = {'/register': 'register', '/recognize': 'recognize', '/parcel/collect': 'parcel_collect'}
+# Of those, the ones that also save the preprocessed image (user photo, checkout photo)
+PHOTO_PATHS = {'/register', '/parcel/collect'}
+
+_wsgi_pool = ThreadPoolExecutor(ASGI_WSGI_THREADS, thread_name_prefix='wsgi')
+_cpu_pool = ThreadPoolExecutor(ASGI_CPU_WORKERS, thread_name_prefix='embed')
+_cpu_pending = 0  # only touched from the event loop
+
+
+def _embed(body, keep_photo=False):
+    """WSGI environ entries for a JSON body with an "image": 'face.embedding' is its
+    (embedding, model tag) or the exception it raised, and with `keep_photo` 'face.photo' is
+    the decoded, denoised JPEG that the view saves, so it is not redone on a WSGI thread.
+    Empty when there is nothing to embed (Flask then answers the bad request itself)."""
+    from face_recog import embed_preprocessed, preprocess_base64_image
+    try:
+        image = json.loads(body).get('image')
+    except (ValueError, AttributeError):
+        return {}
+    if not image:
+        return {}
+    try:
+        photo = preprocess_base64_image(image)
+    except Exception as e:
+        return {'face.embedding': e}
+    try:
+        embedding = embed_preprocessed(photo)
+    except Exception as e:
+        embedding = e
+    return {'face.embedding': embedding, 'face.photo': photo} if keep_photo else {'face.embedding': embedding}
+
+
+def _environ(scope, body):
+    """PEP 3333 environ for an ASGI HTTP scope and its fully read body."""
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def _read_body(receive):
+    """The request body, or None if the client went away first."""
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _until_disconnect(receive, coro):
+    """Run `coro`, cancelling it if the client disconnects first. True if it finished."""
+    task = asyncio.ensure_future(coro)
+    watcher = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        task.cancel()  # no-op once it has finished
+    try:
+        await task
+    except asyncio.CancelledError:
+        return False
+    return True
+
+
+async def _send_json(send, status, payload, headers=()):
+    body = json.dumps(payload).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                            *headers]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _call_flask(scope, receive, send, body, extra_environ=None):
+    """Run the Flask app for this request on the WSGI pool and stream its response back."""
+    loop = asyncio.get_running_loop()
+    environ = _environ(scope, body)
+    environ.update(extra_environ or {})
+    queue = asyncio.Queue()
+    stopped = threading.Event()
+
+    def put(item):
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    def run():
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'], response['headers'] = status, headers
+            return lambda data: put(('body', data))
+
+        try:
+            result = flask_app(environ, start_response)
+            try:
+                put(('start', response['status'], response['headers']))
+                for chunk in result:
+                    if stopped.is_set():
+                        break
+                    if chunk:
+                        put(('body', chunk))
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+            put(('end',))
+        except BaseException as e:
+            put(('error', e))
+
+    async def relay():
+        started = False
+        while True:
+            item = await queue.get()
+            if item[0] == 'start':
+                status, headers = item[1], item[2]
+                await send({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+                started = True
+            elif item[0] == 'body':
+                await send({'type': 'http.response.body', 'body': bytes(item[1]), 'more_body': True})
+            elif item[0] == 'end':
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+            else:
+                logger.error('Unhandled error in %s %s', scope['method'], scope['path'], exc_info=item[1])
+                if not started:
+                    await _send_json(send, 500, {'error': 'Internal server error'})
+                return
+
+    done = loop.run_in_executor(_wsgi_pool, run)
+    try:
+        await _until_disconnect(receive, relay())
+    finally:
+        stopped.set()
+        await done
+
+
+async def _http(scope, receive, send):
+    global _cpu_pending
+    path = scope['path']
+    if path == '/events' and scope['method'] == 'GET':
+        return await _events(scope, receive, send)
+
+    body = await _read_body(receive)
+    if body is None:
+        return
+    extra = {}
+    endpoint = EMBEDDING_PATHS.get(path)
+    if endpoint and scope['method'] == 'POST':
+        if _cpu_pending >= ASGI_CPU_WORKERS + ASGI_CPU_QUEUE:
+            inc('parcel_admission_rejected_total', endpoint=endpoint, reason='cpu_queue_full')
+            return await _send_json(send, 503, {'error': 'Server busy, please retry shortly'},
+                                    [(b'retry-after', str(ADMISSION_RETRY_AFTER).encode())])
+        _cpu_pending += 1
+        try:
+            extra = await asyncio.get_running_loop().run_in_executor(_cpu_pool, _embed, body, path in PHOTO_PATHS)
+        finally:
+            _cpu_pending -= 1
+    await _call_flask(scope, receive, send, body, extra)
+
+
+async def _events(scope, receive, send):
+    """/events without a thread: same parameters and responses as the Flask route."""
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    headers = dict(scope['headers'])
+
+    def arg(name):
+        return query.get(name, [None])[0]
+
+    last_event_id = headers.get(b'last-event-id', b'').decode('latin-1') or arg('last_event_id')
+    try:
+        # face_uuid is looked up in the database
+        last_event_id, owner_id = await asyncio.get_running_loop().run_in_executor(
+            _wsgi_pool, event_stream_args, last_event_id, arg('owner_id'), arg('face_uuid'))
+    except ValueError as e:
+        return await _send_json(send, 400, {'error': str(e)})
+    except LookupError as e:
+        return await _send_json(send, 404, {'error': str(e)})
+
+    async def pump():
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'text/event-stream; charset=utf-8'),
+                                (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]})
+        async for chunk in events.astream(last_event_id, owner_id):
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    await _until_disconnect(receive, pump())
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            _cpu_pool.shutdown(wait=False)
+            _wsgi_pool.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'http':
+        await _http(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+    else:
+        raise RuntimeError(f"Unsupported ASGI scope type {scope['type']!r}")
@@ -0,0 +1,147 @@
+import os
+import json
+import gzip
+import hashlib
+import logging
+import mimetypes
+
+from flask import Response, abort, render_template, request, send_file, url_for
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+# Built, content-hashed copies of static/css and static/js, served from /assets/
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+SOURCE_DIRS = ('css', 'js')
+
+# Hashed asset URLs never change content, so browsers may keep them for a year
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+_manifest = {}
+# template name -> (template mtime, etag, {encoding: body})
+_pages = {}
+
+
+def _write(path, data):
+    # Write to a temp file and rename, so concurrent workers never serve a partial file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _compress(data):
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    return variants
+
+
+_SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+
+
+def build_assets(static_dir=STATIC_DIR):
+    """Copy static/css and static/js into static/dist under content-hashed names, next to
+    .gz and (with the brotli package) .br versions, and write manifest.json mapping each
+    source path to its hashed path. Files whose hash already exists are not rewritten.
+    Returns the manifest."""
+    dist_dir = os.path.join(static_dir, 'dist')
+    manifest = {}
+    for source_dir in SOURCE_DIRS:
+        for root, _, files in os.walk(os.path.join(static_dir, source_dir)):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, static_dir).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    data = f.read()
+                base, ext = os.path.splitext(rel)
+                hashed = f'{base}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+                out = os.path.join(dist_dir, hashed)
+                if not os.path.exists(out):
+                    _write(out, data)
+                for encoding, body in _compress(data).items():
+                    if not os.path.exists(out + _SUFFIXES[encoding]):
+                        _write(out + _SUFFIXES[encoding], body)
+                manifest[rel] = hashed
+    _write(os.path.join(dist_dir, 'manifest.json'), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def init_assets():
+    """Build (or, on a read-only install, just read) the asset manifest. Called at startup."""
+    global _manifest
+    try:
+        _manifest = build_assets()
+    except OSError as e:
+        logger.warning('Could not build static assets (%s); using existing manifest', e)
+        try:
+            with open(MANIFEST_PATH) as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            _manifest = {}
+    return _manifest
+
+
+def asset_url(path):
+    """URL of static file `path` (e.g. 'css/staff.css'): the hashed /assets/ copy when built,
+    else the plain /static/ file. Available in templates."""
+    hashed = _manifest.get(path)
+    if hashed:
+        return url_for('asset', filename=hashed)
+    return url_for('static', filename=path)
+
+
+def _choose_encoding(available):
+    for encoding in ('br', 'gzip'):
+        if encoding in available and request.accept_encodings[encoding] > 0:
+            return encoding
+    return 'identity'
+
+
+def asset_response(filename):
+    """Serve a built asset, precompressed if the client accepts it, with immutable caching."""
+    path = safe_join(DIST_DIR, filename)
+    if path is None or filename.endswith(('.gz', '.br', '.json')) or not os.path.isfile(path):
+        abort(404)
+    available = [e for e, suffix in _SUFFIXES.items() if os.path.isfile(path + suffix)]
+    encoding = _choose_encoding(available)
+    served = path + _SUFFIXES.get(encoding, '')
+    response = send_file(served, mimetype=mimetypes.guess_type(path)[0],
+                         etag=f'{os.path.basename(path)}.{encoding}', conditional=True)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def page_response(template_name):
+    """Render `template_name` once per process (again only if the file changes), keep it
+    precompressed, and answer with an ETag so repeat visits get 304 Not Modified. Pages use
+    Cache-Control: no-cache so browsers revalidate and pick up new asset hashes on deploy."""
+    mtime = os.stat(os.path.join(TEMPLATES_DIR, template_name)).st_mtime_ns
+    entry = _pages.get(template_name)
+    if entry is None or entry[0] != mtime:
+        html = render_template(template_name).encode('utf-8')
+        bodies = dict(_compress(html), identity=html)
+        entry = (mtime, hashlib.sha256(html).hexdigest()[:16], bodies)
+        _pages[template_name] = entry
+    _, digest, bodies = entry
+    encoding = _choose_encoding(bodies)
+    response = Response(bodies[encoding], mimetype='text/html')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.set_etag(f'{digest}-{encoding}')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response.make_conditional(request)
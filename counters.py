@@ -0,0 +1,173 @@
+import logging
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import get_session, Parcel, ArchivedParcel, ParcelCounter, DailyArrival, User
+
+logger = logging.getLogger(__name__)
+
+# parcel_counters holds one row per (dimension, key):
+#   status/<status>            parcels with that status
+#   location/<name>            parcels currently stored at that location
+#   users/total                registered users
+# and daily_arrivals one row per day with the number of parcels that arrived that day.
+# Rows are updated by the flush listener below, i.e. in the same transaction as the
+# write that changes them, so reads never need COUNT(*) over parcels or users.
+# Status and arrival totals include parcels moved to parcels_archive (archive.py).
+
+
+def _parcel_keys(status, storage_location, arrival_time):
+    keys = [('status', status or 'stored')]
+    if (status or 'stored') == 'stored' and storage_location:
+        keys.append(('location', storage_location))
+    if arrival_time:
+        keys.append(('arrival_date', arrival_time.date()))
+    return keys
+
+
+def _previous(state, attr):
+    hist = state.attrs[attr].history
+    if hist.deleted:
+        return hist.deleted[0]
+    return state.attrs[attr].value
+
+
+def _collect_deltas(session):
+    deltas = Counter()
+    for obj in session.new:
+        if isinstance(obj, Parcel):
+            for k in _parcel_keys(obj.status, obj.storage_location, obj.arrival_time or datetime.utcnow()):
+                deltas[k] += 1
+        elif isinstance(obj, User):
+            deltas[('users', 'total')] += 1
+    for obj in session.dirty:
+        if not isinstance(obj, Parcel):
+            continue
+        state = inspect(obj)
+        if not any(state.attrs[a].history.has_changes() for a in ('status', 'storage_location', 'arrival_time')):
+            continue
+        for k in _parcel_keys(_previous(state, 'status'), _previous(state, 'storage_location'),
+                              _previous(state, 'arrival_time')):
+            deltas[k] -= 1
+        for k in _parcel_keys(obj.status, obj.storage_location, obj.arrival_time):
+            deltas[k] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Parcel):
+            state = inspect(obj)
+            for k in _parcel_keys(_previous(state, 'status'), _previous(state, 'storage_location'),
+                                  _previous(state, 'arrival_time')):
+                deltas[k] -= 1
+        elif isinstance(obj, User):
+            deltas[('users', 'total')] -= 1
+    return {k: v for k, v in deltas.items() if v}
+
+
+def apply_deltas(connection, deltas):
+    """Add `deltas` ({(dimension, key): n}) to parcel_counters, and the ('arrival_date', date)
+    entries to daily_arrivals, with one upsert per table."""
+    counter_rows = [{'dimension': d, 'key': k, 'count': n} for (d, k), n in deltas.items() if d != 'arrival_date']
+    day_rows = [{'day': k, 'count': n} for (d, k), n in deltas.items() if d == 'arrival_date']
+    if counter_rows:
+        stmt = sqlite_insert(ParcelCounter)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['dimension', 'key'],
+            set_={'count': ParcelCounter.count + stmt.excluded['count']},
+        )
+        connection.execute(stmt, counter_rows)
+    if day_rows:
+        stmt = sqlite_insert(DailyArrival)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['day'],
+            set_={'count': DailyArrival.count + stmt.excluded['count']},
+        )
+        connection.execute(stmt, day_rows)
+
+
+def arrivals_per_day(session):
+    """Return [(date, count)] for all arrivals, live and archived, with one
+    GROUP BY date(arrival_time) per table."""
+    counts = Counter()
+    for model in (Parcel, ArchivedParcel):
+        day = func.date(model.arrival_time)
+        for d, n in session.query(day, func.count(model.id)).filter(model.arrival_time != None).group_by(day):
+            counts[date.fromisoformat(d)] += n
+    return sorted(counts.items())
+
+
+def rebuild_daily_arrivals(session):
+    """Recompute daily_arrivals from parcels and parcels_archive. Returns the number of days."""
+    session.query(DailyArrival).delete()
+    # Older databases kept per-day counts in parcel_counters
+    session.query(ParcelCounter).filter(ParcelCounter.dimension == 'arrival_date').delete()
+    items = arrivals_per_day(session)
+    apply_deltas(session.connection(), {('arrival_date', d): n for d, n in items})
+    session.commit()
+    return len(items)
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_counters(session, flush_context):
+    # Attribute history is still intact in after_flush, so status/location changes can be diffed
+    apply_deltas(session.connection(), _collect_deltas(session))
+
+
+def rebuild_counters(session):
+    """Recompute parcel_counters and daily_arrivals from parcels, parcels_archive and users.
+    Used for backfill and after bulk deletes that bypass the ORM."""
+    session.query(ParcelCounter).delete()
+    deltas = Counter()
+    for model in (Parcel, ArchivedParcel):
+        for status, n in session.query(model.status, func.count(model.id)).group_by(model.status):
+            deltas[('status', status or 'stored')] += n
+    stored_at = (session.query(Parcel.storage_location, func.count(Parcel.id))
+                 .filter(Parcel.status == 'stored', Parcel.storage_location != None)
+                 .group_by(Parcel.storage_location))
+    for location, n in stored_at:
+        deltas[('location', location)] += n
+    deltas[('users', 'total')] = session.query(User).count()
+    apply_deltas(session.connection(), {k: v for k, v in deltas.items() if v})
+    session.commit()
+    return len(deltas) + rebuild_daily_arrivals(session)
+
+
+def ensure_counters():
+    """Backfill parcel_counters and daily_arrivals once for databases created before the
+    tables existed."""
+    session = get_session()
+    try:
+        if session.query(Parcel.id).first() is None and session.query(User.id).first() is None:
+            return False
+        if session.query(ParcelCounter.dimension).first() is None:
+            rows = rebuild_counters(session)
+            logger.info('Backfilled %d parcel counters', rows)
+            return True
+        if session.query(DailyArrival.day).first() is None:
+            days = rebuild_daily_arrivals(session)
+            logger.info('Backfilled daily arrivals for %d days', days)
+            return True
+        return False
+    finally:
+        session.close()
+
+
+def read_summary(session, days=30):
+    """Return the dashboard summary from parcel_counters. Reads at most one row per status,
+    location and day in the window, independent of the number of parcels."""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    rows = session.query(ParcelCounter.dimension, ParcelCounter.key, ParcelCounter.count).all()
+    summary = {'users': 0, 'by_status': {}, 'by_location': {}, 'by_arrival_date': {}}
+    for dimension, key, count in rows:
+        if dimension == 'users':
+            summary['users'] = count
+        elif dimension == 'status':
+            summary['by_status'][key] = count
+        elif dimension == 'location':
+            summary['by_location'][key] = count
+    for day, count in session.query(DailyArrival.day, DailyArrival.count).filter(DailyArrival.day >= since):
+        summary['by_arrival_date'][day.isoformat()] = count
+    summary['parcels'] = sum(summary['by_status'].values())
+    return summary
@@ -0,0 +1,447 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import select, text
+from sqlalchemy.engine import make_url
+
+from metrics import inc, stage, current_endpoint
+from models import DATABASE_URL, get_engine, User, FaceSample
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent merges are not serialized, only duplicated
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_engine = None
+
+
+def _get_engine():
+    global _engine
+    if _engine is None:
+        _engine = get_engine()
+    return _engine
+
+
+def _default_dir():
+    url = make_url(DATABASE_URL)
+    if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:':
+        return os.path.join(os.path.dirname(os.path.abspath(url.database)), 'embedding_index')
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'embedding_index')
+
+
+# Match against the memory-mapped index instead of loading every embedding per request
+EMBEDDING_INDEX = os.environ.get('EMBEDDING_INDEX', '1') == '1'
+# Snapshot directory; defaults to embedding_index/ next to the SQLite database
+EMBEDDING_INDEX_DIR = os.environ.get('EMBEDDING_INDEX_DIR') or _default_dir()
+# How often each process checks for registrations not yet in the snapshot and merges them
+EMBEDDING_INDEX_MERGE_SECONDS = int(os.environ.get('EMBEDDING_INDEX_MERGE_SECONDS', 60))
+# Merge as soon as this many embeddings are waiting in the delta
+EMBEDDING_INDEX_MERGE_ROWS = int(os.environ.get('EMBEDDING_INDEX_MERGE_ROWS', 200))
+# Snapshots kept on disk, the current one included
+EMBEDDING_INDEX_KEEP = int(os.environ.get('EMBEDDING_INDEX_KEEP', 3))
+CHECK_SECONDS = 1.0
+
+# The index directory holds immutable snapshots and a CURRENT file naming the live one:
+#   CURRENT                 replaced atomically (os.replace) when a new snapshot is ready
+#   20261019T120000-3f2a1c/
+#     meta.json             data versions, watermarks, row counts and the groups present
+#     g<n>.matrix.npy       L2-normalized float32 rows, one per stored embedding of group n
+#     g<n>.ids.npy          users.id of each row
+#     g<n>.labels.npy       users.name of each row
+# The watermarks are the highest users.id and face_samples.id in the snapshot. Every
+# process memory-maps the live snapshot read-only, so the OS page cache holds one copy
+# for all workers, and keeps only the rows above the watermarks (the delta: registrations
+# since the snapshot was written) in memory. A background thread per process merges the
+# delta into a new snapshot under a file lock; the other processes notice the new CURRENT
+# within CHECK_SECONDS and switch. A group holds the embeddings of one model tag (see
+# face_recog.current_model) and size; a query is only compared with its own model's
+# group, and untagged rows are left out. Rows are only ever appended by the app; scripts
+# that edit embeddings in place (scripts/reembed.py does) rebuild the index. Deletes are
+# caught within CHECK_SECONDS, since SQLite hands the ids of deleted users to new ones:
+# meta.json also records the epoch and 'embeddings' data versions (see versions.py) and
+# how many rows lay at or below the watermarks, and a process rebuilds when any of them
+# no longer matches the database. The merge thread runs that check, off the request path.
+
+
+def _normalize(vec):
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else vec
+
+
+def read_rows(conn, after_user=0, after_sample=0):
+    """Embeddings stored after the watermarks, decoded and normalized and grouped by model
+    and size. Returns ({(model, dim): ([vector], [user id], [name])}, user watermark,
+    sample watermark, (users read, samples read)); the counts include unusable rows."""
+    groups = {}
+    users_read = samples_read = 0
+
+    def add(user_id, name, raw, model):
+        if model is None:
+            return
+        try:
+            vec = np.asarray(json.loads(raw), dtype=np.float32).ravel()
+        except Exception:
+            return
+        if vec.size:
+            vectors, ids, labels = groups.setdefault((model, vec.size), ([], [], []))
+            vectors.append(_normalize(vec))
+            ids.append(user_id)
+            labels.append(name)
+
+    for user_id, name, raw, model in conn.execute(
+            select(User.id, User.name, User.embedding_json, User.embedding_model)
+            .where(User.id > after_user).order_by(User.id)):
+        after_user = user_id
+        users_read += 1
+        add(user_id, name, raw, model)
+    for sample_id, user_id, name, raw, model in conn.execute(
+            select(FaceSample.id, FaceSample.user_id, User.name, FaceSample.embedding_json, FaceSample.embedding_model)
+            .outerjoin(User, User.id == FaceSample.user_id)
+            .where(FaceSample.id > after_sample).order_by(FaceSample.id)):
+        after_sample = sample_id
+        samples_read += 1
+        if name is not None:  # samples of a deleted user are counted but never matched
+            add(user_id, name, raw, model)
+    return groups, after_user, after_sample, (users_read, samples_read)
+
+
+def _versions(conn):
+    """(epoch, embeddings) data versions: a new database, or users or samples deleted."""
+    return tuple(conn.execute(text(
+        "SELECT COALESCE((SELECT version FROM data_versions WHERE scope = 'epoch'), 0),"
+        " COALESCE((SELECT version FROM data_versions WHERE scope = 'embeddings'), 0)")).one())
+
+
+def _unchanged(conn, versions, after, counts):
+    """Whether nothing was deleted since rows up to the watermarks `after` were read, when
+    the data versions were `versions` and the tables held `counts` rows up to them. The
+    count also catches deletes that bypass the ORM and data_versions. One query."""
+    state = conn.execute(text(
+        "SELECT COALESCE((SELECT version FROM data_versions WHERE scope = 'epoch'), 0),"
+        " COALESCE((SELECT version FROM data_versions WHERE scope = 'embeddings'), 0),"
+        " (SELECT COUNT(*) FROM users WHERE id <= :u), (SELECT COUNT(*) FROM face_samples WHERE id <= :s)"),
+        {'u': after[0], 's': after[1]}).one()
+    return tuple(state) == (*versions, *counts)
+
+
+def _best(matrix, ids, labels, query):
+    """(score, user id, name) of the row most similar to the normalized `query`, or None."""
+    if not len(ids):
+        return None
+    scores = matrix @ query
+    i = int(np.argmax(scores))
+    return float(scores[i]), int(ids[i]), str(labels[i])
+
+
+class Snapshot:
+    """One snapshot directory, memory-mapped read-only."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.groups = {}
+        for group in self.meta['groups']:
+            self.groups[(group['model'], group['dim'])] = tuple(
+                np.load(os.path.join(path, f"{group['file']}.{part}.npy"), mmap_mode='r')
+                for part in ('matrix', 'ids', 'labels'))
+
+    @property
+    def rows(self):
+        return sum(len(ids) for _, ids, _ in self.groups.values())
+
+    @property
+    def watermarks(self):
+        return self.meta['users_watermark'], self.meta['samples_watermark']
+
+    @property
+    def versions(self):
+        return self.meta['epoch'], self.meta.get('embeddings_version')
+
+    @property
+    def counts(self):
+        """Table rows at or below the watermarks when written; None for older snapshots."""
+        return self.meta.get('users_count'), self.meta.get('samples_count')
+
+    def search(self, query, model):
+        group = self.groups.get((model, query.size))
+        return _best(*group, query) if group else None
+
+
+@contextmanager
+def _exclusive(directory):
+    """Hold the index directory's lock file, so only one process writes a snapshot at a time."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, '.lock'), 'a') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def current_name(directory=EMBEDDING_INDEX_DIR):
+    try:
+        with open(os.path.join(directory, 'CURRENT')) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _epoch():
+    from versions import read_versions
+    return read_versions([])['epoch']
+
+
+def _write_snapshot(directory, parts, after_user, after_sample, counts, versions):
+    """Write `parts` ({(model, dim): [(vectors, ids, labels), ...]}) as a new snapshot, make
+    it current and prune old ones. Call with the directory lock held."""
+    name = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+    tmp = os.path.join(directory, f'.tmp-{name}')
+    os.makedirs(tmp)
+    groups = []
+    for n, ((model, dim), chunks) in enumerate(sorted(parts.items())):
+        file = f'g{n}'
+        total = sum(len(ids) for _, ids, _ in chunks)
+        matrix = np.lib.format.open_memmap(os.path.join(tmp, f'{file}.matrix.npy'), mode='w+',
+                                           dtype=np.float32, shape=(total, dim))
+        pos = 0
+        for vectors, _, _ in chunks:
+            for start in range(0, len(vectors), 4096):  # bounded copies out of old snapshots
+                block = np.asarray(vectors[start:start + 4096], dtype=np.float32)
+                matrix[pos:pos + len(block)] = block
+                pos += len(block)
+        matrix.flush()
+        del matrix
+        np.save(os.path.join(tmp, f'{file}.ids.npy'),
+                np.concatenate([np.asarray(ids, dtype=np.int64) for _, ids, _ in chunks]))
+        np.save(os.path.join(tmp, f'{file}.labels.npy'),
+                np.asarray([str(label) for _, _, labels in chunks for label in labels], dtype=str))
+        groups.append({'file': file, 'model': model, 'dim': dim, 'rows': total})
+    meta = {'name': name, 'created_at': datetime.utcnow().isoformat(),
+            'epoch': versions[0], 'embeddings_version': versions[1],
+            'users_watermark': after_user, 'samples_watermark': after_sample,
+            'users_count': counts[0], 'samples_count': counts[1], 'groups': groups}
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.rename(tmp, os.path.join(directory, name))
+
+    pointer = os.path.join(directory, f'.CURRENT-{uuid.uuid4().hex}')
+    with open(pointer, 'w') as f:
+        f.write(name + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer, os.path.join(directory, 'CURRENT'))
+    _prune(directory, name)
+    return name
+
+
+def _prune(directory, current):
+    """Drop abandoned temporary snapshots and all but the newest EMBEDDING_INDEX_KEEP.
+    Processes still mapping a deleted snapshot keep reading it until they switch."""
+    others = sorted(n for n in os.listdir(directory) if not n.startswith('.') and n not in ('CURRENT', current))
+    old = others[:max(0, len(others) - (EMBEDDING_INDEX_KEEP - 1))]
+    for n in old + [n for n in os.listdir(directory) if n.startswith('.tmp-')]:
+        shutil.rmtree(os.path.join(directory, n), ignore_errors=True)
+
+
+def rebuild(directory=EMBEDDING_INDEX_DIR):
+    """Write a snapshot of every stored embedding and make it current. Returns its name."""
+    with _exclusive(directory):
+        with _get_engine().connect() as conn:
+            versions = _versions(conn)
+            groups, after_user, after_sample, counts = read_rows(conn)
+        parts = {key: [group] for key, group in groups.items()}
+        name = _write_snapshot(directory, parts, after_user, after_sample, counts, versions)
+    logger.info('Embedding index %s: %d rows', name, sum(len(g[1]) for g in groups.values()))
+    return name
+
+
+def merge(directory=EMBEDDING_INDEX_DIR):
+    """Append the embeddings stored after the current snapshot into a new one and make it
+    current. Rebuilds when there is no usable snapshot or rows it holds were deleted.
+    Returns the new name, or None when there was nothing to merge."""
+    with _exclusive(directory):
+        name = current_name(directory)
+        try:
+            base = Snapshot(os.path.join(directory, name)) if name else None
+        except (OSError, ValueError, KeyError):
+            base = None
+        with _get_engine().connect() as conn:
+            versions = _versions(conn)
+            if base is None or not _unchanged(conn, base.versions, base.watermarks, base.counts):
+                groups, after_user, after_sample, counts = read_rows(conn)
+                base = None
+            else:
+                groups, after_user, after_sample, counts = read_rows(conn, *base.watermarks)
+        if base is not None and not groups and (after_user, after_sample) == base.watermarks:
+            return None
+        parts = {key: [group] for key, group in (base.groups.items() if base else ())}
+        for key, group in groups.items():
+            parts.setdefault(key, []).append(group)
+        if base is not None:
+            counts = (base.counts[0] + counts[0], base.counts[1] + counts[1])
+        new = _write_snapshot(directory, parts, after_user, after_sample, counts, versions)
+    logger.info('Embedding index %s: merged %d new rows', new, sum(len(g[1]) for g in groups.values()))
+    return new
+
+
+class EmbeddingIndex:
+    """The live snapshot plus this process's delta of newer embeddings."""
+
+    def __init__(self, directory=EMBEDDING_INDEX_DIR):
+        self.directory = directory
+        self.snapshot = None
+        self._lock = threading.Lock()
+        self._pointer = None  # (mtime_ns, size) of CURRENT when last read
+        self._checked_at = 0.0
+        self._after = (0, 0)
+        self._counts = (0, 0)  # table rows at or below self._after when read
+        self._delta = {}  # (model, dim) -> (matrix, ids, labels)
+        self.merge_wanted = threading.Event()
+        self.verify_in_background = False  # set when the merge thread runs verify()
+
+    @property
+    def delta_rows(self):
+        return sum(len(ids) for _, ids, _ in self._delta.values())
+
+    def _switch(self):
+        """Map the snapshot CURRENT names if it changed, creating the first one if needed."""
+        path = os.path.join(self.directory, 'CURRENT')
+        try:
+            st = os.stat(path)
+            pointer = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            pointer = None
+        if pointer is not None and pointer == self._pointer and self.snapshot is not None:
+            return
+        name = current_name(self.directory)
+        snapshot = None
+        if name:
+            try:
+                snapshot = Snapshot(os.path.join(self.directory, name))
+            except (OSError, ValueError, KeyError):
+                logger.warning('Embedding index snapshot %s is unreadable, rebuilding', name)
+        if snapshot is None or snapshot.meta['epoch'] != _epoch():
+            # Snapshot of a deleted and recreated database, or none yet
+            snapshot = Snapshot(os.path.join(self.directory, merge(self.directory) or current_name(self.directory)))
+            st = os.stat(path)
+            pointer = (st.st_mtime_ns, st.st_size)
+        self._pointer = pointer
+        if self.snapshot is None or snapshot.name != self.snapshot.name:
+            logger.info('Embedding index switched to %s (%d rows)', snapshot.name, snapshot.rows)
+            self.snapshot = snapshot
+            self._after = snapshot.watermarks
+            self._counts = snapshot.counts
+            self._delta = {}
+
+    def refresh(self):
+        """Switch to a newer snapshot if there is one and load embeddings added since."""
+        with self._lock:
+            now = time.monotonic()
+            if self.snapshot is None or now - self._checked_at >= CHECK_SECONDS:
+                self._checked_at = now
+                self._switch()
+                if not self.verify_in_background:
+                    self._verify()
+            with _get_engine().connect() as conn:
+                groups, after_user, after_sample, counts = read_rows(conn, *self._after)
+            self._after = (after_user, after_sample)
+            self._counts = (self._counts[0] + counts[0], self._counts[1] + counts[1])
+            for key, (vectors, ids, labels) in groups.items():
+                old = self._delta.get(key)
+                if old is not None:
+                    vectors = np.concatenate([old[0], vectors])
+                    ids = old[1] + ids
+                    labels = old[2] + labels
+                self._delta[key] = (np.asarray(vectors, dtype=np.float32), ids, labels)
+            if self.delta_rows >= EMBEDDING_INDEX_MERGE_ROWS:
+                self.merge_wanted.set()
+            return self.snapshot, self._delta
+
+    def _verify(self):
+        with _get_engine().connect() as conn:
+            unchanged = _unchanged(conn, self.snapshot.versions, self._after, self._counts)
+        if not unchanged:
+            # Users were deleted (scripts/clear_database.py) and their ids may be reused
+            logger.warning('Embedding index %s no longer matches the database, rebuilding', self.snapshot.name)
+            merge(self.directory)  # a full rebuild, unless another process just wrote one
+            self.snapshot = None
+            self._switch()
+
+    def verify(self):
+        """Rebuild if embeddings the index holds were deleted (see _unchanged)."""
+        with self._lock:
+            if self.snapshot is not None:
+                self._verify()
+
+    def search(self, embedding, model):
+        """(score, user id, name) of the most similar stored embedding from `model`, or None."""
+        query = _normalize(np.asarray(embedding, dtype=np.float32).ravel())
+        with stage('load_candidates'):
+            snapshot, delta = self.refresh()
+        with stage('match'):
+            found = [snapshot.search(query, model)]
+            if (model, query.size) in delta:
+                found.append(_best(*delta[(model, query.size)], query))
+        found = [f for f in found if f is not None]
+        return max(found, key=lambda f: f[0]) if found else None
+
+
+_index = None
+_index_lock = threading.Lock()
+_merger = None
+
+
+def _merge_loop(idx, interval):
+    # Wakes every CHECK_SECONDS to check for deletes, so requests never pay for it
+    next_merge = time.monotonic() + interval
+    while True:
+        wanted = idx.merge_wanted.wait(CHECK_SECONDS)
+        try:
+            idx.verify()
+            if wanted or time.monotonic() >= next_merge:
+                idx.merge_wanted.clear()
+                next_merge = time.monotonic() + interval
+                if idx.delta_rows:
+                    merge(idx.directory)
+        except Exception:
+            logger.exception('Embedding index merge failed')
+
+
+def index():
+    """This process's EmbeddingIndex; the first call also starts its merge thread."""
+    global _index, _merger
+    with _index_lock:
+        if _index is None:
+            _index = EmbeddingIndex()
+            if EMBEDDING_INDEX_MERGE_SECONDS > 0:
+                _index.verify_in_background = True
+                _merger = threading.Thread(target=_merge_loop, args=(_index, EMBEDDING_INDEX_MERGE_SECONDS),
+                                           name='embedding-index-merge', daemon=True)
+                _merger.start()
+        return _index
+
+
+def best_match(embedding, model, threshold=0.4):
+    """Same result as face_recog.find_best_match over the stored embeddings of `model`
+    (app._load_candidates), from the index."""
+    best = index().search(embedding, model)
+    if best and best[0] >= threshold:
+        inc('parcel_face_matches_total', endpoint=current_endpoint(), result='match')
+        return {"id": best[1], "name": best[2], "score": best[0]}
+    inc('parcel_face_matches_total', endpoint=current_endpoint(), result='miss')
+    return None
@@ -0,0 +1,214 @@
+import os
+import json
+import asyncio
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, delete, insert, inspect, select, func
+from sqlalchemy.orm import Session
+
+from metrics import inc
+from models import get_engine, Parcel, ParcelEvent, User
+
+logger = logging.getLogger(__name__)
+
+# How often each process checks parcel_events for newly committed events
+EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', 0.5))
+# Recent events kept in memory per process for replay
+EVENTS_BUFFER_SIZE = int(os.environ.get('EVENTS_BUFFER_SIZE', 1000))
+# Events older than this are deleted from parcel_events
+EVENTS_RETENTION_HOURS = int(os.environ.get('EVENTS_RETENTION_HOURS', 24))
+# Streams end after this long; EventSource reconnects with Last-Event-ID and loses nothing
+EVENTS_MAX_STREAM_SECONDS = int(os.environ.get('EVENTS_MAX_STREAM_SECONDS', 300))
+# Streams open at once per process when app.py serves them on a threaded server (gunicorn
+# --worker-class gthread): each holds a thread for its whole life, so keep this well below
+# --threads. More get a 503 with Retry-After. asgi.py streams from its loop, without a limit.
+EVENTS_MAX_STREAMS = int(os.environ.get('EVENTS_MAX_STREAMS', 4))
+EVENTS_HEARTBEAT_SECONDS = 15
+EVENTS_REPLAY_LIMIT = 1000
+RETRY_MS = 3000
+
+# Events are written to parcel_events by the flush listener below, in the same transaction
+# as the parcel or user change, so a stream only ever sees committed changes. Every process
+# runs one EventHub thread that polls the table and fans new events out to all of its
+# open /events streams, which works the same with one or many gunicorn workers.
+
+
+def _parcel_event(kind, parcel):
+    return {
+        'type': kind,
+        'owner_id': parcel.owner_id,
+        'payload': json.dumps({
+            'parcel_id': parcel.id,
+            'owner_id': parcel.owner_id,
+            'tracking_code': parcel.tracking_code,
+            'status': parcel.status,
+            'storage_location': parcel.storage_location,
+            'slot': parcel.slot,
+        }),
+    }
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_events(session, flush_context):
+    rows = []
+    for obj in session.new:
+        if isinstance(obj, Parcel):
+            rows.append(_parcel_event('parcel-added', obj))
+        elif isinstance(obj, User):
+            rows.append({'type': 'user-registered', 'owner_id': obj.id,
+                         'payload': json.dumps({'user_id': obj.id, 'face_uuid': obj.face_uuid, 'name': obj.name})})
+    for obj in session.dirty:
+        if isinstance(obj, Parcel) and obj.status == 'collected' and inspect(obj).attrs.status.history.has_changes():
+            rows.append(_parcel_event('parcel-collected', obj))
+    if rows:
+        session.connection().execute(insert(ParcelEvent), rows)
+
+
+def _as_dict(row):
+    return {'id': row.id, 'type': row.type, 'owner_id': row.owner_id, 'data': row.payload}
+
+
+class EventHub:
+    """Per-process fan-out: one thread polls parcel_events and wakes every waiting stream."""
+
+    def __init__(self, poll_interval=EVENTS_POLL_INTERVAL, buffer_size=EVENTS_BUFFER_SIZE):
+        self.poll_interval = poll_interval
+        self._buffer = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._last_id = 0
+        self._engine = None
+        self._thread = None
+
+    def _load(self, after_id, limit):
+        with self._engine.connect() as conn:
+            rows = conn.execute(select(ParcelEvent).where(ParcelEvent.id > after_id)
+                                .order_by(ParcelEvent.id).limit(limit)).all()
+        return [_as_dict(r) for r in rows]
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._engine = get_engine()
+            with self._engine.connect() as conn:
+                last_id = conn.execute(select(func.max(ParcelEvent.id))).scalar() or 0
+            self._buffer.extend(self._load(max(0, last_id - self._buffer.maxlen), self._buffer.maxlen))
+            self._last_id = last_id
+            self._thread = threading.Thread(target=self._run, name='event-hub', daemon=True)
+            self._thread.start()
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def _run(self):
+        last_prune = 0.0
+        while True:
+            events = []
+            try:
+                events = self._load(self._last_id, EVENTS_REPLAY_LIMIT)
+                if events:
+                    with self._cond:
+                        self._buffer.extend(events)
+                        self._last_id = events[-1]['id']
+                        self._cond.notify_all()
+                if time.monotonic() - last_prune > 600:
+                    last_prune = time.monotonic()
+                    cutoff = datetime.utcnow() - timedelta(hours=EVENTS_RETENTION_HOURS)
+                    with self._engine.begin() as conn:
+                        conn.execute(delete(ParcelEvent).where(ParcelEvent.created_at < cutoff))
+            except Exception:
+                logger.exception('Event poll failed')
+            if not events:
+                time.sleep(self.poll_interval)
+
+    def since(self, cursor):
+        """Events with id > cursor, from memory when the buffer reaches back far enough and
+        from parcel_events otherwise (at most EVENTS_REPLAY_LIMIT)."""
+        with self._cond:
+            if cursor >= self._last_id:
+                return []
+            if self._buffer and self._buffer[0]['id'] <= cursor + 1:
+                return [e for e in self._buffer if e['id'] > cursor][:EVENTS_REPLAY_LIMIT]
+        return [e for e in self._load(cursor, EVENTS_REPLAY_LIMIT) if e['id'] <= self._last_id]
+
+    def wait(self, cursor, timeout):
+        """Block until an event newer than `cursor` arrives; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._last_id > cursor, timeout)
+
+
+hub = EventHub()
+
+
+def start_event_hub():
+    """Start this process's event poller. Called at app startup."""
+    hub.start()
+
+
+_stream_slots = threading.BoundedSemaphore(EVENTS_MAX_STREAMS)
+
+
+def claim_stream():
+    """Take one of this process's EVENTS_MAX_STREAMS thread-held streams; False when all
+    are open. Call release_stream() once the response is closed."""
+    if _stream_slots.acquire(blocking=False):
+        return True
+    inc('parcel_events_streams_rejected_total')
+    return False
+
+
+def release_stream():
+    _stream_slots.release()
+
+
+def _format(e):
+    return f"id: {e['id']}\nevent: {e['type']}\ndata: {e['data']}\n\n"
+
+
+def stream(last_event_id=None, owner_id=None, max_seconds=EVENTS_MAX_STREAM_SECONDS):
+    """Yield Server-Sent Events text: events after `last_event_id` (or only new ones when
+    None), optionally only those for `owner_id`, then live events until `max_seconds`.
+    Sends a comment every EVENTS_HEARTBEAT_SECONDS so proxies keep the connection open."""
+    hub.start()
+    yield f'retry: {RETRY_MS}\n\n'
+    cursor = hub.last_id if last_event_id is None else last_event_id
+    deadline = time.monotonic() + max_seconds
+    while time.monotonic() < deadline:
+        events = hub.since(cursor)
+        for e in events:
+            cursor = e['id']
+            if owner_id is not None and e['owner_id'] != owner_id:
+                continue
+            yield _format(e)
+        if not events and not hub.wait(cursor, min(EVENTS_HEARTBEAT_SECONDS, max(0.0, deadline - time.monotonic()))):
+            yield ': keep-alive\n\n'
+
+
+async def astream(last_event_id=None, owner_id=None, max_seconds=EVENTS_MAX_STREAM_SECONDS):
+    """Async version of stream() for asgi.py: waits by polling the hub's cursor instead of
+    blocking a thread, so one event loop can hold any number of open streams."""
+    yield f'retry: {RETRY_MS}\n\n'
+    cursor = hub.last_id if last_event_id is None else last_event_id
+    deadline = time.monotonic() + max_seconds
+    quiet_since = time.monotonic()
+    while time.monotonic() < deadline:
+        if hub.last_id > cursor:
+            # Usually served from memory; replay after a long disconnect reads parcel_events
+            events = await asyncio.to_thread(hub.since, cursor)
+            for e in events:
+                cursor = e['id']
+                if owner_id is None or e['owner_id'] == owner_id:
+                    quiet_since = time.monotonic()
+                    yield _format(e)
+            if events:
+                continue
+            cursor = hub.last_id  # the missed events were already pruned
+        if time.monotonic() - quiet_since >= EVENTS_HEARTBEAT_SECONDS:
+            quiet_since = time.monotonic()
+            yield ': keep-alive\n\n'
+        await asyncio.sleep(min(EVENTS_POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
@@ -15,13 +15,28 @@ except Exception:
 import cv2
 from PIL import Image
 
+from metrics import inc, stage, current_endpoint
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOADS = os.path.join(BASE_DIR, 'uploads')
 os.makedirs(UPLOADS, exist_ok=True)
 
 # DeepFace model settings - VGG-Face is more accurate than Facenet
-MODEL_NAME = 'VGG-Face'
+MODEL_NAME = os.environ.get('FACE_MODEL', 'VGG-Face')
 MODEL = None
+# Bump when preprocessing changes in a way that changes the vectors
+EMBEDDING_VERSION = os.environ.get('EMBEDDING_VERSION', '1')
+
+# Every stored embedding is tagged with the model that produced it (users.embedding_model,
+# face_samples.embedding_model), and matching only compares vectors with the same tag.
+# After changing FACE_MODEL or EMBEDDING_VERSION, run scripts/reembed.py.
+DEEPFACE_MODEL_TAG = f'deepface/{MODEL_NAME}/v{EMBEDDING_VERSION}'
+FALLBACK_MODEL_TAG = f'opencv/gray160/v{EMBEDDING_VERSION}'
+
+
+def current_model():
+    """Tag of the embeddings this process produces for a detected face."""
+    return DEEPFACE_MODEL_TAG if _HAS_DEEPFACE else FALLBACK_MODEL_TAG
 
 
 def load_model():
@@ -29,50 +44,65 @@ def load_model():
     if not _HAS_DEEPFACE:
         return None
     if MODEL is None:
-        from deepface import DeepFace
-        MODEL = DeepFace.build_model(MODEL_NAME)
+        with stage('load_model'):
+            from deepface import DeepFace
+            MODEL = DeepFace.build_model(MODEL_NAME)
     return MODEL
 
 
-def save_base64_image(b64data, prefix='img'):
-    header, _, data = b64data.partition(',')
-    if not data:
-        data = header
-    img_bytes = base64.b64decode(data)
-    filename = f"{prefix}_{uuid.uuid4().hex}.jpg"
-    path = os.path.join(UPLOADS, filename)
-    
-    # Preprocess image for better recognition
-    try:
-        # Load image
-        img = Image.open(io.BytesIO(img_bytes))
+def preprocess_base64_image(b64data):
+    """JPEG bytes of a base64 image after lighting equalization and denoising (the decoded
+    bytes unchanged if that fails). The CPU-heavy part of save_base64_image."""
+    with stage('decode'):
+        header, _, data = b64data.partition(',')
+        if not data:
+            data = header
+        img_bytes = base64.b64decode(data)
+
+    with stage('preprocess'):
+        # Preprocess image for better recognition
+        try:
+            # Load image
+            img = Image.open(io.BytesIO(img_bytes))
         
-        # Convert to RGB if needed
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+            # Convert to RGB if needed
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
         
-        # Enhance image quality using OpenCV
-        img_cv = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+            # Enhance image quality using OpenCV
+            img_cv = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
         
-        # Apply histogram equalization for better lighting
-        img_yuv = cv2.cvtColor(img_cv, cv2.COLOR_BGR2YUV)
-        img_yuv[:,:,0] = cv2.equalizeHist(img_yuv[:,:,0])
-        img_cv = cv2.cvtColor(img_yuv, cv2.COLOR_YUV2BGR)
+            # Apply histogram equalization for better lighting
+            img_yuv = cv2.cvtColor(img_cv, cv2.COLOR_BGR2YUV)
+            img_yuv[:,:,0] = cv2.equalizeHist(img_yuv[:,:,0])
+            img_cv = cv2.cvtColor(img_yuv, cv2.COLOR_YUV2BGR)
         
-        # Denoise
-        img_cv = cv2.fastNlMeansDenoisingColored(img_cv, None, 10, 10, 7, 21)
+            # Denoise
+            img_cv = cv2.fastNlMeansDenoisingColored(img_cv, None, 10, 10, 7, 21)
         
-        # Save enhanced image
-        cv2.imwrite(path, img_cv, [cv2.IMWRITE_JPEG_QUALITY, 95])
-    except Exception as e:
-        # If preprocessing fails, save original
-        print(f"Preprocessing failed, using original: {e}")
-        with open(path, 'wb') as f:
-            f.write(img_bytes)
-    
+            # Encode enhanced image
+            ok, buf = cv2.imencode('.jpg', img_cv, [cv2.IMWRITE_JPEG_QUALITY, 95])
+            if not ok:
+                raise ValueError('JPEG encoding failed')
+            return buf.tobytes()
+        except Exception as e:
+            # If preprocessing fails, save original
+            print(f"Preprocessing failed, using original: {e}")
+            return img_bytes
+
+
+def save_image_bytes(data, prefix='img'):
+    """Write image bytes (from preprocess_base64_image) to uploads/ and return the path."""
+    path = os.path.join(UPLOADS, f"{prefix}_{uuid.uuid4().hex}.jpg")
+    with open(path, 'wb') as f:
+        f.write(data)
     return path
 
 
+def save_base64_image(b64data, prefix='img'):
+    return save_image_bytes(preprocess_base64_image(b64data), prefix)
+
+
 def _detect_and_crop_face_opencv(image_path, target_size=(160, 160)):
     # Use Haar cascade to detect the largest face and return a resized grayscale array
     img = cv2.imread(image_path)
@@ -101,13 +131,14 @@ def _detect_and_crop_face_opencv(image_path, target_size=(160, 160)):
     return arr.flatten()
 
 
-def get_embedding_from_file(image_path, enforce_detection=True):
-    """Return embedding vector (numpy array) for an image file.
+def embed_file(image_path, enforce_detection=True):
+    """Return (embedding vector, model tag) for an image file.
     Uses DeepFace if available; otherwise a simple OpenCV-based flattened face crop.
     
     Args:
         image_path: Path to image file
-        enforce_detection: If True, raises error when no face detected. If False, uses fallback.
+        enforce_detection: If True and DeepFace finds no face, uses the OpenCV fallback
+            (tagged FALLBACK_MODEL_TAG). If False, DeepFace embeds the whole image.
     """
     if _HAS_DEEPFACE:
         from deepface import DeepFace
@@ -116,19 +147,22 @@ def get_embedding_from_file(image_path, enforce_detection=True):
         _ = load_model()
         try:
             # Use detector_backend='opencv' for more reliable detection, align face for better accuracy
-            reps = DeepFace.represent(
-                img_path=image_path, 
-                model_name=MODEL_NAME, 
-                enforce_detection=enforce_detection,
-                detector_backend='opencv',
-                align=True
-            )
+            # Detection and alignment happen inside represent(), so they are timed together
+            with stage('represent'):
+                reps = DeepFace.represent(
+                    img_path=image_path, 
+                    model_name=MODEL_NAME, 
+                    enforce_detection=enforce_detection,
+                    detector_backend='opencv',
+                    align=True
+                )
         except Exception as e:
             # If face detection fails and we have enforce_detection=True, try fallback
             if enforce_detection and "could not be detected" in str(e).lower():
                 print(f"DeepFace detection failed, using OpenCV fallback: {str(e)}")
-                vec = _detect_and_crop_face_opencv(image_path)
-                return np.array(vec, dtype=np.float32)
+                with stage('detect'):
+                    vec = _detect_and_crop_face_opencv(image_path)
+                return np.array(vec, dtype=np.float32), FALLBACK_MODEL_TAG
             else:
                 raise
         # DeepFace.represent may return different shapes across versions: a dict with 'embedding',
@@ -143,24 +177,39 @@ def get_embedding_from_file(image_path, enforce_detection=True):
             emb = np.array(reps, dtype=np.float32)
         else:
             raise ValueError('Unexpected embedding format from DeepFace')
-        return emb
+        return emb, DEEPFACE_MODEL_TAG
     else:
-        vec = _detect_and_crop_face_opencv(image_path)
-        return np.array(vec, dtype=np.float32)
+        with stage('detect'):
+            vec = _detect_and_crop_face_opencv(image_path)
+        return np.array(vec, dtype=np.float32), FALLBACK_MODEL_TAG
 
 
-def get_embedding_from_base64(b64data, enforce_detection=False):
-    """Get embedding from base64 image. 
+def get_embedding_from_file(image_path, enforce_detection=True):
+    """Embedding vector (numpy array) for an image file; see embed_file()."""
+    return embed_file(image_path, enforce_detection=enforce_detection)[0]
+
+
+def embed_base64(b64data, enforce_detection=False):
+    """(embedding, model tag) for a base64 image. 
     By default, uses fallback detection (enforce_detection=False) for better UX."""
-    path = save_base64_image(b64data, prefix='tmp')
+    return embed_preprocessed(preprocess_base64_image(b64data), enforce_detection=enforce_detection)
+
+
+def embed_preprocessed(data, enforce_detection=False):
+    """(embedding, model tag) for image bytes from preprocess_base64_image."""
+    path = save_image_bytes(data, prefix='tmp')
     try:
-        emb = get_embedding_from_file(path, enforce_detection=enforce_detection)
+        return embed_file(path, enforce_detection=enforce_detection)
     finally:
         try:
             os.remove(path)
         except Exception:
             pass
-    return emb
+
+
+def get_embedding_from_base64(b64data, enforce_detection=False):
+    """Embedding vector for a base64 image; see embed_base64()."""
+    return embed_base64(b64data, enforce_detection=enforce_detection)[0]
 
 
 def cosine_similarity(a, b):
@@ -175,22 +224,26 @@ def cosine_similarity(a, b):
 
 def find_best_match(embedding, candidates, threshold=0.4):
     """
-    candidates: iterable of tuples (id, name, embedding_np)
+    candidates: iterable of tuples (id, name, embedding_np), all from the query's model
+    (see _load_candidates in app.py)
     returns best candidate dict or None
     threshold is cosine similarity threshold (lowered to 0.4 for better recognition)
     VGG-Face typically has lower similarity scores but better accuracy
     """
     best = None
     best_score = -1.0
-    for cid, name, emb in candidates:
-        try:
-            score = cosine_similarity(embedding, np.array(emb, dtype=np.float32))
-        except Exception:
-            continue
-        if score > best_score:
-            best_score = score
-            best = (cid, name, emb, score)
+    with stage('match'):
+        for cid, name, emb in candidates:
+            try:
+                score = cosine_similarity(embedding, np.array(emb, dtype=np.float32))
+            except Exception:
+                continue
+            if score > best_score:
+                best_score = score
+                best = (cid, name, emb, score)
 
     if best and best_score >= threshold:
+        inc('parcel_face_matches_total', endpoint=current_endpoint(), result='match')
         return {"id": best[0], "name": best[1], "score": float(best[3])}
+    inc('parcel_face_matches_total', endpoint=current_endpoint(), result='miss')
     return None
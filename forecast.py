@@ -1,64 +1,336 @@
 import os
+import time
 import logging
+import threading
+import importlib.util
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from collections import Counter
-import json
+
 
 logger = logging.getLogger(__name__)
 
 
+# Days of history fed to the forecast models
+HISTORY_DAYS = int(os.environ.get('FORECAST_HISTORY_DAYS', 365))
+# Seconds between scheduled Prophet refits (0 disables the scheduler)
+REFIT_INTERVAL = int(os.environ.get('FORECAST_REFIT_INTERVAL', 3600))
+# Forecast horizons kept in the fitted-model cache
+MAX_CACHED_HORIZONS = 16
+# Days of per-location history used by the capacity forecast
+CAPACITY_HISTORY_DAYS = int(os.environ.get('FORECAST_CAPACITY_HISTORY_DAYS', 56))
+# Values accepted by /forecast?model=; 'auto' picks the best NumPy model by backtest.
+# Listed here rather than read from forecast_models.MODELS so importing this module does
+# not load NumPy; forecast_models is imported on first use.
+MODEL_CHOICES = ('auto', 'prophet', 'moving_average', 'seasonal_naive', 'holt_winters', 'weekday_ratio')
+
+_HAS_PROPHET = importlib.util.find_spec('prophet') is not None
+
+# days -> {'watermark': ..., 'result': {...}}; only the newest fit per horizon is kept
+_cache = OrderedDict()
+_pending = set()
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='forecast-refit')
+_prophet_import_ms = None
+_scheduler = None
+
+
 def _count_parcels_per_day(session):
-    from models import Parcel
-    rows = session.query(Parcel).filter(Parcel.arrival_time != None).all()
-    dates = [p.arrival_time.date() for p in rows if p.arrival_time]
-    counts = Counter(dates)
-    # return list of tuples sorted by date
-    items = sorted(counts.items())
-    return items
+    """Return [(date, count)] for the last HISTORY_DAYS days, sorted by date.
 
+    Reads the daily_arrivals rollup (one row per day, kept current on insert by counters.py),
+    falling back to a GROUP BY date(arrival_time) over the parcel tables if it is empty.
+    """
+    from models import DailyArrival
+    from counters import arrivals_per_day
+    since = datetime.utcnow().date() - timedelta(days=HISTORY_DAYS)
+    rows = (session.query(DailyArrival.day, DailyArrival.count)
+            .filter(DailyArrival.day >= since, DailyArrival.count > 0)
+            .order_by(DailyArrival.day)
+            .all())
+    if rows:
+        return [(d, c) for d, c in rows]
+    return [(d, c) for d, c in arrivals_per_day(session) if d >= since]
 
-def forecast_next_days(session, days=7):
-    """Try to forecast next `days` parcel arrivals.
 
-    If Prophet is installed, use it. Otherwise fall back to a simple moving average.
-    Returns list of dicts: {date: iso, predicted: float}
+def _zeros(days):
+    today = datetime.utcnow().date()
+    return [{"date": (today + timedelta(days=i)).isoformat(), "predicted": 0.0} for i in range(1, days+1)]
+
+
+def _result(predictions, model, timings=None):
+    return {
+        'predictions': predictions,
+        'model': model,
+        'generated_at': datetime.utcnow().isoformat(),
+        'timings': timings or {},
+    }
+
+
+def _watermark(items):
+    """Split off today's partial counts and return (watermark, complete_items).
+
+    Prophet is fitted on complete days only, so the watermark (last complete day, number
+    of days, total parcels) changes once a new day's data arrives, not on every insert.
     """
+    today = datetime.utcnow().date()
+    complete = [(d, c) for d, c in items if d < today]
+    if not complete:
+        return None, complete
+    return (complete[-1][0].isoformat(), len(complete), sum(c for d, c in complete)), complete
+
+
+def _numpy_forecast(items, days, model='auto'):
+    """Forecast with one of forecast_models.MODELS, or the best of them by backtest for 'auto'.
+    Uses complete days only; days without arrivals count as 0."""
+    import forecast_models
+    start = time.perf_counter()
+    today = datetime.utcnow().date()
+    watermark, complete = _watermark(items)
+    if complete:
+        y = forecast_models.daily_series(complete, today - timedelta(days=1))
+        end = today - timedelta(days=1)
+    else:
+        y = forecast_models.daily_series(items, today)
+        end = today
+    scores = None
+    if model == 'auto':
+        model, scores = forecast_models.select_best(y, horizon=min(days, 14))
+    steps = (today - end).days + days
+    values = forecast_models.predict(model, y, steps)[-days:]
+    preds = [{"date": (today + timedelta(days=i + 1)).isoformat(), "predicted": float(v)} for i, v in enumerate(values)]
+    result = _result(preds, model, {'compute_ms': round((time.perf_counter() - start) * 1000.0, 2)})
+    if scores is not None:
+        result['backtest_mape'] = {k: (round(v, 2) if v is not None else None) for k, v in scores.items()}
+    return result
+
+
+def _load_prophet():
+    global _prophet_import_ms
+    start = time.perf_counter()
+    from prophet import Prophet
+    import pandas as pd
+    if _prophet_import_ms is None:
+        _prophet_import_ms = (time.perf_counter() - start) * 1000.0
+        logger.info('Imported prophet and pandas in %.0f ms', _prophet_import_ms)
+    return Prophet, pd
+
+
+def _fit_prophet(items, days):
+    Prophet, pd = _load_prophet()
+    start = time.perf_counter()
+    df = pd.DataFrame({
+        'ds': [pd.to_datetime(d) for d, c in items],
+        'y': [c for d, c in items]
+    })
+    m = Prophet()
+    m.fit(df)
+    fitted = time.perf_counter()
+    # History ends before today; extend the horizon so predictions start tomorrow
+    gap = (datetime.utcnow().date() - items[-1][0]).days
+    future = m.make_future_dataframe(periods=days + max(0, gap))
+    forecast = m.predict(future)
+    preds = []
+    for i in range(1, days+1):
+        row = forecast.iloc[-i]
+        date = pd.to_datetime(row['ds']).date()
+        preds.append({
+            'date': date.isoformat(),
+            'predicted': float(max(0.0, row['yhat']))
+        })
+    preds = list(reversed(preds))
+    timings = {
+        'import_ms': round(_prophet_import_ms or 0.0, 1),
+        'fit_ms': round((fitted - start) * 1000.0, 1),
+        'predict_ms': round((time.perf_counter() - fitted) * 1000.0, 1),
+    }
+    return _result(preds, 'prophet', timings)
+
+
+def _refit(days, watermark, items):
+    try:
+        result = _fit_prophet(items, days)
+        logger.info('Refitted Prophet for %d days at watermark %s in %.0f ms',
+                    days, watermark, result['timings']['fit_ms'])
+    except Exception:
+        logger.exception('Prophet fit failed; caching NumPy forecast for watermark %s', watermark)
+        result = _numpy_forecast(items, days)
+    with _lock:
+        _cache[days] = {'watermark': watermark, 'result': result}
+        _cache.move_to_end(days)
+        while len(_cache) > MAX_CACHED_HORIZONS:
+            _cache.popitem(last=False)
+        _pending.discard((days, watermark))
+
+
+def _schedule_refit(days, watermark, items):
+    with _lock:
+        if (days, watermark) in _pending:
+            return
+        _pending.add((days, watermark))
+    _executor.submit(_refit, days, watermark, items)
+
+
+def get_forecast(session, days=7, model=None):
+    """Forecast the next `days` parcel arrivals without fitting Prophet in the request.
+
+    `model` is one of MODEL_CHOICES; by default Prophet is used when installed and 'auto'
+    otherwise. The NumPy models (see forecast_models) are computed directly in milliseconds;
+    'auto' backtests them all and uses the one with the lowest MAPE.
+
+    Prophet forecasts are cached per horizon together with the data watermark they were
+    fitted on. A request returns the cached forecast immediately; if the watermark has moved
+    on it is marked stale and a refit is queued on a background thread. Before the first fit
+    for a horizon completes, the 'auto' NumPy forecast is returned instead.
+
+    Returns {predictions: [{date, predicted}], model, generated_at, timings, cached, stale}.
+    Raises ValueError for an unknown model.
+    """
+    if model is None:
+        model = 'prophet' if _HAS_PROPHET else 'auto'
+    if model not in MODEL_CHOICES:
+        raise ValueError(f"Unknown model '{model}'; choose one of {', '.join(MODEL_CHOICES)}")
+
     items = _count_parcels_per_day(session)
     if not items:
         # no historical data, return zeros
-        today = datetime.utcnow().date()
-        return [{"date": (today + timedelta(days=i)).isoformat(), "predicted": 0.0} for i in range(1, days+1)]
+        return dict(_result(_zeros(days), 'none'), cached=False, stale=False)
 
-    dates = [d for d, c in items]
-    counts = [c for d, c in items]
+    watermark, complete = _watermark(items)
+    if model != 'prophet' or not _HAS_PROPHET or len(complete) < 2:
+        numpy_model = 'auto' if model == 'prophet' else model
+        return dict(_numpy_forecast(items, days, numpy_model), cached=False, stale=False)
+
+    with _lock:
+        entry = _cache.get(days)
+    if entry and entry['watermark'] == watermark:
+        return dict(entry['result'], cached=True, stale=False)
+    _schedule_refit(days, watermark, complete)
+    if entry:
+        return dict(entry['result'], cached=True, stale=True)
+    return dict(_numpy_forecast(items, days), cached=False, stale=True)
+
+
+def forecast_next_days(session, days=7):
+    """Try to forecast next `days` parcel arrivals.
+
+    Returns list of dicts: {date: iso, predicted: float}. See get_forecast for the model and caching.
+    """
+    return get_forecast(session, days=days)['predictions']
 
-    # Try Prophet
-    try:
-        from prophet import Prophet
-        import pandas as pd
-        df = pd.DataFrame({
-            'ds': [pd.to_datetime(d) for d in dates],
-            'y': counts
-        })
-        m = Prophet()
-        m.fit(df)
-        future = m.make_future_dataframe(periods=days)
-        forecast = m.predict(future)
-        preds = []
-        for i in range(1, days+1):
-            row = forecast.iloc[-i]
-            date = pd.to_datetime(row['ds']).date()
-            preds.append({
-                'date': date.isoformat(),
-                'predicted': float(max(0.0, row['yhat']))
-            })
-        preds = list(reversed(preds))
-        return preds
-    except Exception:
-        logger.info('Prophet not available or failed; using moving average fallback')
 
-    # Fallback: simple moving average of last 7 days (or available)
-    window = min(7, len(counts))
-    avg = sum(counts[-window:]) / float(window)
+def forecast_capacity(session, days=7, history_days=CAPACITY_HISTORY_DAYS):
+    """Project occupancy of every storage location for the next `days` days.
+
+    Per-location daily arrivals, mean dwell (arrival to collection) and the current stock
+    are read with a few GROUP BY queries; arrivals for all locations are then forecast as
+    one (locations, days) matrix with the weekday-ratio model and advanced together by
+    forecast_models.project_occupancy. Locations without collections yet use the mean
+    estimated_delivery_days of their stored parcels as dwell, then the overall mean.
+
+    Returns a list of per-location dicts sorted by peak utilization, highest first.
+    """
+    import numpy as np
+    import forecast_models
+    from sqlalchemy import func
+    from models import Parcel, ArchivedParcel, StorageLocation, ParcelCounter
+
     today = datetime.utcnow().date()
-    return [{"date": (today + timedelta(days=i)).isoformat(), "predicted": float(avg)} for i in range(1, days+1)]
+    start = today - timedelta(days=history_days)
+    since = datetime(start.year, start.month, start.day)
+
+    capacity = {name: cap for name, cap in session.query(StorageLocation.name, StorageLocation.capacity)}
+    current = {key: count for key, count in session.query(ParcelCounter.key, ParcelCounter.count)
+               .filter(ParcelCounter.dimension == 'location')}
+    arrivals = []
+    dwell_sum, dwell_n = {}, {}
+    for model in (Parcel, ArchivedParcel):
+        day = func.date(model.arrival_time)
+        arrivals += (session.query(model.storage_location, day, func.count(model.id))
+                     .filter(model.arrival_time >= since, model.storage_location != None)
+                     .group_by(model.storage_location, day)
+                     .all())
+        dwell = func.julianday(model.collected_time) - func.julianday(model.arrival_time)
+        for loc, total, n in (session.query(model.storage_location, func.sum(dwell), func.count(model.id))
+                              .filter(model.status == 'collected', model.collected_time >= since,
+                                      model.arrival_time != None, model.storage_location != None)
+                              .group_by(model.storage_location)):
+            dwell_sum[loc] = dwell_sum.get(loc, 0.0) + (total or 0.0)
+            dwell_n[loc] = dwell_n.get(loc, 0) + n
+    estimated = {loc: avg for loc, avg in session.query(Parcel.storage_location, func.avg(Parcel.estimated_delivery_days))
+                 .filter(Parcel.status == 'stored', Parcel.storage_location != None)
+                 .group_by(Parcel.storage_location)}
+
+    names = sorted(set(capacity) | set(current) | {loc for loc, d, n in arrivals})
+    if not names:
+        return []
+    index = {name: i for i, name in enumerate(names)}
+
+    # History matrix ends yesterday so today's partial intake does not drag the level down
+    Y = np.zeros((len(names), history_days), dtype=np.float64)
+    for loc, d, n in arrivals:
+        col = (datetime.strptime(d, '%Y-%m-%d').date() - start).days
+        if 0 <= col < history_days:
+            Y[index[loc], col] += n
+    predicted = forecast_models.predict('weekday_ratio', Y, days + 1)[:, 1:]
+
+    observed = np.array([dwell_sum[n] / dwell_n[n] if dwell_n.get(n) else np.nan for n in names])
+    prior = np.array([estimated[n] if estimated.get(n) is not None else np.nan for n in names], dtype=np.float64)
+    dwell = np.where(np.isnan(observed), prior, observed)
+    fallback = np.nanmean(dwell) if not np.all(np.isnan(dwell)) else 3.0
+    dwell = np.where(np.isnan(dwell), fallback, dwell)
+
+    stock = np.array([current.get(n, 0) for n in names], dtype=np.float64)
+    occupancy = forecast_models.project_occupancy(stock, predicted, dwell)
+
+    dates = [(today + timedelta(days=i)).isoformat() for i in range(1, days + 1)]
+    result = []
+    for i, name in enumerate(names):
+        cap = capacity.get(name)
+        peak = int(np.argmax(occupancy[i]))
+        over = np.nonzero(occupancy[i] > cap)[0] if cap else []
+        result.append({
+            'storage_location': name,
+            'capacity': cap,
+            'stored': int(stock[i]),
+            'expected_arrivals': round(float(predicted[i].sum()), 2),
+            'mean_dwell_days': round(float(dwell[i]), 2),
+            'occupancy': [{'date': d, 'predicted': round(float(v), 2)} for d, v in zip(dates, occupancy[i])],
+            'peak_occupancy': round(float(occupancy[i, peak]), 2),
+            'peak_date': dates[peak],
+            'peak_utilization': round(float(occupancy[i, peak]) / cap, 3) if cap else None,
+            'overflow_date': dates[int(over[0])] if len(over) else None,
+        })
+    result.sort(key=lambda r: (r['peak_utilization'] is None, -(r['peak_utilization'] or 0.0)))
+    return result
+
+
+def _scheduler_loop(interval):
+    from models import get_session
+    while True:
+        time.sleep(interval)
+        session = get_session()
+        try:
+            watermark, complete = _watermark(_count_parcels_per_day(session))
+        except Exception:
+            logger.exception('Scheduled forecast refit could not read history')
+            continue
+        finally:
+            session.close()
+        if len(complete) < 2:
+            continue
+        with _lock:
+            horizons = [d for d, e in _cache.items() if e['watermark'] != watermark]
+        for days in horizons:
+            _schedule_refit(days, watermark, complete)
+
+
+def start_refit_scheduler(interval=REFIT_INTERVAL):
+    """Start a daemon thread that refits cached horizons every `interval` seconds when new
+    data has arrived. Does nothing without Prophet, with interval 0, or if already running."""
+    global _scheduler
+    if not _HAS_PROPHET or interval <= 0 or _scheduler is not None:
+        return False
+    _scheduler = threading.Thread(target=_scheduler_loop, args=(interval,), name='forecast-scheduler', daemon=True)
+    _scheduler.start()
+    return True
@@ -0,0 +1,145 @@
+import numpy as np
+
+# Weekly seasonality of mailroom arrivals
+SEASON = 7
+
+
+def daily_series(items, end):
+    """Turn sorted [(date, count)] into a dense float array covering first date..end,
+    with 0 for days without arrivals."""
+    start = items[0][0]
+    n = (end - start).days + 1
+    y = np.zeros(n, dtype=np.float64)
+    for d, c in items:
+        i = (d - start).days
+        if 0 <= i < n:
+            y[i] = c
+    return y
+
+
+def moving_average(y, horizon):
+    """Mean of the last 7 days. Works on one series or a (series, days) matrix."""
+    window = min(SEASON, y.shape[-1])
+    return np.repeat(y[..., -window:].mean(axis=-1, keepdims=True), horizon, axis=-1)
+
+
+def seasonal_naive(y, horizon):
+    """Repeat the last observed week."""
+    if len(y) < SEASON:
+        return moving_average(y, horizon)
+    last_week = y[-SEASON:]
+    idx = np.arange(horizon) % SEASON
+    return last_week[idx]
+
+
+def weekday_ratio(y, horizon, weeks=8):
+    """Recent level (last 4 weeks) scaled by each weekday's share over the last `weeks` weeks.
+    Works on one series or a (series, days) matrix, all rows in one pass."""
+    n = y.shape[-1]
+    if n < 2 * SEASON:
+        return moving_average(y, horizon)
+    recent = y[..., -min(n, weeks * SEASON):]
+    m = recent.shape[-1]
+    onehot = np.eye(SEASON)[(np.arange(m) + n - m) % SEASON]  # (days, weekday position)
+    day_means = (recent @ onehot) / onehot.sum(axis=0)
+    overall = recent.mean(axis=-1, keepdims=True)
+    ratio = np.divide(day_means, overall, out=np.ones_like(day_means), where=overall > 0)
+    level = y[..., -min(n, 4 * SEASON):].mean(axis=-1, keepdims=True)
+    return level * ratio[..., (n + np.arange(horizon)) % SEASON]
+
+
+# Smoothing parameter grid searched by holt_winters_additive, one row per (alpha, beta, gamma)
+_HW_GRID = np.array(np.meshgrid(
+    [0.1, 0.2, 0.4, 0.6, 0.8],
+    [0.0, 0.05, 0.15],
+    [0.05, 0.15, 0.3, 0.5],
+    indexing='ij',
+)).reshape(3, -1)
+
+
+def holt_winters_additive(y, horizon):
+    """Additive Holt-Winters with weekly seasonality.
+
+    The recursion is run for every parameter set in _HW_GRID at once (one NumPy vector per
+    state), and the set with the lowest one-step-ahead squared error is used to forecast.
+    """
+    n = len(y)
+    if n < 2 * SEASON:
+        return seasonal_naive(y, horizon)
+    alpha, beta, gamma = _HW_GRID
+    first, second = y[:SEASON].mean(), y[SEASON:2 * SEASON].mean()
+    level = np.full(alpha.shape, first)
+    trend = np.full(alpha.shape, (second - first) / SEASON)
+    seasonal = np.tile(y[:SEASON] - first, (alpha.size, 1))
+    sse = np.zeros(alpha.shape)
+    for t in range(SEASON, n):
+        k = t % SEASON
+        err = y[t] - (level + trend + seasonal[:, k])
+        sse += err * err
+        new_level = alpha * (y[t] - seasonal[:, k]) + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        seasonal[:, k] = gamma * (y[t] - new_level) + (1 - gamma) * seasonal[:, k]
+        level = new_level
+    best = int(np.argmin(sse))
+    steps = np.arange(1, horizon + 1)
+    return level[best] + steps * trend[best] + seasonal[best, (n - 1 + steps) % SEASON]
+
+
+MODELS = {
+    'moving_average': moving_average,
+    'seasonal_naive': seasonal_naive,
+    'holt_winters': holt_winters_additive,
+    'weekday_ratio': weekday_ratio,
+}
+
+
+def predict(name, y, horizon):
+    """Forecast `horizon` days after the end of `y` with model `name`, clipped at 0."""
+    return np.clip(MODELS[name](y, horizon), 0.0, None)
+
+
+def backtest(y, name, horizon=SEASON, folds=4, min_train=2 * SEASON):
+    """Rolling-origin backtest: fit on y[:origin], forecast the next `horizon` days, for the
+    last `folds` origins. Returns the mean MAPE (%) over days with arrivals, or None if the
+    history is too short for any fold."""
+    errors = []
+    n = len(y)
+    for f in range(folds, 0, -1):
+        origin = n - f * horizon
+        if origin < min_train:
+            continue
+        actual = y[origin:origin + horizon]
+        mask = actual > 0
+        if not mask.any():
+            continue
+        fc = predict(name, y[:origin], len(actual))
+        errors.append(np.mean(np.abs(actual[mask] - fc[mask]) / actual[mask]) * 100.0)
+    return float(np.mean(errors)) if errors else None
+
+
+def select_best(y, horizon=SEASON, folds=4):
+    """Return (best model name, {name: MAPE}) by rolling-origin backtest. Falls back to the
+    moving average when the history is too short to backtest."""
+    scores = {name: backtest(y, name, horizon=horizon, folds=folds) for name in MODELS}
+    scored = {name: s for name, s in scores.items() if s is not None}
+    if not scored:
+        return 'moving_average', scores
+    return min(scored, key=scored.get), scores
+
+
+def project_occupancy(current, arrivals, dwell_days):
+    """Project stored parcels per location for each future day.
+
+    current: (L,) parcels stored now; arrivals: (L, H) expected arrivals per day;
+    dwell_days: (L,) mean days a parcel stays before pickup. Pickups are modelled as a
+    daily hazard of 1/dwell, so each day keeps (1 - 1/dwell) of the stock and adds that
+    day's arrivals. Every location is advanced together; the loop is over days only.
+    Returns an (L, H) array.
+    """
+    keep = 1.0 - 1.0 / np.maximum(dwell_days, 1.0)
+    level = np.asarray(current, dtype=np.float64)
+    out = np.empty_like(arrivals, dtype=np.float64)
+    for h in range(arrivals.shape[1]):
+        level = level * keep + arrivals[:, h]
+        out[:, h] = level
+    return out
@@ -0,0 +1,151 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Add a Server-Timing header with the per-stage durations of each request
+SERVER_TIMING = os.environ.get('METRICS_SERVER_TIMING', '0') == '1'
+
+_HELP = {
+    'parcel_http_request_duration_seconds': ('histogram', 'Request latency by endpoint, method and status'),
+    'parcel_stage_duration_seconds': ('histogram', 'Latency of instrumented stages by endpoint and stage'),
+    'parcel_stage_errors_total': ('counter', 'Exceptions raised inside instrumented stages'),
+    'parcel_face_matches_total': ('counter', 'Face match attempts by endpoint and result (match or miss)'),
+    'parcel_db_queries_total': ('counter', 'SQL statements run by requests, by endpoint'),
+    'parcel_db_query_seconds_total': ('counter', 'Time spent in SQL statements by requests, by endpoint'),
+    'parcel_admission_in_flight': ('gauge', 'Requests running per admission-controlled endpoint'),
+    'parcel_admission_queued': ('gauge', 'Requests waiting for a slot per admission-controlled endpoint'),
+    'parcel_admission_rejected_total': ('counter', 'Requests rejected with 503 by endpoint and reason (queue_full or timeout)'),
+}
+
+# Metrics are kept per process; with several gunicorn workers each scrape sees one worker.
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> [count per bucket..., +Inf count, sum]
+_counters = {}  # (name, labels) -> value
+_gauges = {}  # (name, labels) -> current value
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def current_endpoint():
+    """Flask endpoint of the current request, or 'background' outside a request."""
+    if has_request_context():
+        return request.endpoint or 'unmatched'
+    return 'background'
+
+
+def observe(name, seconds, **labels):
+    """Record one `seconds` observation in histogram `name`."""
+    key = (name, _labels(labels))
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                h[i] += 1
+        h[len(BUCKETS)] += 1
+        h[-1] += seconds
+
+
+def inc(name, n=1, **labels):
+    """Add `n` to counter `name`."""
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+
+def set_gauge(name, value, **labels):
+    """Set gauge `name` to `value`."""
+    key = (name, _labels(labels))
+    with _lock:
+        _gauges[key] = value
+
+
+@contextmanager
+def stage(name):
+    """Time a block as stage `name` of the current request (or of 'background' work).
+
+        with stage('load_candidates'):
+            candidates = _load_candidates(session)
+
+    Feeds parcel_stage_duration_seconds, counts exceptions in parcel_stage_errors_total,
+    and adds the duration to the request's Server-Timing header when enabled."""
+    endpoint = current_endpoint()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc('parcel_stage_errors_total', endpoint=endpoint, stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe('parcel_stage_duration_seconds', elapsed, endpoint=endpoint, stage=name)
+        if has_request_context():
+            timings = g.setdefault('stage_timings', {})
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+def _before_request():
+    g.request_start = time.perf_counter()
+
+
+def _after_request(response):
+    start = g.get('request_start')
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    observe('parcel_http_request_duration_seconds', elapsed,
+            endpoint=current_endpoint(), method=request.method, status=str(response.status_code))
+    if SERVER_TIMING:
+        parts = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in g.get('stage_timings', {}).items()]
+        parts.append(f'total;dur={elapsed * 1000:.1f}')
+        response.headers['Server-Timing'] = ', '.join(parts)
+    return response
+
+
+def init_metrics(app):
+    """Time every request of `app`."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in items)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + '}'
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        histograms = {k: list(v) for k, v in _histograms.items()}
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+    lines = []
+    for name, (kind, help_text) in _HELP.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'histogram':
+            for (metric, labels), h in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(BUCKETS, h):
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {count}')
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {h[len(BUCKETS)]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {h[-1]:.6f}')
+                lines.append(f'{name}_count{_format_labels(labels)} {h[len(BUCKETS)]}')
+        else:
+            values = gauges if kind == 'gauge' else counters
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
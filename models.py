@@ -1,6 +1,6 @@
 import os
 import json
-from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, DateTime
+from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, DateTime, Date, Index, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from sqlalchemy.ext.declarative import declarative_base
@@ -8,7 +8,8 @@ from sqlalchemy.orm import sessionmaker
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, 'data.db')
-DATABASE_URL = f'sqlite:///{DB_PATH}'
+# DATABASE_URL overrides the default file, e.g. to point benchmarks at a scratch database
+DATABASE_URL = os.environ.get('DATABASE_URL', f'sqlite:///{DB_PATH}')
 
 Base = declarative_base()
 
@@ -20,6 +21,7 @@ class User(Base):
     phone = Column(String(50), nullable=True)
     face_uuid = Column(String(64), nullable=True, unique=True, index=True)  # Index for fast lookups
     embedding_json = Column(Text, nullable=False)
+    embedding_model = Column(String(100), nullable=True)  # face_recog model tag; NULL = unknown, never matched
     photo_path = Column(String(400), nullable=True)
 
 
@@ -27,6 +29,7 @@ class Parcel(Base):
     __tablename__ = 'parcels'
     id = Column(Integer, primary_key=True)
     tracking_code = Column(String(200), nullable=True, index=True)  # Index for tracking search
+    tracking_key = Column(String(200), nullable=True, index=True)  # Canonical tracking code (see tracking.py)
     owner_id = Column(Integer, ForeignKey('users.id'), nullable=True, index=True)  # Index for user parcels
     status = Column(String(50), default='stored', index=True)  # Index for filtering by status
     slot = Column(String(50), nullable=True)
@@ -38,6 +41,33 @@ class Parcel(Base):
 
     owner = relationship('User', backref='parcels')
 
+    __table_args__ = (
+        # A physical slot can hold only one stored parcel; this is what keeps concurrent
+        # workers from handing out the same slot (see storage.py)
+        Index('ux_parcels_stored_slot', 'storage_location', 'slot', unique=True,
+              sqlite_where=text("status = 'stored'")),
+        # Never reuse the id of a deleted (archived) parcel: ids are shared with
+        # parcels_archive, parcel_events, data_versions and SMS idempotency keys
+        {'sqlite_autoincrement': True},
+    )
+
+
+class ArchivedParcel(Base):
+    """Collected parcels moved out of `parcels` by archive.py. Same columns and ids as Parcel."""
+    __tablename__ = 'parcels_archive'
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    tracking_code = Column(String(200), nullable=True)
+    tracking_key = Column(String(200), nullable=True, index=True)
+    owner_id = Column(Integer, nullable=True, index=True)
+    status = Column(String(50), nullable=True)
+    slot = Column(String(50), nullable=True)
+    storage_location = Column(String(100), nullable=True)
+    estimated_delivery_days = Column(Integer, nullable=True)
+    arrival_time = Column(DateTime, nullable=True)
+    collected_time = Column(DateTime, nullable=True, index=True)
+    note = Column(Text, nullable=True)
+    archived_time = Column(DateTime, default=datetime.utcnow)
+
 
 class FaceSample(Base):
     __tablename__ = 'face_samples'
@@ -47,20 +77,76 @@ class FaceSample(Base):
     sample_uuid = Column(String(64), nullable=False)  # unique per synthetic sample
     image_path = Column(String(400), nullable=False)
     embedding_json = Column(Text, nullable=True)
+    embedding_model = Column(String(100), nullable=True)  # face_recog model tag; NULL = unknown, never matched
     created_at = Column(DateTime, default=datetime.utcnow)
 
     user = relationship('User', backref='samples')
 
 
-class TrackingVariation(Base):
-    __tablename__ = 'tracking_variations'
+class StorageLocation(Base):
+    __tablename__ = 'storage_locations'
     id = Column(Integer, primary_key=True)
-    parcel_id = Column(Integer, ForeignKey('parcels.id'), nullable=False)
-    original_code = Column(String(200), nullable=False)
-    variation_code = Column(String(200), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    name = Column(String(100), nullable=False, unique=True)  # matches Parcel.storage_location
+    capacity = Column(Integer, nullable=False, default=1)  # number of slots, numbered 1..capacity
+
+
+class ParcelCounter(Base):
+    """Materialized totals kept in step with parcels and users (see counters.py)."""
+    __tablename__ = 'parcel_counters'
+    dimension = Column(String(20), primary_key=True)  # 'status', 'location' or 'users'
+    key = Column(String(100), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class DailyArrival(Base):
+    """Parcels arrived per day (live and archived), maintained with parcel_counters."""
+    __tablename__ = 'daily_arrivals'
+    day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
 
-    parcel = relationship('Parcel', backref='tracking_variations')
+
+class ParcelEvent(Base):
+    """Committed parcel/user changes streamed by /events (events.py); also the replay log."""
+    __tablename__ = 'parcel_events'
+    __table_args__ = {'sqlite_autoincrement': True}  # ids are never reused after pruning
+    id = Column(Integer, primary_key=True)
+    type = Column(String(30), nullable=False)  # parcel-added, parcel-collected, user-registered
+    owner_id = Column(Integer, nullable=True, index=True)
+    payload = Column(Text, nullable=False)  # JSON sent as the event data
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class DataVersion(Base):
+    """Change counter per scope (see versions.py), used to build ETags for read endpoints."""
+    __tablename__ = 'data_versions'
+    scope = Column(String(100), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class PendingArrival(Base):
+    """A parcel arrival not yet announced to its owner; arrivals.py sends one digest per owner."""
+    __tablename__ = 'pending_arrivals'
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, nullable=False, index=True)
+    parcel_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class SmsOutbox(Base):
+    """Queued SMS messages, sent by the dispatcher in notifications.py."""
+    __tablename__ = 'sms_outbox'
+    id = Column(Integer, primary_key=True)
+    idempotency_key = Column(String(100), nullable=False, unique=True)  # same key is only queued once
+    to_number = Column(String(50), nullable=False)
+    body = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default='pending', index=True)  # pending, sending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    claim_token = Column(String(32), nullable=True, index=True)  # set by the dispatcher that claimed the row
+    provider_id = Column(String(100), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
 
 
 def init_db():
@@ -1,41 +1,292 @@
 import os
+import time
+import importlib.util
+import uuid
+import random
 import logging
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 
-try:
-    from twilio.rest import Client
-    _TWILIO_AVAILABLE = True
-except Exception:
-    _TWILIO_AVAILABLE = False
+from sqlalchemy import update, select
+from sqlalchemy.exc import IntegrityError
+
+# twilio itself is imported on the first send (TwilioTransport.client)
+_TWILIO_AVAILABLE = importlib.util.find_spec('twilio') is not None
 
 logger = logging.getLogger(__name__)
 
+# Outbox dispatcher settings
+SMS_CONCURRENCY = int(os.environ.get('SMS_CONCURRENCY', 4))  # messages in flight per process
+SMS_BATCH_SIZE = int(os.environ.get('SMS_BATCH_SIZE', 50))  # rows claimed per dispatch pass
+SMS_MAX_ATTEMPTS = int(os.environ.get('SMS_MAX_ATTEMPTS', 5))
+SMS_BACKOFF_SECONDS = float(os.environ.get('SMS_BACKOFF_SECONDS', 2.0))  # doubled after each failure
+SMS_MAX_BACKOFF_SECONDS = float(os.environ.get('SMS_MAX_BACKOFF_SECONDS', 300.0))
+SMS_POLL_INTERVAL = float(os.environ.get('SMS_POLL_INTERVAL', 1.0))
+# Seconds one provider call may take before it fails (and is retried with backoff)
+SMS_SEND_TIMEOUT = float(os.environ.get('SMS_SEND_TIMEOUT', 10.0))
+# A claimed row whose dispatcher died is retried after this many seconds. A whole batch is
+# claimed at once and sent SMS_CONCURRENCY at a time, so the default leaves twice the time
+# the slowest batch can take: a live claim must never expire, or a second dispatcher would
+# send the same messages again
+SMS_CLAIM_LEASE_SECONDS = float(os.environ.get(
+    'SMS_CLAIM_LEASE_SECONDS',
+    max(300.0, 2 * -(-SMS_BATCH_SIZE // SMS_CONCURRENCY) * SMS_SEND_TIMEOUT)))
+
+
+class LogTransport:
+    """Used when no provider is configured: logs the message instead of sending it."""
+    name = 'log'
+    delivers = False
+
+    def send(self, to_number, body, idempotency_key):
+        logger.info('SMS to %s: %s', to_number, body)
+        return None
+
+
+class TwilioTransport:
+    """Sends through Twilio with one Client (and its HTTP connection pool) for the process."""
+    name = 'twilio'
+    delivers = True
+
+    def __init__(self, sid, token, from_number):
+        self.sid = sid
+        self.token = token
+        self.from_number = from_number
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # Built on the first send so twilio is not imported at app startup
+        with self._lock:
+            if self._client is None:
+                from twilio.http.http_client import TwilioHttpClient
+                from twilio.rest import Client
+                self._client = Client(self.sid, self.token, http_client=TwilioHttpClient(timeout=SMS_SEND_TIMEOUT))
+            return self._client
+
+    def send(self, to_number, body, idempotency_key):
+        message = self.client.messages.create(body=body, from_=self.from_number, to=to_number)
+        return getattr(message, 'sid', '')
+
+
+class StubTransport:
+    """Offline transport for development and load tests (SMS_TRANSPORT=stub).
+
+    Waits SMS_STUB_LATENCY_MS per message, fails SMS_STUB_FAILURE_RATE of calls, and
+    delivers each idempotency key at most once, like a provider honouring idempotency keys.
+    """
+    name = 'stub'
+    delivers = True
+
+    def __init__(self, latency_ms=None, failure_rate=None):
+        self.latency = float(os.environ.get('SMS_STUB_LATENCY_MS', 50) if latency_ms is None else latency_ms) / 1000.0
+        self.failure_rate = float(os.environ.get('SMS_STUB_FAILURE_RATE', 0) if failure_rate is None else failure_rate)
+        self.sent = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def send(self, to_number, body, idempotency_key):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            if idempotency_key in self.sent:
+                return self.sent[idempotency_key]['id']
+            if random.random() < self.failure_rate:
+                raise RuntimeError('stub provider error')
+            provider_id = f'stub-{uuid.uuid4().hex[:12]}'
+            self.sent[idempotency_key] = {'id': provider_id, 'to': to_number, 'body': body}
+            return provider_id
+
+
+_transport = None
+_transport_lock = threading.Lock()
 
-def send_sms(to_number: str, body: str) -> bool:
-    """Send SMS using Twilio if credentials are present. Returns True on success or False otherwise.
 
+def get_transport():
+    """Return the process-wide transport, chosen once from SMS_TRANSPORT (twilio, stub or log).
+    By default Twilio is used when TWILIO_ACCOUNT_SID/TWILIO_AUTH_TOKEN/TWILIO_FROM are set."""
+    global _transport
+    with _transport_lock:
+        if _transport is not None:
+            return _transport
+        choice = os.environ.get('SMS_TRANSPORT', '').lower()
+        sid = os.environ.get('TWILIO_ACCOUNT_SID')
+        token = os.environ.get('TWILIO_AUTH_TOKEN')
+        from_number = os.environ.get('TWILIO_FROM')
+        if choice == 'stub':
+            _transport = StubTransport()
+        elif choice == 'log' or not (sid and token and from_number):
+            if choice == 'twilio' or not choice:
+                logger.info('Twilio credentials not configured; skipping SMS send. To enable, set TWILIO_ACCOUNT_SID/TWILIO_AUTH_TOKEN/TWILIO_FROM')
+            _transport = LogTransport()
+        elif not _TWILIO_AVAILABLE:
+            logger.warning('twilio package not installed; cannot send SMS')
+            _transport = LogTransport()
+        else:
+            _transport = TwilioTransport(sid, token, from_number)
+        return _transport
+
+
+def set_transport(transport):
+    """Replace the process-wide transport (e.g. a StubTransport in load tests)."""
+    global _transport
+    with _transport_lock:
+        _transport = transport
+
+
+def send_sms(to_number: str, body: str, idempotency_key: str = None) -> bool:
+    """Queue an SMS in the outbox for the background dispatcher. Returns True if the message
+    is queued (or was already queued under the same idempotency_key) and False otherwise.
+
+    Nothing is sent inline. Without a configured provider the message is only logged, as before.
     Environment variables:
     - TWILIO_ACCOUNT_SID
     - TWILIO_AUTH_TOKEN
     - TWILIO_FROM
+    - SMS_TRANSPORT (optional: twilio, stub or log)
     """
-    sid = os.environ.get('TWILIO_ACCOUNT_SID')
-    token = os.environ.get('TWILIO_AUTH_TOKEN')
-    from_number = os.environ.get('TWILIO_FROM')
-
-    if not sid or not token or not from_number:
-        logger.info('Twilio credentials not configured; skipping SMS send. To enable, set TWILIO_ACCOUNT_SID/TWILIO_AUTH_TOKEN/TWILIO_FROM')
-        logger.info('SMS to %s: %s', to_number, body)
+    transport = get_transport()
+    if not transport.delivers:
+        transport.send(to_number, body, idempotency_key)
         return False
 
-    if not _TWILIO_AVAILABLE:
-        logger.warning('twilio package not installed; cannot send SMS')
+    from models import get_session, SmsOutbox
+    session = get_session()
+    try:
+        session.add(SmsOutbox(
+            idempotency_key=idempotency_key or uuid.uuid4().hex,
+            to_number=to_number,
+            body=body,
+        ))
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        logger.info('SMS with idempotency key %s already queued', idempotency_key)
+    except Exception as e:
+        session.rollback()
+        logger.exception('Failed to queue SMS: %s', e)
         return False
+    finally:
+        session.close()
+    if _dispatcher is not None:
+        _dispatcher.wake()
+    return True
+
+
+def _backoff(attempts):
+    return min(SMS_BACKOFF_SECONDS * (2 ** (attempts - 1)), SMS_MAX_BACKOFF_SECONDS)
+
 
+def _send_one(transport, row):
     try:
-        client = Client(sid, token)
-        message = client.messages.create(body=body, from_=from_number, to=to_number)
-        logger.info('Sent SMS SID=%s', getattr(message, 'sid', ''))
-        return True
+        return row.id, transport.send(row.to_number, row.body, row.idempotency_key), None
     except Exception as e:
-        logger.exception('Failed to send SMS: %s', e)
-        return False
+        return row.id, None, str(e)
+
+
+def dispatch_pending(limit=SMS_BATCH_SIZE, executor=None, transport=None):
+    """Claim up to `limit` due outbox rows, send them with bounded concurrency and record
+    the outcome. Failures are retried with exponential backoff up to SMS_MAX_ATTEMPTS.
+    Returns the number of rows processed. Safe to run from several processes at once: rows
+    are claimed with a token, a claim expires after SMS_CLAIM_LEASE_SECONDS, and outcomes are
+    only written while the row still carries this pass's token (a row whose claim expired
+    and was taken over is left to the new owner)."""
+    from models import get_session, SmsOutbox
+    transport = transport or get_transport()
+    session = get_session()
+    try:
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        due = (select(SmsOutbox.id)
+               .where(SmsOutbox.status.in_(['pending', 'sending']), SmsOutbox.next_attempt_at <= now)
+               .order_by(SmsOutbox.id)
+               .limit(limit))
+        session.execute(
+            update(SmsOutbox)
+            .where(SmsOutbox.id.in_(due), SmsOutbox.status.in_(['pending', 'sending']))
+            .values(status='sending', claim_token=token,
+                    next_attempt_at=now + timedelta(seconds=SMS_CLAIM_LEASE_SECONDS))
+        )
+        session.commit()
+        rows = session.query(SmsOutbox).filter(SmsOutbox.claim_token == token).all()
+        if not rows:
+            return 0
+
+        if executor is not None:
+            outcomes = list(executor.map(lambda r: _send_one(transport, r), rows))
+        else:
+            outcomes = [_send_one(transport, r) for r in rows]
+
+        attempts = {r.id: r.attempts + 1 for r in rows}
+        for row_id, provider_id, error in outcomes:
+            values = {'attempts': attempts[row_id], 'claim_token': None}
+            if error is None:
+                logger.info('Sent SMS SID=%s', provider_id)
+                values.update(status='sent', provider_id=provider_id, sent_at=datetime.utcnow(), last_error=None)
+            elif attempts[row_id] >= SMS_MAX_ATTEMPTS:
+                values.update(status='failed', last_error=error)
+                logger.warning('Giving up on SMS %s after %d attempts: %s', row_id, attempts[row_id], error)
+            else:
+                values.update(status='pending', last_error=error,
+                              next_attempt_at=datetime.utcnow() + timedelta(seconds=_backoff(attempts[row_id])))
+            written = session.execute(
+                update(SmsOutbox)
+                .where(SmsOutbox.id == row_id, SmsOutbox.claim_token == token)
+                .values(**values)
+            ).rowcount
+            if not written:
+                logger.warning('Claim on SMS %s expired during the send; leaving it to its new owner', row_id)
+        session.commit()
+        return len(rows)
+    finally:
+        session.close()
+
+
+class OutboxDispatcher:
+    """Background thread draining the outbox with SMS_CONCURRENCY sends in flight."""
+
+    def __init__(self, concurrency=SMS_CONCURRENCY, batch_size=SMS_BATCH_SIZE, poll_interval=SMS_POLL_INTERVAL):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='sms-send')
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sms-dispatcher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = dispatch_pending(self.batch_size, executor=self._executor)
+            except Exception:
+                logger.exception('SMS dispatch pass failed')
+                processed = 0
+            if processed < self.batch_size:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+
+_dispatcher = None
+
+
+def start_dispatcher():
+    """Start this process's outbox dispatcher (no-op without a delivering transport)."""
+    global _dispatcher
+    if _dispatcher is not None or not get_transport().delivers:
+        return _dispatcher
+    _dispatcher = OutboxDispatcher()
+    _dispatcher.start()
+    return _dispatcher
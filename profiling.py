@@ -0,0 +1,130 @@
+import os
+import re
+import hmac
+import time
+import cProfile
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Shared secret for the profiling header and the /admin/profiles endpoints; unset disables both
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+# Number of most recent .prof files kept (across all worker processes)
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 20))
+
+_NAME_RE = re.compile(r'^[\w.-]+\.prof$')
+# cProfile can only run one profiler at a time in some Python versions
+_busy = threading.Lock()
+
+
+def is_admin(headers):
+    """True when `headers` carry the configured ADMIN_TOKEN in X-Admin-Token."""
+    token = headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def _wants_profile(environ):
+    if environ.get('PATH_INFO') == '/events':  # an open-ended stream; it would be buffered
+        return False
+    return environ.get('HTTP_X_PROFILE') == '1' or 'profile=1' in environ.get('QUERY_STRING', '').split('&')
+
+
+def _save(profiler, environ, seconds):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = re.sub(r'[^\w]+', '_', environ.get('PATH_INFO', '')).strip('_') or 'root'
+    name = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{environ.get('REQUEST_METHOD', 'GET')}-{path[:60]}-{seconds * 1000:.0f}ms.prof"
+    tmp = os.path.join(PROFILE_DIR, f'.{name}.tmp')
+    profiler.dump_stats(tmp)
+    os.replace(tmp, os.path.join(PROFILE_DIR, name))
+    for old in list_profiles()[PROFILE_KEEP:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, old['name']))
+        except OSError:
+            pass
+    return name
+
+
+class ProfilingMiddleware:
+    """Runs a request under cProfile when it sends `X-Profile: 1` (or `?profile=1`) together
+    with a valid X-Admin-Token, and keeps the last PROFILE_KEEP results in PROFILE_DIR.
+    Requests without the flag go straight through."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if not (ADMIN_TOKEN and _wants_profile(environ)):
+            return self.wsgi_app(environ, start_response)
+        if not is_admin({'X-Admin-Token': environ.get('HTTP_X_ADMIN_TOKEN', '')}):
+            return self.wsgi_app(environ, start_response)
+        if not _busy.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+        try:
+            return self._profiled(environ, start_response)
+        finally:
+            _busy.release()
+
+    def _profiled(self, environ, start_response):
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured['args'] = (status, list(headers), exc_info)
+            return lambda data: captured.setdefault('written', []).append(data)
+
+        # The body is consumed inside the profiler so lazily generated responses are included
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            result = self.wsgi_app(environ, capture)
+            try:
+                body = captured.get('written', []) + list(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        finally:
+            profiler.disable()
+        seconds = time.perf_counter() - start
+        status, headers, exc_info = captured['args']
+        try:
+            headers.append(('X-Profile-Id', _save(profiler, environ, seconds)))
+        except OSError:
+            logger.exception('Could not save profile')
+        start_response(status, headers, exc_info)
+        return body
+
+
+def init_profiling(app):
+    """Wrap `app` so admins can profile individual requests."""
+    app.wsgi_app = ProfilingMiddleware(app.wsgi_app)
+
+
+def list_profiles():
+    """Saved profiles, newest first."""
+    try:
+        names = [n for n in os.listdir(PROFILE_DIR) if _NAME_RE.match(n)]
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in sorted(names, reverse=True):
+        try:
+            stat = os.stat(os.path.join(PROFILE_DIR, name))
+        except OSError:
+            continue
+        profiles.append({
+            'name': name,
+            'size': stat.st_size,
+            'created_at': datetime.utcfromtimestamp(stat.st_mtime).isoformat() + 'Z',
+        })
+    return profiles
+
+
+def profile_path(name):
+    """Absolute path of saved profile `name`, or None if it is not a saved profile."""
+    if not _NAME_RE.match(name) or name.startswith('.'):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
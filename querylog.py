@@ -0,0 +1,114 @@
+import os
+import time
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from metrics import current_endpoint, inc, SERVER_TIMING
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than this are logged with their EXPLAIN QUERY PLAN
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+# The same statement run this many times in one request is reported as a likely N+1
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 20))
+
+# Every engine is instrumented (get_engine() creates one per session). Queries are
+# attributed to the Flask request running on the same thread, and to any
+# capture_queries()/query_budget() blocks active on that thread.
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised by query_budget() when a block runs more statements than allowed."""
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    for captured in getattr(_local, 'captures', ()):
+        captured.append((statement, parameters, elapsed))
+    if has_request_context():
+        stats = g.setdefault('sql', {'count': 0, 'seconds': 0.0, 'statements': Counter()})
+        stats['count'] += 1
+        stats['seconds'] += elapsed
+        stats['statements'][statement] += 1
+        if SERVER_TIMING:
+            timings = g.setdefault('stage_timings', {})
+            timings['db'] = timings.get('db', 0.0) + elapsed
+    if elapsed * 1000.0 >= SLOW_QUERY_MS:
+        logger.warning('Slow query (%.1f ms, endpoint %s): %s %r\n%s', elapsed * 1000.0, current_endpoint(),
+                       statement, parameters, _explain(cursor, statement, parameters, executemany))
+
+
+def _explain(cursor, statement, parameters, executemany):
+    """EXPLAIN QUERY PLAN for a SELECT, run on the raw DBAPI connection so it is not itself
+    instrumented."""
+    if executemany or not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return '(no plan)'
+    try:
+        rows = cursor.connection.execute('EXPLAIN QUERY PLAN ' + statement, parameters or ()).fetchall()
+    except Exception as e:
+        return f'(plan unavailable: {e})'
+    return '\n'.join(f'  {row[-1]}' for row in rows)
+
+
+def _after_request(response):
+    stats = g.get('sql')
+    if not stats:
+        return response
+    endpoint = current_endpoint()
+    inc('parcel_db_queries_total', stats['count'], endpoint=endpoint)
+    inc('parcel_db_query_seconds_total', round(stats['seconds'], 6), endpoint=endpoint)
+    statement, repeats = stats['statements'].most_common(1)[0]
+    if repeats >= N_PLUS_ONE_THRESHOLD:
+        logger.warning('Possible N+1 in %s %s: %d queries, one statement ran %d times: %s',
+                       request.method, request.path, stats['count'], repeats, statement)
+    if SERVER_TIMING:
+        response.headers['X-Query-Count'] = str(stats['count'])
+    return response
+
+
+def init_querylog(app):
+    """Count queries and SQL time per request of `app`, and report likely N+1s."""
+    app.after_request(_after_request)
+
+
+@contextmanager
+def capture_queries():
+    """Collect (statement, parameters, seconds) for every SQL statement run on this thread
+    inside the block."""
+    captured = []
+    captures = _local.__dict__.setdefault('captures', [])
+    captures.append(captured)
+    try:
+        yield captured
+    finally:
+        captures.remove(captured)
+
+
+@contextmanager
+def query_budget(max_queries):
+    """Fail if the block runs more than `max_queries` SQL statements on this thread.
+
+        with query_budget(4):
+            client.get('/api/users')
+
+    Raises QueryBudgetExceeded (an AssertionError) listing the statements. Used by
+    scripts/check_query_budgets.py to catch N+1 regressions before they ship."""
+    with capture_queries() as captured:
+        yield captured
+    if len(captured) > max_queries:
+        counts = Counter(statement for statement, _, _ in captured).most_common()
+        detail = '\n'.join(f'  {n}x {s}' for s, n in counts)
+        raise QueryBudgetExceeded(f'{len(captured)} queries, budget {max_queries}:\n{detail}')
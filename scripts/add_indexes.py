@@ -1,71 +1,68 @@
 """
-Add database indexes for performance optimization
-This script adds indexes to frequently queried columns
+Bring the database's indexes in line with the ones declared in models.py.
+
+SQLAlchemy's create_all() only adds indexes when it creates a table, so databases
+created before an index was declared are missing it. This script creates every
+declared index that is missing, then drops indexes that are not declared but cover
+exactly the same columns as a declared one (such as the idx_* indexes earlier
+versions of this script created next to the ix_* ones), which only slow writes down.
+Safe to run more than once.
+
+Usage: python scripts/add_indexes.py [--dry-run]
 """
 import sys
 import os
+import argparse
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from sqlalchemy import create_engine, text
-from models import DATABASE_URL
+from models import Base, DATABASE_URL
+
+
+def existing_indexes(conn, table):
+    """{name: (columns, partial)} for the explicitly created indexes on `table`."""
+    indexes = {}
+    for _, name, _, origin, partial in conn.execute(text(f'PRAGMA index_list("{table}")')):
+        if origin != 'c':  # skip automatic indexes behind PRIMARY KEY / UNIQUE constraints
+            continue
+        columns = tuple(row[2] for row in conn.execute(text(f'PRAGMA index_info("{name}")')))
+        indexes[name] = (columns, bool(partial))
+    return indexes
 
-def add_indexes():
-    """Add indexes to improve query performance"""
+
+def add_indexes(dry_run=False):
+    """Create missing declared indexes and drop duplicates of them"""
     engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-    
-    with engine.connect() as conn:
-        print("Adding database indexes for performance optimization...")
-        
-        try:
-            # Add index on users.face_uuid (if not exists)
-            conn.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_users_face_uuid ON users(face_uuid)
-            """))
-            print("✓ Added index on users.face_uuid")
-            
-            # Add index on parcels.tracking_code
-            conn.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_parcels_tracking_code ON parcels(tracking_code)
-            """))
-            print("✓ Added index on parcels.tracking_code")
-            
-            # Add index on parcels.owner_id
-            conn.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_parcels_owner_id ON parcels(owner_id)
-            """))
-            print("✓ Added index on parcels.owner_id")
-            
-            # Add index on parcels.status
-            conn.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_parcels_status ON parcels(status)
-            """))
-            print("✓ Added index on parcels.status")
-            
-            # Add index on parcels.arrival_time
-            conn.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_parcels_arrival_time ON parcels(arrival_time)
-            """))
-            print("✓ Added index on parcels.arrival_time")
-            
-            # Add index on face_samples.user_id
-            conn.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_face_samples_user_id ON face_samples(user_id)
-            """))
-            print("✓ Added index on face_samples.user_id")
-            
-            # Add index on face_samples.face_uuid
-            conn.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_face_samples_face_uuid ON face_samples(face_uuid)
-            """))
-            print("✓ Added index on face_samples.face_uuid")
-            
-            conn.commit()
-            print("\n✅ All indexes added successfully!")
-            print("📈 Database queries will now be significantly faster!")
-            
-        except Exception as e:
-            print(f"❌ Error adding indexes: {e}")
-            conn.rollback()
+    created = dropped = 0
+
+    with engine.begin() as conn:
+        tables = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+        for table in Base.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            present = existing_indexes(conn, table.name)
+            declared = {}
+            for index in table.indexes:
+                columns = tuple(c.name for c in index.columns)
+                partial = index.dialect_options['sqlite'].get('where') is not None
+                declared[index.name] = (columns, partial)
+                if index.name not in present:
+                    print(f"+ {index.name} ON {table.name}({', '.join(columns)})")
+                    if not dry_run:
+                        index.create(conn)
+                    created += 1
+            for name, spec in present.items():
+                if name not in declared and spec in declared.values():
+                    print(f"- {name} ON {table.name}({', '.join(spec[0])}) duplicates a declared index")
+                    if not dry_run:
+                        conn.execute(text(f'DROP INDEX "{name}"'))
+                    dropped += 1
+
+    verb = 'Would create' if dry_run else 'Created'
+    print(f"{verb} {created} index(es); {'would drop' if dry_run else 'dropped'} {dropped} duplicate(s)")
+
 
 if __name__ == '__main__':
-    add_indexes()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help='print the changes without applying them')
+    add_indexes(parser.parse_args().dry_run)
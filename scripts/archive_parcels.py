@@ -0,0 +1,31 @@
+"""
+Move old collected parcels from parcels to parcels_archive.
+
+Runs in chunks, one transaction each, so it can be interrupted and re-run at
+any time (e.g. from cron). Defaults come from PARCEL_ARCHIVE_DAYS and
+PARCEL_ARCHIVE_BATCH_SIZE.
+
+Usage: python scripts/archive_parcels.py [--days 30] [--batch-size 500] [--max-batches N]
+"""
+import os
+import sys
+import argparse
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import init_db
+from archive import archive_collected, ArchiveConflictError, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Archive collected parcels')
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS, help='archive parcels collected more than this many days ago')
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='parcels moved per transaction')
+    parser.add_argument('--max-batches', type=int, default=None, help='stop after this many batches')
+    args = parser.parse_args()
+
+    init_db()
+    try:
+        moved = archive_collected(older_than_days=args.days, batch_size=args.batch_size, max_batches=args.max_batches)
+    except ArchiveConflictError as e:
+        print(f'Stopped: {e}')
+        sys.exit(1)
+    print(f'Archived {moved} parcels collected more than {args.days} days ago')
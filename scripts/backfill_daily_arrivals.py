@@ -0,0 +1,18 @@
+"""
+Backfill the daily_arrivals rollup used by /forecast and /dashboard/summary.
+
+The app keeps daily_arrivals current as parcels are inserted; run this once on
+databases created before the table existed, or after editing parcels by hand.
+"""
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import get_session, init_db
+from counters import rebuild_daily_arrivals
+
+if __name__ == '__main__':
+    init_db()
+    session = get_session()
+    days = rebuild_daily_arrivals(session)
+    print(f'Backfilled daily_arrivals for {days} days')
@@ -0,0 +1,331 @@
+"""
+Benchmark the SQL behind the read routes and guard their query plans.
+
+Seeds a scratch SQLite database (the real data.db is never touched) with --users users,
+--samples-per-user face samples each (tagged with the current embedding model, so
+/recognize loads them like real rows), --parcels parcels (a mix of stored and collected,
+arriving over the past year, with canonical tracking keys) and --archived archived
+parcels. It calls each read route once through the Flask test client, capturing the
+SQL it runs with querylog.capture_queries(); routes in WARM_ROUTES are called once
+before that, so their steady-state queries are captured rather than a one-off warm-up.
+Then, for every captured SELECT, it:
+  - re-runs the statement --runs times on a raw connection and records median/p95 ms;
+  - snapshots its EXPLAIN QUERY PLAN.
+
+Both are compared with a stored baseline (default scripts/bench_db_baseline.json).
+The script exits 1 if:
+  - a table that the baseline plan reached through an index (SEARCH, or SCAN ... USING
+    INDEX) is now read with a full SCAN, or
+  - a query's median is more than --tolerance times the baseline and more than
+    --min-delta-ms slower.
+Write or refresh the baseline with --update-baseline after an intended change.
+
+--index-report times every query once more with each index it uses dropped (inside a
+transaction that is rolled back), which measures what each index actually buys.
+
+The seeded tracking_key column replaces the old tracking_variations table, which
+scripts/migrate_tracking_keys.py collapsed into parcels.
+
+Usage: python scripts/bench_db.py [--users 2000] [--parcels 50000] [--runs 20]
+           [--baseline FILE] [--update-baseline] [--index-report] [--json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_BASELINE = os.path.join(ROOT, 'scripts', 'bench_db_baseline.json')
+LOCATION_CAPACITY = 100
+# The first /recognize builds the embedding index snapshot from every stored embedding;
+# later ones only read the embeddings added since (see embedding_index.py)
+WARM_ROUTES = {'POST /recognize'}
+
+
+def seed(models, args):
+    """Fill the scratch database with Core inserts (no ORM listeners; the app rebuilds
+    its counters and rollups from these rows when it is imported)."""
+    from sqlalchemy import insert
+    from face_recog import current_model
+    from tracking import canonicalize_tracking_code
+    rng = random.Random(args.seed)
+    engine = models.get_engine()
+    model = current_model()  # untagged rows would never be read by /recognize
+    embedding = json.dumps([round(rng.gauss(0, 1), 6) for _ in range(args.embedding_dim)])
+    now = datetime.utcnow()
+
+    def chunks(rows, size=2000):
+        for i in range(0, len(rows), size):
+            yield rows[i:i + size]
+
+    with engine.begin() as conn:
+        users = [{'id': i, 'name': f'Bench User {i}', 'phone': f'+1555{i:07d}', 'face_uuid': f'{i:06X}',
+                  'embedding_json': embedding, 'embedding_model': model} for i in range(1, args.users + 1)]
+        for chunk in chunks(users):
+            conn.execute(insert(models.User), chunk)
+        samples = [{'user_id': u, 'face_uuid': f'{u:06X}', 'sample_uuid': f'{u}-{s}', 'image_path': '',
+                    'embedding_json': embedding, 'embedding_model': model}
+                   for u in range(1, args.users + 1) for s in range(args.samples_per_user)]
+        for chunk in chunks(samples):
+            conn.execute(insert(models.FaceSample), chunk)
+
+        stored = int(args.parcels * args.stored_fraction)
+        locations = -(-stored // LOCATION_CAPACITY) or 1
+        conn.execute(insert(models.StorageLocation), [
+            {'name': f'Bench Shelf {i}', 'capacity': LOCATION_CAPACITY} for i in range(1, locations + 1)])
+        parcels = []
+        for i in range(1, args.parcels + 1):
+            code = f'1Z{rng.randrange(10 ** 12):012d}'
+            arrival = now - timedelta(days=rng.random() * 365)
+            is_stored = i <= stored
+            parcels.append({
+                'id': i, 'tracking_code': code, 'tracking_key': canonicalize_tracking_code(code),
+                'owner_id': rng.randint(1, args.users),
+                'status': 'stored' if is_stored else 'collected',
+                'storage_location': f'Bench Shelf {(i - 1) // LOCATION_CAPACITY + 1}',
+                'slot': str((i - 1) % LOCATION_CAPACITY + 1),
+                'estimated_delivery_days': rng.randint(1, 10), 'arrival_time': arrival,
+                'collected_time': None if is_stored else arrival + timedelta(hours=rng.random() * 72),
+            })
+        for chunk in chunks(parcels):
+            conn.execute(insert(models.Parcel), chunk)
+
+        archived = []
+        for i in range(args.parcels + 1, args.parcels + args.archived + 1):
+            code = f'1Z{rng.randrange(10 ** 12):012d}'
+            arrival = now - timedelta(days=365 + rng.random() * 365)
+            archived.append({
+                'id': i, 'tracking_code': code, 'tracking_key': canonicalize_tracking_code(code),
+                'owner_id': rng.randint(1, args.users), 'status': 'collected',
+                'arrival_time': arrival, 'collected_time': arrival + timedelta(hours=24), 'archived_time': now,
+            })
+        for chunk in chunks(archived):
+            conn.execute(insert(models.ArchivedParcel), chunk)
+    engine.dispose()
+    return parcels[-1], archived[-1] if archived else None
+
+
+def face_image():
+    import base64
+    import cv2
+    import numpy as np
+    ok, buf = cv2.imencode('.jpg', (np.random.default_rng(0).random((120, 120, 3)) * 255).astype(np.uint8))
+    return 'data:image/jpeg;base64,' + base64.b64encode(buf.tobytes()).decode()
+
+
+def routes(parcel, archived):
+    owner = parcel['owner_id']
+    face_uuid = f'{owner:06X}'
+    calls = [
+        ('GET /status', 'GET', '/status', None),
+        ('GET /api/users', 'GET', '/api/users', None),
+        ('GET /track_orders', 'GET', '/track_orders', None),
+        ('GET /track_orders?owner_id', 'GET', f'/track_orders?owner_id={owner}', None),
+        ('GET /track/<face_uuid>', 'GET', f'/track/{face_uuid}', None),
+        ('GET /track/<face_uuid>/history', 'GET', f'/track/{face_uuid}/history', None),
+        ('POST /search', 'POST', '/search', {'tracking_code': parcel['tracking_code'], 'face_uuid': face_uuid}),
+        ('GET /dashboard/summary', 'GET', '/dashboard/summary', None),
+        ('GET /forecast', 'GET', '/forecast?days=7&model=moving_average', None),
+        ('POST /recognize', 'POST', '/recognize', {'image': face_image()}),
+    ]
+    if archived:
+        calls.append(('POST /search include_history', 'POST', '/search', {
+            'tracking_code': archived['tracking_code'], 'face_uuid': f"{archived['owner_id']:06X}", 'include_history': True}))
+    return calls
+
+
+def capture(app, calls):
+    from querylog import capture_queries
+    client = app.test_client()
+    queries = []
+    for label, method, path, payload in calls:
+        if label in WARM_ROUTES:
+            client.open(path, method=method, json=payload)
+        with capture_queries() as captured:
+            response = client.open(path, method=method, json=payload)
+        if response.status_code >= 500:
+            print(f'  {label}: HTTP {response.status_code}, skipped')
+            continue
+        seen = set()
+        for statement, parameters, _ in captured:
+            if not statement.lstrip().upper().startswith(('SELECT', 'WITH')) or statement in seen:
+                continue
+            seen.add(statement)
+            queries.append({'route': label, 'sql': ' '.join(statement.split()), 'raw': statement,
+                            'params': list(parameters or ())})
+    return queries
+
+
+def plan(conn, query):
+    rows = conn.execute('EXPLAIN QUERY PLAN ' + query['raw'], query['params']).fetchall()
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan_lines):
+    """Tables read with a full SCAN (no index) in an EXPLAIN QUERY PLAN."""
+    tables = set()
+    for line in plan_lines:
+        words = line.split()
+        if len(words) >= 2 and words[0] == 'SCAN' and 'USING' not in words:
+            tables.add(words[1])
+    return tables
+
+
+def indexed_tables(plan_lines):
+    tables = set()
+    for line in plan_lines:
+        words = line.split()
+        if len(words) >= 2 and (words[0] == 'SEARCH' or (words[0] == 'SCAN' and 'USING' in words)):
+            tables.add(words[1])
+    return tables
+
+
+def used_indexes(plan_lines):
+    names = set()
+    for line in plan_lines:
+        words = line.split()
+        if 'INDEX' in words and words.index('INDEX') + 1 < len(words):
+            name = words[words.index('INDEX') + 1]
+            if not name.startswith('sqlite_autoindex'):
+                names.add(name)
+    return names
+
+
+def time_query(conn, query, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        conn.execute(query['raw'], query['params']).fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+def index_report(conn, queries, runs):
+    """Median ms of each query with and without each index it uses."""
+    report = []
+    for q in queries:
+        for name in sorted(used_indexes(q['plan'])):
+            conn.execute('BEGIN')
+            try:
+                conn.execute(f'DROP INDEX "{name}"')
+                without, _ = time_query(conn, q, runs)
+                without_plan = plan(conn, q)
+            finally:
+                conn.execute('ROLLBACK')
+            report.append({'route': q['route'], 'index': name, 'with_ms': q['median_ms'], 'without_ms': round(without, 3),
+                           'speedup': round(without / q['median_ms'], 1) if q['median_ms'] else None,
+                           'plan_without': without_plan})
+    return report
+
+
+def compare(queries, baseline, tolerance, min_delta_ms):
+    """Failures against the baseline: index -> full scan changes and latency regressions."""
+    old = {(q['route'], q['sql']): q for q in baseline['queries']}
+    failures, notes = [], []
+    for q in queries:
+        b = old.pop((q['route'], q['sql']), None)
+        if b is None:
+            notes.append(f"new query in {q['route']}: {q['sql'][:100]}")
+            continue
+        lost = indexed_tables(b['plan']) & full_scans(q['plan'])
+        if lost:
+            failures.append(f"{q['route']}: full scan of {', '.join(sorted(lost))} (was indexed)\n"
+                            f"      {q['sql'][:160]}\n      before: {b['plan']}\n      now:    {q['plan']}")
+        if q['median_ms'] > b['median_ms'] * tolerance and q['median_ms'] - b['median_ms'] > min_delta_ms:
+            failures.append(f"{q['route']}: {b['median_ms']:.3f} -> {q['median_ms']:.3f} ms\n      {q['sql'][:160]}")
+    for route, sql in old:
+        notes.append(f'query no longer run by {route}: {sql[:100]}')
+    return failures, notes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--samples-per-user', type=int, default=5)
+    parser.add_argument('--parcels', type=int, default=50000)
+    parser.add_argument('--archived', type=int, default=20000)
+    parser.add_argument('--stored-fraction', type=float, default=0.1)
+    parser.add_argument('--embedding-dim', type=int, default=128)
+    parser.add_argument('--runs', type=int, default=20, help='timed executions per query (default 20)')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=2.0, help='allowed median slowdown factor (default 2.0)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='ignore slowdowns smaller than this (default 1 ms)')
+    parser.add_argument('--index-report', action='store_true', help='also time each query without each index it uses')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    db_path = os.path.join(tmp, 'bench.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.setdefault('SMS_TRANSPORT', 'log')
+    os.environ['SLOW_QUERY_MS'] = os.environ.get('SLOW_QUERY_MS', '1000000')
+    import models
+    models.init_db()
+    print(f'Seeding {args.users} users, {args.parcels} parcels, {args.archived} archived ...')
+    parcel, archived = seed(models, args)
+    import app as app_module  # backfills counters and daily arrivals from the seeded rows
+
+    queries = capture(app_module.app, routes(parcel, archived))
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute('ANALYZE')
+    for q in queries:
+        q['plan'] = plan(conn, q)
+        q['median_ms'], q['p95_ms'] = (round(v, 3) for v in time_query(conn, q, args.runs))
+
+    params = {k: getattr(args, k) for k in ('users', 'samples_per_user', 'parcels', 'archived', 'stored_fraction', 'embedding_dim')}
+    report = {'sqlite': sqlite3.sqlite_version, 'params': params,
+              'queries': [{k: q[k] for k in ('route', 'sql', 'plan', 'median_ms', 'p95_ms')} for q in queries]}
+    if args.index_report:
+        report['indexes'] = index_report(conn, queries, max(3, args.runs // 4))
+
+    if not args.json:
+        route = None
+        for q in queries:
+            if q['route'] != route:
+                route = q['route']
+                print(route)
+            scans = full_scans(q['plan'])
+            print(f"  {q['median_ms']:9.3f} ms (p95 {q['p95_ms']:.3f})  {q['sql'][:90]}")
+            for line in q['plan']:
+                print(f"      {'!' if line.split()[1:2] and line.split()[1] in scans else ' '} {line}")
+        for r in report.get('indexes', []):
+            print(f"  {r['index']:32s} {r['route']:30s} {r['with_ms']:9.3f} ms -> {r['without_ms']:9.3f} ms without"
+                  f"  ({r['speedup']}x)")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({k: report[k] for k in ('sqlite', 'params', 'queries')}, f, indent=2)
+        print(f'Wrote baseline {args.baseline}')
+        return
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}; run with --update-baseline to create one')
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('params') != params:
+        print(f"Warning: baseline was recorded with {baseline.get('params')}")
+    failures, notes = compare(queries, baseline, args.tolerance, args.min_delta_ms)
+    for note in notes:
+        print(f'  note: {note}')
+    for failure in failures:
+        print(f'  FAIL  {failure}')
+    if failures:
+        print(f'{len(failures)} regression(s) against {args.baseline}')
+        sys.exit(1)
+    print(f'No plan or latency regressions against {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+"""
+Benchmark the face recognition core across embedding sizes and population sizes.
+
+For every --dims x --sizes combination this seeds a scratch SQLite database (the real
+data.db is never touched) with random embeddings like generate_demo_data's, one user
+row per (1 + --samples-per-user) vectors and the rest as face_samples, then times:
+  - load_candidates: app._load_candidates(), the per-request load + JSON decode
+  - find_best_match: face_recog.find_best_match() over those candidates
+  - matrix:          a normalized float32 matrix and one matrix-vector product, the
+                     lower bound for an in-memory index
+  - index_build:     embedding_index.rebuild(), writing a snapshot of the seeded rows
+  - index:           EmbeddingIndex.search() on the memory-mapped snapshot, including
+                     its per-request check for newer rows
+and reports p50/p95/p99/mean latency and the memory each structure holds (resident
+growth for the candidate lists and the index, array size for the matrix; the index
+also reports its size on disk, which the page cache shares between workers).
+
+Default dims are 4096 (VGG-Face in current DeepFace; older releases give 2622) and
+25600 (the 160x160 OpenCV fallback). Stages whose estimated memory or disk use exceeds
+--max-memory-mb / free space are skipped and reported as such, so the full default
+grid is safe to run on a laptop.
+
+Results are JSON (--output FILE, or stdout with --json). With --compare BASELINE.json
+the script prints the p50 ratio per stage and exits 1 if any is slower than
+--tolerance times the baseline.
+
+Usage: python scripts/bench_face_matching.py [--dims 4096,25600] [--sizes 1000,10000,100000]
+           [--queries 20] [--max-memory-mb N] [--output results.json] [--compare baseline.json]
+"""
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Rough bytes per vector element for each representation, used by the memory guard
+JSON_BYTES = 20  # embedding_json text in SQLite
+MODEL = 'bench/random/v1'  # embedding_model tag of the seeded rows
+LIST_BYTES = 32  # Python float (24) + list slot (8), as held by the candidate tuples
+LOAD_BYTES = LIST_BYTES + 2 * JSON_BYTES  # peak while decoding the rows
+MATRIX_BYTES = 4  # float32
+
+
+def available_memory_mb():
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return 4096
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000
+
+    return {
+        'runs': len(ordered),
+        'p50_ms': round(pick(0.50), 3),
+        'p95_ms': round(pick(0.95), 3),
+        'p99_ms': round(pick(0.99), 3),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+    }
+
+
+def timed(fn, runs):
+    samples = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return result, samples
+
+
+def random_vectors(rng, count, dim, chunk=1000):
+    for start in range(0, count, chunk):
+        yield from rng.standard_normal((min(chunk, count - start), dim), dtype=np.float32)
+
+
+def seed(models, rng, dim, count, samples_per_user):
+    """Replace users and face_samples with `count` random vectors of size `dim`."""
+    from sqlalchemy import delete, insert
+    engine = models.get_engine()
+    with engine.begin() as conn:
+        conn.execute(delete(models.FaceSample))
+        conn.execute(delete(models.User))
+    per_user = samples_per_user + 1
+    users, samples = [], []
+    user_id = 0
+    for i, vec in enumerate(random_vectors(rng, count, dim)):
+        embedding_json = json.dumps(vec.tolist())
+        if i % per_user == 0:
+            user_id += 1
+            users.append({'id': user_id, 'name': f'Bench {user_id}', 'face_uuid': f'BENCH{user_id:07d}',
+                          'embedding_json': embedding_json, 'embedding_model': MODEL})
+        else:
+            samples.append({'user_id': user_id, 'face_uuid': f'BENCH{user_id:07d}', 'sample_uuid': f'S{i}',
+                            'image_path': '', 'embedding_json': embedding_json, 'embedding_model': MODEL})
+        if len(users) + len(samples) >= 500:
+            with engine.begin() as conn:
+                if users:
+                    conn.execute(insert(models.User), users)
+                if samples:
+                    conn.execute(insert(models.FaceSample), samples)
+            users, samples = [], []
+    with engine.begin() as conn:
+        if users:
+            conn.execute(insert(models.User), users)
+        if samples:
+            conn.execute(insert(models.FaceSample), samples)
+    engine.dispose()
+
+
+def bench_config(dim, count, args, load_candidates, find_best_match, models, embedding_index, tmp):
+    rng = np.random.default_rng(args.seed)
+    query = rng.standard_normal(dim, dtype=np.float32)
+    budget_mb = args.max_memory_mb
+    results = []
+
+    def skipped(stage, reason):
+        print(f'  {stage:16s} skipped: {reason}')
+        results.append({'dim': dim, 'vectors': count, 'stage': stage, 'skipped': reason})
+
+    def record(stage, samples, memory_mb, **extra):
+        stats = percentiles(samples)
+        print(f"  {stage:16s} p50 {stats['p50_ms']:10.2f} ms  p95 {stats['p95_ms']:10.2f} ms"
+              f"  p99 {stats['p99_ms']:10.2f} ms  +{memory_mb:8.1f} MB")
+        results.append({'dim': dim, 'vectors': count, 'stage': stage, **stats, 'memory_mb': round(memory_mb, 1),
+                        **extra})
+
+    seeded = False
+    candidates = None
+    candidates_mb = 0.0
+    load_mb = count * dim * LOAD_BYTES / 2 ** 20
+    disk_mb = count * dim * JSON_BYTES / 2 ** 20
+    free_mb = shutil.disk_usage(tmp).free / 2 ** 20
+    no_disk = f'needs ~{disk_mb:.0f} MB of disk, {free_mb:.0f} MB free' if disk_mb > free_mb * 0.8 else None
+    if load_mb > budget_mb:
+        skipped('load_candidates', f'needs ~{load_mb:.0f} MB, limit {budget_mb} MB')
+    elif no_disk:
+        skipped('load_candidates', no_disk)
+    else:
+        seed(models, rng, dim, count, args.samples_per_user)
+        seeded = True
+        session = models.get_session()
+        before = rss_mb()
+        candidates, samples = timed(lambda: load_candidates(session, MODEL), args.load_runs)
+        session.close()
+        candidates_mb = rss_mb() - before
+        record('load_candidates', samples, candidates_mb)
+
+    list_mb = count * dim * LIST_BYTES / 2 ** 20
+    if candidates is None and list_mb <= budget_mb:
+        before = rss_mb()
+        candidates = [(i, f'Bench {i}', v.tolist()) for i, v in enumerate(random_vectors(rng, count, dim))]
+        candidates_mb = rss_mb() - before
+    if candidates is None:
+        skipped('find_best_match', f'needs ~{list_mb:.0f} MB, limit {budget_mb} MB')
+    else:
+        _, samples = timed(lambda: find_best_match(query, candidates), args.queries)
+        record('find_best_match', samples, candidates_mb)
+
+    matrix_mb = count * dim * MATRIX_BYTES / 2 ** 20
+    if matrix_mb > budget_mb:
+        skipped('matrix', f'needs ~{matrix_mb:.0f} MB, limit {budget_mb} MB')
+    else:
+        if candidates is not None:
+            matrix = np.asarray([c[2] for c in candidates], dtype=np.float32)
+        else:
+            matrix = np.stack(list(random_vectors(rng, count, dim)))
+        del candidates
+        gc.collect()
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+        def search():
+            scores = matrix @ (query / np.linalg.norm(query))
+            return int(np.argmax(scores))
+
+        _, samples = timed(search, max(args.queries, 50))
+        record('matrix', samples, matrix.nbytes / 2 ** 20)
+        del matrix
+    gc.collect()
+
+    index_mb = 2 * matrix_mb  # rows decoded by rebuild() + the mapped snapshot
+    if index_mb > budget_mb:
+        skipped('index', f'needs ~{index_mb:.0f} MB, limit {budget_mb} MB')
+    elif no_disk:
+        skipped('index', no_disk)
+    else:
+        if not seeded:
+            seed(models, rng, dim, count, args.samples_per_user)
+        directory = os.path.join(tmp, f'index-{dim}-{count}')
+        name, samples = timed(lambda: embedding_index.rebuild(directory), 1)
+        snapshot_dir = os.path.join(directory, name)
+        disk_mb = sum(os.path.getsize(os.path.join(snapshot_dir, f)) for f in os.listdir(snapshot_dir)) / 2 ** 20
+        record('index_build', samples, 0.0, disk_mb=round(disk_mb, 1))
+        before = rss_mb()
+        idx = embedding_index.EmbeddingIndex(directory)
+        _, samples = timed(lambda: idx.search(query, MODEL), max(args.queries, 50))
+        record('index', samples, rss_mb() - before, disk_mb=round(disk_mb, 1))
+        del idx
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, tolerance):
+    """Print p50 ratios against a previous run; True if nothing regressed past `tolerance`."""
+    with open(baseline_path) as f:
+        baseline = {(r['dim'], r['vectors'], r['stage']): r for r in json.load(f)['results'] if 'p50_ms' in r}
+    ok = True
+    print(f'Compared with {baseline_path} (tolerance {tolerance}x)')
+    for r in results:
+        old = baseline.get((r['dim'], r['vectors'], r['stage']))
+        if 'p50_ms' not in r or old is None or old['p50_ms'] <= 0:
+            continue
+        ratio = r['p50_ms'] / old['p50_ms']
+        regressed = ratio > tolerance
+        ok = ok and not regressed
+        print(f"  {'FAIL' if regressed else 'ok  '}  dim {r['dim']:6d}  {r['vectors']:7d} vectors  "
+              f"{r['stage']:16s} {old['p50_ms']:10.2f} -> {r['p50_ms']:10.2f} ms  ({ratio:.2f}x)")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dims', default='4096,25600', help='embedding sizes (default 4096,25600)')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='vectors per run (default 1000,10000,100000)')
+    parser.add_argument('--samples-per-user', type=int, default=5, help='face samples per user (default 5, as /register)')
+    parser.add_argument('--queries', type=int, default=20, help='find_best_match calls per configuration (default 20)')
+    parser.add_argument('--load-runs', type=int, default=3, help='candidate loads per configuration (default 3)')
+    parser.add_argument('--max-memory-mb', type=int, default=available_memory_mb() // 2,
+                        help='skip stages estimated to need more (default: half of available memory)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write JSON results to this file')
+    parser.add_argument('--json', action='store_true', help='print JSON results to stdout')
+    parser.add_argument('--compare', help='baseline JSON from an earlier run')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='allowed p50 slowdown vs baseline (default 1.25)')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    os.environ.setdefault('SMS_TRANSPORT', 'log')
+    import models
+    from app import _load_candidates
+    from face_recog import find_best_match
+    import embedding_index
+
+    results = []
+    try:
+        for dim in (int(d) for d in args.dims.split(',')):
+            for count in (int(n) for n in args.sizes.split(',')):
+                print(f'dim {dim}, {count} vectors')
+                results.extend(bench_config(dim, count, args, _load_candidates, find_best_match, models,
+                                             embedding_index, tmp))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'samples_per_user': args.samples_per_user,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Wrote {args.output}')
+    if args.json:
+        print(json.dumps(report, indent=2))
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
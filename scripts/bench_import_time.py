@@ -0,0 +1,95 @@
+"""
+Measure the cold import time of app.py with `python -X importtime` and enforce a budget.
+
+Each run starts a fresh interpreter against a scratch SQLite database (the real
+data.db is never touched), so the number includes app startup work done at import
+(init_db, allocator load, counter backfill). The fastest of --runs is compared with
+--budget-ms, and the heavy libraries that routes import on first use (OpenCV, NumPy,
+DeepFace, Prophet, pandas, twilio) must not appear in the import log at all.
+Exits with status 1 when either check fails, so it can run in CI.
+
+Usage: python scripts/bench_import_time.py [--budget-ms 1500] [--runs 3] [--top 15] [--json]
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Top-level packages that must only be imported on first use or by app.warm_up()
+LAZY_MODULES = ('cv2', 'numpy', 'face_recog', 'forecast_models', 'deepface', 'tensorflow',
+                'prophet', 'pandas', 'twilio', 'PIL')
+
+
+def import_log(db_path):
+    """Run `import app` in a fresh interpreter and return [(self_us, cumulative_us, depth, module)]."""
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', APP_WARMUP='0', PYTHONDONTWRITEBYTECODE='1')
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                          cwd=ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit('import app failed')
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('IMPORT_BUDGET_MS', 1500)),
+                        help='fail when cold import of app takes longer (default 1500, or IMPORT_BUDGET_MS)')
+    parser.add_argument('--runs', type=int, default=3, help='fresh interpreters to run; the fastest counts')
+    parser.add_argument('--top', type=int, default=15, help='slowest top-level imports to list')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(args.runs):
+            runs.append(import_log(os.path.join(tmp, 'import.db')))
+
+    def total(rows):
+        return next(cum for _, cum, _, name in rows if name == 'app') / 1000.0
+
+    best = min(runs, key=total)
+    app_ms = total(best)
+    # Direct imports of app, slowest first
+    direct = sorted(((cum / 1000.0, name) for _, cum, depth, name in best if depth == 1), reverse=True)
+    loaded = {name.split('.')[0] for _, _, _, name in best}
+    eager = sorted(m for m in LAZY_MODULES if m in loaded)
+    ok = app_ms <= args.budget_ms and not eager
+
+    report = {
+        'app_import_ms': round(app_ms, 1),
+        'budget_ms': args.budget_ms,
+        'runs_ms': [round(total(r), 1) for r in runs],
+        'slowest_imports': [{'module': name, 'ms': round(ms, 1)} for ms, name in direct[:args.top]],
+        'eager_heavy_modules': eager,
+        'ok': ok,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"Cold import of app: {report['app_import_ms']:.1f} ms (budget {args.budget_ms:.0f} ms, runs {report['runs_ms']})")
+        print('Slowest direct imports:')
+        for item in report['slowest_imports']:
+            print(f"  {item['ms']:8.1f} ms  {item['module']}")
+        if eager:
+            print(f"FAIL: imported at startup but should load on first use: {', '.join(eager)}")
+        elif app_ms > args.budget_ms:
+            print(f"FAIL: over budget by {app_ms - args.budget_ms:.1f} ms")
+        else:
+            print('OK')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
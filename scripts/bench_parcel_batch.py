@@ -0,0 +1,88 @@
+"""
+Benchmark bulk parcel intake: one /parcel/add_batch call vs looping over /parcel/add.
+
+Runs the app through the Flask test client against a scratch SQLite database
+(the real data.db is never touched) and prints parcels/second for both paths.
+
+Usage: python scripts/bench_parcel_batch.py [--count 1000] [--json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def fresh_app(db_path, capacity):
+    """Point the app at an empty database with one location big enough for the benchmark."""
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    for name in ('app', 'models', 'storage'):
+        sys.modules.pop(name, None)
+    import app as app_module
+    from models import get_session, StorageLocation
+    from storage import allocator
+    session = get_session()
+    session.add(StorageLocation(name='Bench Bay', capacity=capacity))
+    session.commit()
+    session.close()
+    allocator.load()
+    return app_module.app.test_client()
+
+
+def make_rows(count):
+    return [{'tracking_code': f'BENCH-{i:06d}', 'note': 'bench'} for i in range(count)]
+
+
+def bench_loop(client, rows):
+    start = time.perf_counter()
+    for row in rows:
+        r = client.post('/parcel/add', json=row)
+        assert r.status_code == 200, r.get_json()
+    return time.perf_counter() - start
+
+
+def bench_batch(client, rows):
+    start = time.perf_counter()
+    r = client.post('/parcel/add_batch', json=rows)
+    assert r.status_code == 200 and r.get_json()['created'] == len(rows), r.get_json()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=1000, help='parcels per run (default 1000)')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    rows = make_rows(args.count)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        results['loop'] = bench_loop(fresh_app(db_path, args.count * 2), rows)
+        results['batch'] = bench_batch(fresh_app(db_path, args.count * 2), rows)
+
+    report = {
+        'count': args.count,
+        'loop_seconds': round(results['loop'], 4),
+        'batch_seconds': round(results['batch'], 4),
+        'loop_parcels_per_sec': round(args.count / results['loop'], 1),
+        'batch_parcels_per_sec': round(args.count / results['batch'], 1),
+        'speedup': round(results['loop'] / results['batch'], 1),
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"Intake of {args.count} parcels")
+    print(f"  /parcel/add loop : {report['loop_seconds']:8.3f}s  {report['loop_parcels_per_sec']:10.1f} parcels/s")
+    print(f"  /parcel/add_batch: {report['batch_seconds']:8.3f}s  {report['batch_parcels_per_sec']:10.1f} parcels/s")
+    print(f"  speedup          : {report['speedup']}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Load-test the SMS outbox offline with the stub transport.
+
+Queues --count messages in a scratch SQLite database (the real data.db is never
+touched), then drains the outbox at each concurrency level through the stub
+provider, which waits --latency-ms per message and fails --failure-rate of calls.
+Prints the enqueue cost per message, the drain throughput, and checks that every
+message was delivered exactly once.
+
+Usage: python scripts/bench_sms_outbox.py [--count 500] [--concurrency 1,4,16]
+                                          [--latency-ms 50] [--failure-rate 0.05] [--json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def fresh_db(db_path):
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['SMS_BACKOFF_SECONDS'] = '0'  # retry failures on the next pass
+    for name in ('models', 'notifications'):
+        sys.modules.pop(name, None)
+    import models
+    models.init_db()
+    import notifications
+    return notifications
+
+
+def run(count, concurrency, latency_ms, failure_rate, db_path):
+    notifications = fresh_db(db_path)
+    from models import get_session, SmsOutbox
+    stub = notifications.StubTransport(latency_ms=latency_ms, failure_rate=failure_rate)
+    notifications.set_transport(stub)
+
+    start = time.perf_counter()
+    for i in range(count):
+        notifications.send_sms(f'+1555{i:07d}', f'Parcel {i} is waiting', idempotency_key=f'bench-{i}')
+    # Queuing the same key again must not create a second message
+    notifications.send_sms('+15550000000', 'Parcel 0 is waiting', idempotency_key='bench-0')
+    enqueue = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while notifications.dispatch_pending(limit=max(50, concurrency * 4), executor=executor, transport=stub):
+            pass
+    drain = time.perf_counter() - start
+
+    session = get_session()
+    queued = session.query(SmsOutbox).count()
+    sent = session.query(SmsOutbox).filter(SmsOutbox.status == 'sent').count()
+    session.close()
+    return {
+        'concurrency': concurrency,
+        'queued': queued,
+        'sent': sent,
+        'delivered': len(stub.sent),
+        'provider_calls': stub.calls,
+        'enqueue_ms_per_message': round(enqueue / count * 1000, 3),
+        'drain_seconds': round(drain, 3),
+        'messages_per_sec': round(sent / drain, 1) if drain else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=500, help='messages per run (default 500)')
+    parser.add_argument('--concurrency', default='1,4,16', help='comma-separated send concurrency levels')
+    parser.add_argument('--latency-ms', type=float, default=50, help='stub provider latency per message')
+    parser.add_argument('--failure-rate', type=float, default=0.05, help='fraction of stub sends that fail')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for level in [int(c) for c in args.concurrency.split(',')]:
+            results.append(run(args.count, level, args.latency_ms, args.failure_rate, os.path.join(tmp, 'sms.db')))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"SMS outbox: {args.count} messages, stub latency {args.latency_ms}ms, failure rate {args.failure_rate}")
+    for r in results:
+        ok = r['queued'] == r['sent'] == r['delivered'] == args.count
+        print(f"  concurrency {r['concurrency']:3d}: drain {r['drain_seconds']:7.2f}s  "
+              f"{r['messages_per_sec']:8.1f} msg/s  enqueue {r['enqueue_ms_per_message']:.2f}ms/msg  "
+              f"provider calls {r['provider_calls']}  {'OK' if ok else 'MISMATCH'}")
+
+
+if __name__ == '__main__':
+    main()
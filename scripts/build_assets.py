@@ -0,0 +1,36 @@
+"""
+Build the hashed, precompressed static assets served from /assets/.
+
+Copies static/css and static/js into static/dist under content-hashed names,
+writes .gz and (when the brotli package is installed) .br versions next to each,
+and records the mapping in static/dist/manifest.json. The app does the same at
+startup; run this at deploy time when the install directory is read-only.
+
+Usage: python scripts/build_assets.py
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from assets import build_assets, DIST_DIR, brotli
+
+
+def size(path):
+    return os.path.getsize(path) if os.path.exists(path) else None
+
+
+def main():
+    manifest = build_assets()
+    print(f"Built {len(manifest)} assets into {os.path.relpath(DIST_DIR, ROOT)}"
+          f"{'' if brotli else ' (brotli not installed, gzip only)'}")
+    print(f"  {'asset':<40} {'raw':>8} {'gzip':>8} {'br':>8}")
+    for source, hashed in sorted(manifest.items()):
+        out = os.path.join(DIST_DIR, hashed)
+        br = size(out + '.br')
+        print(f"  {hashed:<40} {size(out):>8} {size(out + '.gz'):>8} {br if br is not None else '-':>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Check admission control on the embedding-heavy endpoints.
+
+Runs the app through the Flask test client against a scratch SQLite database (the
+real data.db is never touched) with ADMISSION_LIMITS=recognize=2 and a queue of 2,
+fires a burst of concurrent /recognize requests while another thread polls /status,
+and verifies that:
+  - no more than 2 recognitions run at once;
+  - the overflow gets a fast 503 with Retry-After, counted in /metrics;
+  - /status keeps answering 200 throughout.
+It then repeats the burst with admission control switched off and prints /status
+latency for both runs. Exits with status 1 if any check fails.
+
+Usage: python scripts/check_admission.py [--burst 16]
+"""
+import os
+import sys
+import time
+import base64
+import argparse
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+failures = []
+
+
+def check(name, ok, detail=''):
+    print(f"  {'PASS' if ok else 'FAIL'}  {name}{'  ' + detail if detail else ''}")
+    if not ok:
+        failures.append(name)
+
+
+def face_image(seed):
+    import cv2
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    ok, buf = cv2.imencode('.jpg', (rng.random((160, 160, 3)) * 255).astype(np.uint8))
+    return 'data:image/jpeg;base64,' + base64.b64encode(buf.tobytes()).decode()
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * (len(ordered) - 1)))] * 1000 if ordered else 0.0
+
+
+def storm(app, burst, image, gate):
+    """Fire `burst` concurrent /recognize calls while polling /status."""
+    results = []
+    status_latency = []
+    status_codes = set()
+    peak = [0]
+    done = threading.Event()
+
+    def recognize():
+        start = time.perf_counter()
+        r = app.test_client().post('/recognize', json={'image': image})
+        results.append((r.status_code, r.headers.get('Retry-After'), time.perf_counter() - start))
+
+    def poll():
+        client = app.test_client()
+        while not done.is_set():
+            start = time.perf_counter()
+            r = client.get('/status')
+            status_latency.append(time.perf_counter() - start)
+            status_codes.add(r.status_code)
+            if gate is not None:
+                peak[0] = max(peak[0], gate.active)
+            time.sleep(0.02)
+
+    poller = threading.Thread(target=poll)
+    poller.start()
+    threads = [threading.Thread(target=recognize) for _ in range(burst)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    done.set()
+    poller.join()
+    return results, status_latency, status_codes, peak[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--burst', type=int, default=16, help='concurrent /recognize requests (default 16)')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'admission.db')}"
+    os.environ.setdefault('SMS_TRANSPORT', 'log')
+    os.environ.setdefault('SLOW_QUERY_MS', '100000')  # the burst makes every query look slow
+    os.environ['ADMISSION_LIMITS'] = 'recognize=2'
+    os.environ['ADMISSION_QUEUE_SIZE'] = '2'
+    os.environ['ADMISSION_QUEUE_TIMEOUT'] = '1'
+    import app as app_module
+    import admission
+    app = app_module.app
+    image = face_image(1)
+    app.test_client().post('/register', json={'name': 'Ada', 'phone': '', 'image': image})
+    app.test_client().post('/recognize', json={'image': image})  # load the model before timing
+
+    print(f'{args.burst} concurrent /recognize, limit 2, queue 2')
+    results, latency, codes, peak = storm(app, args.burst, image, admission.gates['recognize'])
+    ok = [r for r in results if r[0] == 200]
+    busy = [r for r in results if r[0] == 503]
+    check('every request answered 200 or 503', len(ok) + len(busy) == len(results))
+    check('no more than 2 recognitions at once', peak <= 2, f'peak {peak}')
+    check('overflow rejected with 503', len(busy) > 0, f'{len(ok)} ok, {len(busy)} rejected')
+    check('503s carry Retry-After', all(r[1] == str(admission.ADMISSION_RETRY_AFTER) for r in busy))
+    queue_full = [r for r in busy if r[2] < 0.5]
+    check('queue-full rejections are fast', len(queue_full) > 0, f'{len(queue_full)} answered in < 500 ms')
+    stats = admission.stats()['recognize']
+    check('rejections counted', sum(stats['rejected'].values()) == len(busy), str(stats['rejected']))
+    metrics = app.test_client().get('/metrics').get_data(as_text=True)
+    check('rejections in /metrics', 'parcel_admission_rejected_total{endpoint="recognize"' in metrics)
+    check('gate drained', stats['in_flight'] == 0 and stats['queued'] == 0)
+    check('/status kept answering', codes == {200}, f'{len(latency)} polls')
+    limited = (percentile(latency, 0.5), percentile(latency, 0.95))
+
+    print('same burst without admission control')
+    gate = admission.gates.pop('recognize')
+    results, latency, codes, _ = storm(app, args.burst, image, None)
+    admission.gates['recognize'] = gate
+    unlimited = (percentile(latency, 0.5), percentile(latency, 0.95))
+    print(f'  /status p50/p95 with limits {limited[0]:.1f}/{limited[1]:.1f} ms, '
+          f'without {unlimited[0]:.1f}/{unlimited[1]:.1f} ms')
+
+    if failures:
+        print(f'{len(failures)} check(s) failed')
+        sys.exit(1)
+    print('All checks passed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Check the ASGI entry point (asgi.py) under uvicorn.
+
+Starts uvicorn in-process on a free port against a scratch SQLite database (the real
+data.db is never touched), with only 4 WSGI threads and 1 CPU worker, and verifies that:
+  - ordinary routes, query strings and JSON bodies go through the bridge to Flask;
+  - /events rejects bad parameters like the Flask route does;
+  - many more /events streams than there are threads stay open at once, /status still
+    answers quickly meanwhile, and a registration reaches every stream;
+  - /recognize computes its embedding on the CPU pool and matches, and /register decodes
+    and denoises its photo there too (once, not again on a WSGI thread);
+  - a /recognize burst beyond the CPU queue gets fast 503s with Retry-After.
+Exits with status 1 if any check fails.
+
+Usage: python scripts/check_asgi.py [--streams 200]
+"""
+import os
+import sys
+import json
+import time
+import base64
+import socket
+import argparse
+import tempfile
+import threading
+import http.client
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+failures = []
+
+
+def check(name, ok, detail=''):
+    print(f"  {'PASS' if ok else 'FAIL'}  {name}{'  ' + detail if detail else ''}")
+    if not ok:
+        failures.append(name)
+
+
+def face_image(seed):
+    import cv2
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    ok, buf = cv2.imencode('.jpg', (rng.random((160, 160, 3)) * 255).astype(np.uint8))
+    return 'data:image/jpeg;base64,' + base64.b64encode(buf.tobytes()).decode()
+
+
+def request(port, method, path, payload=None, timeout=60):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    body = json.dumps(payload) if payload is not None else None
+    conn.request(method, path, body=body, headers={'Content-Type': 'application/json'} if body else {})
+    r = conn.getresponse()
+    data = r.read()
+    conn.close()
+    return r.status, dict(r.getheaders()), data
+
+
+def open_stream(port):
+    """Open an /events stream and read past its headers and retry line."""
+    sock = socket.create_connection(('127.0.0.1', port), timeout=10)
+    sock.sendall(b'GET /events HTTP/1.1\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n')
+    data = b''
+    while b'retry:' not in data:
+        data += sock.recv(4096)
+    return sock, data
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--streams', type=int, default=200, help='concurrent /events streams (default 200)')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'asgi.db')}"
+    os.environ.setdefault('SMS_TRANSPORT', 'log')
+    os.environ.setdefault('SLOW_QUERY_MS', '100000')
+    os.environ['ASGI_WSGI_THREADS'] = '4'
+    os.environ['ASGI_CPU_WORKERS'] = '1'
+    os.environ['ASGI_CPU_QUEUE'] = '1'
+    os.environ['EVENTS_POLL_INTERVAL'] = '0.2'
+    import uvicorn
+    import asgi
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(asgi.app, host='127.0.0.1', port=port, log_level='warning',
+                                           limit_concurrency=None, backlog=4096))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    image = face_image(1)
+
+    print('bridge to Flask')
+    status, headers, body = request(port, 'GET', '/status')
+    check('/status through the bridge', status == 200, body[:80].decode())
+    status, _, body = request(port, 'POST', '/register', {'name': 'Ada', 'phone': '', 'image': image})
+    check('/register with a JSON body', status == 200 and 'face_uuid' in json.loads(body), body[:80].decode())
+    face_uuid = json.loads(body).get('face_uuid')
+    status, _, body = request(port, 'GET', f'/track/{face_uuid}?include=history')
+    check('path and query string reach Flask', status == 200, str(status))
+    status, _, _ = request(port, 'GET', '/events?owner_id=abc')
+    check('/events rejects a bad owner_id', status == 400)
+    status, _, _ = request(port, 'GET', '/events?face_uuid=nosuch')
+    check('/events 404s an unknown face_uuid', status == 404)
+
+    print(f'{args.streams} /events streams on 4 WSGI threads')
+    streams = [open_stream(port) for _ in range(args.streams)]
+    start = time.perf_counter()
+    status, _, _ = request(port, 'GET', '/status', timeout=5)
+    elapsed = (time.perf_counter() - start) * 1000
+    check('/status answers while streams are open', status == 200, f'{elapsed:.0f} ms')
+    request(port, 'POST', '/register', {'name': 'Grace', 'phone': '', 'image': face_image(2)})
+    received = 0
+    for sock, data in streams:
+        deadline = time.monotonic() + 10
+        while b'user-registered' not in data and time.monotonic() < deadline:
+            data += sock.recv(4096)
+        received += b'user-registered' in data
+        sock.close()
+    check('registration reached every stream', received == len(streams), f'{received}/{len(streams)}')
+    check('no thread per stream', threading.active_count() < len(streams) // 4,
+          f'{threading.active_count()} threads for {len(streams)} streams')
+
+    print('embedding on the CPU pool')
+    status, _, body = request(port, 'POST', '/recognize', {'image': image})
+    check('/recognize matches', status == 200 and (json.loads(body).get('match') or {}).get('face_uuid') == face_uuid, body[:80].decode())
+    import face_recog
+    preprocess, threads = face_recog.preprocess_base64_image, []
+
+    def traced(b64data):
+        threads.append(threading.current_thread().name)
+        return preprocess(b64data)
+
+    face_recog.preprocess_base64_image = traced
+    status, _, body = request(port, 'POST', '/register', {'name': 'Lin', 'phone': '', 'image': face_image(3)})
+    face_recog.preprocess_base64_image = preprocess
+    check('/register photo denoised once, on the CPU pool', status == 200 and len(threads) == 1
+          and threads[0].startswith('embed'), str(threads))
+    results = []
+
+    def recognize():
+        status, headers, _ = request(port, 'POST', '/recognize', {'image': image})
+        results.append((status, headers.get('retry-after')))
+
+    burst = [threading.Thread(target=recognize) for _ in range(8)]
+    for t in burst:
+        t.start()
+    for t in burst:
+        t.join()
+    busy = [r for r in results if r[0] == 503]
+    check('burst answered 200 or 503', all(r[0] in (200, 503) for r in results), str(sorted(r[0] for r in results)))
+    check('overflow beyond the CPU queue rejected', len(busy) > 0, f'{len(busy)}/8 rejected')
+    check('503s carry Retry-After', all(r[1] for r in busy))
+    _, _, metrics = request(port, 'GET', '/metrics')
+    check('rejections in /metrics', b'reason="cpu_queue_full"' in metrics)
+
+    server.should_exit = True
+    if failures:
+        print(f'{len(failures)} check(s) failed')
+        sys.exit(1)
+    print('All checks passed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Check that writes bump data_versions and that polled read endpoints answer 304.
+
+Runs the app through the Flask test client against a scratch SQLite database (the
+real data.db is never touched) and verifies that:
+  - /register, /parcel/add, /parcel/collect and /parcel/mark_collected bump the
+    'parcels', 'users' and per-owner versions they should, and no others;
+  - /status, /api/users, /track_orders and /track/<face_uuid> return a strong ETag,
+    304 Not Modified for a matching If-None-Match (also with Flask-Compress's
+    ':gzip' suffix), and a new ETag after a relevant write.
+Exits with status 1 if any check fails.
+
+Usage: python scripts/check_data_versions.py
+"""
+import os
+import sys
+import base64
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+failures = []
+
+
+def check(name, ok):
+    print(f"  {'PASS' if ok else 'FAIL'}  {name}")
+    if not ok:
+        failures.append(name)
+
+
+def face_image(seed):
+    import cv2
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    ok, buf = cv2.imencode('.jpg', (rng.random((120, 120, 3)) * 255).astype(np.uint8))
+    return 'data:image/jpeg;base64,' + base64.b64encode(buf.tobytes()).decode()
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'versions.db')}"
+    os.environ.setdefault('SMS_TRANSPORT', 'log')
+    import app as app_module
+    from versions import read_versions, owner_scope
+    client = app_module.app.test_client()
+
+    def versions(*scopes):
+        return read_versions(scopes)
+
+    def etag(path):
+        r = client.get(path)
+        return r.status_code, r.get_etag()[0]
+
+    def changed(before, after):
+        return {s for s in before if before[s] != after[s]}
+
+    print('/register')
+    before = versions('parcels', 'users', owner_scope(1), owner_scope(2))
+    r = client.post('/register', json={'name': 'Ada', 'phone': '', 'image': face_image(1)})
+    check('register succeeds', r.status_code == 200)
+    ada_uuid = r.get_json()['face_uuid']
+    ada = r.get_json()['user_id']
+    bob_uuid = client.post('/register', json={'name': 'Bob', 'image': face_image(2)}).get_json()['face_uuid']
+    after = versions('parcels', 'users', owner_scope(1), owner_scope(2))
+    check('bumps users and both owners, not parcels', changed(before, after) == {'users', owner_scope(1), owner_scope(2)})
+
+    print('conditional GETs')
+    paths = ['/status', '/api/users', '/track_orders', f'/track_orders?owner_id={ada}', f'/track/{ada_uuid}', f'/track/{bob_uuid}']
+    tags = {}
+    for path in paths:
+        status, tag = etag(path)
+        tags[path] = tag
+        check(f'{path} has a strong ETag', status == 200 and bool(tag))
+        check(f'{path} 304 when unchanged', client.get(path, headers={'If-None-Match': f'"{tag}"'}).status_code == 304)
+        check(f'{path} 304 with :gzip suffix', client.get(path, headers={'If-None-Match': f'"{tag}:gzip"'}).status_code == 304)
+    check('unknown face_uuid still 404', client.get('/track/NOPE00').status_code == 404)
+
+    print('/parcel/add')
+    before = versions('parcels', 'users', owner_scope(ada), owner_scope(2))
+    r = client.post('/parcel/add', json={'tracking_code': 'VER-1', 'owner_id': ada})
+    check('add succeeds', r.status_code == 200)
+    first = r.get_json()['parcel_id']
+    after = versions('parcels', 'users', owner_scope(ada), owner_scope(2))
+    check("bumps parcels and the owner's version only", changed(before, after) == {'parcels', owner_scope(ada)})
+    for path in paths:
+        unchanged = path == f'/track/{bob_uuid}'
+        status = client.get(path, headers={'If-None-Match': f'"{tags[path]}"'}).status_code
+        check(f"{path} {'still 304' if unchanged else 'refetched (200)'}", status == (304 if unchanged else 200))
+
+    print('/parcel/collect')
+    before = versions('parcels', 'users', owner_scope(ada))
+    r = client.post('/parcel/collect', json={'image': face_image(1), 'parcel_id': first})
+    check('collect succeeds', r.status_code == 200 and r.get_json().get('status') == 'collected')
+    after = versions('parcels', 'users', owner_scope(ada))
+    check("bumps parcels and the owner's version", changed(before, after) == {'parcels', owner_scope(ada)})
+
+    print('/parcel/mark_collected')
+    second = client.post('/parcel/add', json={'tracking_code': 'VER-2', 'owner_id': ada}).get_json()['parcel_id']
+    _, tag = etag(f'/track/{ada_uuid}')
+    before = versions('parcels', 'users', owner_scope(ada))
+    r = client.post('/parcel/mark_collected', json={'parcel_id': second})
+    check('mark_collected succeeds', r.status_code == 200)
+    after = versions('parcels', 'users', owner_scope(ada))
+    check("bumps parcels and the owner's version", changed(before, after) == {'parcels', owner_scope(ada)})
+    check('/track/<face_uuid> refetched', client.get(f'/track/{ada_uuid}', headers={'If-None-Match': f'"{tag}"'}).status_code == 200)
+
+    print('failed requests')
+    before = versions('parcels', 'users', owner_scope(ada))
+    client.post('/parcel/mark_collected', json={'parcel_id': second})
+    check('collecting twice bumps nothing', changed(before, versions('parcels', 'users', owner_scope(ada))) == set())
+
+    if failures:
+        print(f'{len(failures)} check(s) failed')
+        sys.exit(1)
+    print('All checks passed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+"""
+Check the memory-mapped embedding index (embedding_index.py).
+
+Runs against a scratch SQLite database and index directory (the real data.db is never
+touched), seeded with random embeddings of two sizes plus a few unusable or untagged rows, and
+verifies that:
+  - best_match() gives the same match and score as find_best_match() over
+    _load_candidates(), for queries of both sizes and of a size nobody has;
+  - embeddings of the same size from another model are never matched;
+  - the snapshot is memory-mapped read-only;
+  - a registration made after the snapshot matches right away, from the delta;
+  - worker processes map the same snapshot, share its pages, and switch to a merged
+    snapshot without a restart;
+  - concurrent merges from several processes write one snapshot and leave no debris;
+  - a snapshot from another database (different epoch) is rebuilt, and old snapshots
+    are pruned to EMBEDDING_INDEX_KEEP;
+  - after users are deleted (through the ORM, behind its back, or by
+    scripts/clear_quick.py) and their ids reused, a running process stops matching the
+    deleted faces and matches the new ones.
+Exits with status 1 if any check fails.
+
+Usage: python scripts/check_embedding_index.py
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+failures = []
+MODEL = 'check/random/v1'
+OTHER = 'check/other/v1'
+
+WORKER = r'''
+import json, sys, time
+import numpy as np
+import embedding_index
+idx = embedding_index.EmbeddingIndex()
+idx.search(np.ones(64, dtype=np.float32), 'check/random/v1')
+first = idx.snapshot.name
+print(json.dumps({'snapshot': first}), flush=True)
+sys.stdin.readline()
+deadline = time.monotonic() + 10
+while idx.snapshot.name == first and time.monotonic() < deadline:
+    time.sleep(0.2)
+    idx.search(np.ones(64, dtype=np.float32), 'check/random/v1')
+shared = 0
+with open('/proc/self/smaps') as f:
+    in_matrix = False
+    for line in f:
+        if '-' in line.split(' ', 1)[0]:
+            in_matrix = line.rstrip().endswith('.matrix.npy')
+        elif in_matrix and line.startswith('Shared_Clean:'):
+            shared += int(line.split()[1])
+print(json.dumps({'snapshot': idx.snapshot.name, 'delta_rows': idx.delta_rows, 'shared_kb': shared}), flush=True)
+'''
+
+
+def check(name, ok, detail=''):
+    print(f"  {'PASS' if ok else 'FAIL'}  {name}{'  ' + detail if detail else ''}")
+    if not ok:
+        failures.append(name)
+
+
+def insert_users(models, rng, first_id, count, dim, samples=3, model=MODEL):
+    from sqlalchemy import insert
+    users, rows = [], []
+    for uid in range(first_id, first_id + count):
+        users.append({'id': uid, 'name': f'User {uid}', 'face_uuid': f'IDX{uid:05d}',
+                      'embedding_json': json.dumps(rng.standard_normal(dim).tolist()), 'embedding_model': model})
+        for i in range(samples):
+            rows.append({'user_id': uid, 'face_uuid': f'IDX{uid:05d}', 'sample_uuid': f'{uid}-{i}', 'image_path': '',
+                         'embedding_json': json.dumps(rng.standard_normal(dim).tolist()), 'embedding_model': model})
+    with models.get_engine().begin() as conn:
+        conn.execute(insert(models.User), users)
+        if rows:
+            conn.execute(insert(models.FaceSample), rows)
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'index.db')}"
+    os.environ.setdefault('SMS_TRANSPORT', 'log')
+    os.environ['EMBEDDING_INDEX_MERGE_SECONDS'] = '0'
+    os.environ['EMBEDDING_INDEX_KEEP'] = '3'
+    import models
+    from app import _load_candidates
+    from face_recog import find_best_match
+    import embedding_index
+    from sqlalchemy import insert, text
+
+    rng = np.random.default_rng(7)
+    insert_users(models, rng, 1, 60, 64)
+    insert_users(models, rng, 61, 5, 32, samples=1)
+    insert_users(models, rng, 70, 5, 64, samples=1, model=OTHER)
+    with models.get_engine().begin() as conn:  # rows the matcher has to skip
+        conn.execute(insert(models.FaceSample), [
+            {'user_id': 1, 'face_uuid': 'IDX00001', 'sample_uuid': 'null', 'image_path': '', 'embedding_json': None,
+             'embedding_model': MODEL},
+            {'user_id': 2, 'face_uuid': 'IDX00002', 'sample_uuid': 'bad', 'image_path': '', 'embedding_json': '[1, ',
+             'embedding_model': MODEL},
+            {'user_id': 3, 'face_uuid': 'IDX00003', 'sample_uuid': 'untagged', 'image_path': '',
+             'embedding_json': json.dumps(rng.standard_normal(64).tolist()), 'embedding_model': None}])
+
+    print('same results as find_best_match')
+    idx = embedding_index.index()
+    session = models.get_session()
+    candidates = _load_candidates(session, MODEL)
+    stored = [np.asarray(c[2], dtype=np.float32) for c in candidates]
+    queries = [rng.standard_normal(64) for _ in range(10)] + [rng.standard_normal(32) for _ in range(5)]
+    queries += [stored[i] + rng.normal(0, 0.3, stored[i].size) for i in rng.choice(len(stored), 15)]
+    queries += [rng.standard_normal(100)]
+    mismatches = 0
+    for q in queries:
+        for threshold in (0.0, 0.35):
+            expected = find_best_match(q, candidates, threshold=threshold)
+            got = embedding_index.best_match(q, MODEL, threshold=threshold)
+            same = (expected is None) == (got is None) and (
+                expected is None or (expected['id'] == got['id'] and abs(expected['score'] - got['score']) < 1e-4))
+            mismatches += not same
+    check('best_match agrees with find_best_match', mismatches == 0, f'{len(queries) * 2} lookups, {mismatches} differ')
+    matrix = idx.snapshot.groups[(MODEL, 64)][0]
+    check('snapshot is memory-mapped read-only', isinstance(matrix, np.memmap) and not matrix.flags.writeable)
+    check('each model and size indexed apart', sorted(idx.snapshot.groups) == [(OTHER, 64), (MODEL, 32), (MODEL, 64)],
+          str(idx.snapshot.meta['groups']))
+    tagged = len(_load_candidates(session, MODEL)) + len(_load_candidates(session, OTHER))
+    check('untagged rows skipped', idx.snapshot.rows == tagged, f'{idx.snapshot.rows} indexed, {tagged} tagged')
+
+    print('model tags')
+    other = np.asarray(json.loads(session.execute(text('SELECT embedding_json FROM users WHERE id = 70')).scalar()))
+    own = embedding_index.best_match(other, OTHER, threshold=0.9)
+    crossed = embedding_index.best_match(other, MODEL, threshold=0.0)
+    check('matches within its own model', own is not None and own['id'] == 70, str(own))
+    check('never matches another model of the same size', crossed is None or crossed['id'] != 70, str(crossed))
+
+    print('delta')
+    first = idx.snapshot.name
+    insert_users(models, rng, 100, 1, 64)
+    new_vec = np.asarray(json.loads(session.execute(text('SELECT embedding_json FROM users WHERE id = 100')).scalar()))
+    match = embedding_index.best_match(new_vec, MODEL, threshold=0.35)
+    check('new registration matches at once', match is not None and match['id'] == 100, str(match))
+    check('served from the delta', idx.snapshot.name == first and idx.delta_rows == 4, f'{idx.delta_rows} delta rows')
+
+    print('worker processes')
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    workers = [subprocess.Popen([sys.executable, '-c', WORKER], cwd=ROOT, env=env, text=True,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE) for _ in range(2)]
+    started = [json.loads(w.stdout.readline()) for w in workers]
+    check('workers map the current snapshot', all(s['snapshot'] == first for s in started))
+    merged = embedding_index.merge()
+    check('merge writes a new snapshot', merged is not None and embedding_index.current_name() == merged)
+    time.sleep(embedding_index.CHECK_SECONDS)
+    embedding_index.best_match(new_vec, MODEL)  # keeps the new snapshot's pages mapped here too
+    check('this process switched', idx.snapshot.name == merged and idx.delta_rows == 0)
+    for w in workers:
+        w.stdin.write('\n')
+        w.stdin.flush()
+    switched = [json.loads(w.stdout.readline()) for w in workers]
+    for w in workers:
+        w.wait()
+    check('workers switch without a restart', all(s['snapshot'] == merged for s in switched),
+          ', '.join(s['snapshot'] for s in switched))
+    check('merged rows leave the delta', all(s['delta_rows'] == 0 for s in switched))
+    if os.path.exists('/proc/self/smaps'):
+        check('snapshot pages shared between processes', all(s['shared_kb'] > 0 for s in switched),
+              ', '.join(f"{s['shared_kb']} kB" for s in switched))
+
+    print('concurrent merges')
+    insert_users(models, rng, 200, 20, 64)
+    procs = [subprocess.Popen([sys.executable, '-c', 'import embedding_index; print(embedding_index.merge())'],
+                              cwd=ROOT, env=env, text=True, stdout=subprocess.PIPE) for _ in range(4)]
+    outputs = [p.communicate()[0].strip() for p in procs]
+    written = [o for o in outputs if o != 'None']
+    check('exactly one merge writes', len(written) == 1, ', '.join(outputs))
+    directory = embedding_index.EMBEDDING_INDEX_DIR
+    check('no temporary snapshots left', not [n for n in os.listdir(directory) if n.startswith('.tmp-')])
+    current = embedding_index.Snapshot(os.path.join(directory, embedding_index.current_name()))
+    total = len(_load_candidates(session, MODEL)) + len(_load_candidates(session, OTHER))
+    check('snapshot holds every usable embedding', current.rows == total, f'{current.rows} of {total}')
+
+    print('epoch and pruning')
+    with models.get_engine().begin() as conn:
+        conn.execute(text("UPDATE data_versions SET version = version + 1 WHERE scope = 'epoch'"))
+    fresh = embedding_index.EmbeddingIndex()
+    fresh.refresh()
+    check('snapshot of another database rebuilt', fresh.snapshot.name != current.name
+          and fresh.snapshot.meta['epoch'] == current.meta['epoch'] + 1)
+    snapshots = [n for n in os.listdir(directory) if not n.startswith('.') and n != 'CURRENT']
+    check('old snapshots pruned', len(snapshots) <= embedding_index.EMBEDDING_INDEX_KEEP, f'{len(snapshots)} on disk')
+
+    print('deletes and reused ids')
+
+    def user_vector(user_id):
+        return np.asarray(json.loads(session.execute(
+            text('SELECT embedding_json FROM users WHERE id = :i'), {'i': user_id}).scalar()))
+
+    embedding_index.best_match(new_vec, MODEL)
+    last = session.execute(text('SELECT MAX(id) FROM users')).scalar()
+    deleted = user_vector(last)
+    user = session.get(models.User, last)
+    for sample in user.samples:
+        session.delete(sample)
+    session.delete(user)
+    session.commit()
+    insert_users(models, rng, last, 1, 64)  # same user and sample ids as the deleted rows
+    time.sleep(embedding_index.CHECK_SECONDS)
+    stale = embedding_index.best_match(deleted, MODEL, threshold=0.9)
+    fresh_match = embedding_index.best_match(user_vector(last), MODEL, threshold=0.9)
+    check('deleted user no longer matched', stale is None, str(stale))
+    check('user with the reused id matched', fresh_match is not None and fresh_match['id'] == last, str(fresh_match))
+    deleted = user_vector(50)
+    with models.get_engine().begin() as conn:  # bypasses the ORM and data_versions
+        conn.execute(text('DELETE FROM face_samples WHERE user_id = 50'))
+        conn.execute(text('DELETE FROM users WHERE id = 50'))
+    time.sleep(embedding_index.CHECK_SECONDS)
+    stale = embedding_index.best_match(deleted, MODEL, threshold=0.9)
+    check('user deleted with plain SQL no longer matched', stale is None, str(stale))
+    cleared = user_vector(1)
+    subprocess.run([sys.executable, os.path.join('scripts', 'clear_quick.py')], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    insert_users(models, rng, 1, 1, 64)
+    time.sleep(embedding_index.CHECK_SECONDS)
+    stale = embedding_index.best_match(cleared, MODEL, threshold=0.9)
+    fresh_match = embedding_index.best_match(user_vector(1), MODEL, threshold=0.9)
+    check('clear_quick: old users no longer matched', stale is None, str(stale))
+    check('clear_quick: new user matched', fresh_match is not None and fresh_match['id'] == 1, str(fresh_match))
+    check('index rebuilt to the new contents', idx.snapshot.rows + idx.delta_rows == 4,
+          f'{idx.snapshot.rows} + {idx.delta_rows} rows')
+    session.close()
+
+    if failures:
+        print(f'{len(failures)} check(s) failed')
+        sys.exit(1)
+    print('All checks passed')
+
+
+if __name__ == '__main__':
+    main()
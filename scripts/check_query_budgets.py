@@ -0,0 +1,160 @@
+"""
+Check that routes stay within their SQL query budgets, so N+1 regressions are caught
+before they reach production.
+
+Runs the app through the Flask test client against a scratch SQLite database (the
+real data.db is never touched). Each route is called inside querylog.query_budget()
+twice: once with a few users and once with many, each user having face samples and
+parcels. A route fails if it runs more statements than its budget, or if its query
+count grows with the number of users (the signature of a query inside a loop).
+Also checks that slow statements are logged with their EXPLAIN QUERY PLAN.
+Exits with status 1 if any check fails.
+
+Usage: python scripts/check_query_budgets.py
+"""
+import os
+import sys
+import base64
+import logging
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Route -> maximum SQL statements per request, independent of the data size
+BUDGETS = {
+    '/api/users': 3,
+    '/status': 3,
+    '/track_orders': 2,
+    '/track/{face_uuid}': 4,
+    '/recognize': 3,
+    '/parcel/collect': 9,
+}
+SMALL, LARGE = 3, 30
+
+failures = []
+
+
+def check(name, ok, detail=''):
+    print(f"  {'PASS' if ok else 'FAIL'}  {name}{'  ' + detail if detail else ''}")
+    if not ok:
+        failures.append(name)
+
+
+def face_image(seed):
+    import cv2
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    ok, buf = cv2.imencode('.jpg', (rng.random((120, 120, 3)) * 255).astype(np.uint8))
+    return 'data:image/jpeg;base64,' + base64.b64encode(buf.tobytes()).decode()
+
+
+def add_users(session, models, template, count, start):
+    """Copy the template user (and its face samples) `count` times."""
+    samples = session.query(models.FaceSample).filter_by(user_id=template.id).all()
+    for i in range(start, start + count):
+        user = models.User(name=f'Budget {i}', phone='', face_uuid=f'B{i:05d}', embedding_json=template.embedding_json,
+                           embedding_model=template.embedding_model)
+        session.add(user)
+        session.flush()
+        for s in samples:
+            session.add(models.FaceSample(user_id=user.id, face_uuid=user.face_uuid, sample_uuid=f'{s.sample_uuid}-{i}',
+                                          image_path=s.image_path, embedding_json=s.embedding_json,
+                                          embedding_model=s.embedding_model))
+        session.commit()
+
+
+def measure(client, query_budget, method, path, **kwargs):
+    with query_budget(10 ** 6) as statements:
+        response = client.open(path, method=method, **kwargs)
+    return response, len(statements)
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'budgets.db')}"
+    os.environ.setdefault('SMS_TRANSPORT', 'log')
+    import app as app_module
+    import models
+    import querylog
+    from querylog import query_budget, QueryBudgetExceeded
+    client = app_module.app.test_client()
+
+    r = client.post('/register', json={'name': 'Template', 'phone': '', 'image': face_image(1)})
+    if r.status_code != 200:
+        print(f'Could not register the template user: {r.get_data(as_text=True)}')
+        sys.exit(1)
+    face_uuid = r.get_json()['face_uuid']
+    owner = r.get_json()['user_id']
+    # Build and map the embedding index first, as app.warm_up() does at startup
+    import embedding_index
+    embedding_index.index().refresh()
+
+    def requests():
+        parcel = client.post('/parcel/add', json={'tracking_code': f'BUDGET-{os.urandom(4).hex()}', 'owner_id': owner})
+        parcel_id = parcel.get_json()['parcel_id']
+        return [
+            ('GET', '/api/users', {}),
+            ('GET', '/status', {}),
+            ('GET', '/track_orders', {}),
+            ('GET', '/track/{face_uuid}', {}),
+            ('POST', '/recognize', {'json': {'image': face_image(1)}}),
+            ('POST', '/parcel/collect', {'json': {'image': face_image(1), 'parcel_id': parcel_id}}),
+        ]
+
+    counts = {}
+    next_user = 0
+    for size in (SMALL, LARGE):
+        session = models.get_session()
+        template = session.get(models.User, owner)
+        add_users(session, models, template, size - next_user, next_user)
+        for i in range(next_user, size):
+            user_id = session.query(models.User.id).filter_by(face_uuid=f'B{i:05d}').scalar()
+            for j in range(2):
+                client.post('/parcel/add', json={'tracking_code': f'B{i}-{j}', 'owner_id': user_id})
+        session.close()
+        next_user = size
+        print(f'{size} extra users')
+        for method, route, kwargs in requests():
+            path = route.format(face_uuid=face_uuid)
+            response, n = measure(client, query_budget, method, path, **kwargs)
+            counts.setdefault(route, []).append(n)
+            check(f'{method} {route} within budget', response.status_code < 500 and n <= BUDGETS[route],
+                  f'{n} queries (budget {BUDGETS[route]}, status {response.status_code})')
+
+    print('query count independent of data size')
+    for route, (small, large) in counts.items():
+        check(route, large <= small, f'{small} -> {large}')
+
+    print('query_budget()')
+    try:
+        with query_budget(2):
+            session = models.get_session()
+            for _ in range(3):
+                session.query(models.User).count()
+            session.close()
+        check('raises when exceeded', False)
+    except QueryBudgetExceeded as e:
+        check('raises when exceeded', '3x' in str(e))
+
+    print('slow-query log')
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    querylog.logger.addHandler(handler)
+    querylog.SLOW_QUERY_MS = 0
+    client.get('/api/users', headers={'Cache-Control': 'no-cache'})
+    querylog.SLOW_QUERY_MS = float('inf')
+    querylog.logger.removeHandler(handler)
+    messages = [r.getMessage() for r in records]
+    check('slow statements are logged', any(m.startswith('Slow query') for m in messages))
+    check('with their query plan', any('SCAN' in m or 'SEARCH' in m for m in messages))
+
+    if failures:
+        print(f'{len(failures)} check(s) failed')
+        sys.exit(1)
+    print('All checks passed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Check the re-embedding job (scripts/reembed.py) and embedding model tags.
+
+Runs against a scratch SQLite database (the real data.db is never touched). Users are
+registered under EMBEDDING_VERSION=1 by a child process; this process then runs as
+version 2 and verifies that:
+  - /recognize does not match embeddings from the old version;
+  - reembed.py stopped after --max-batches leaves a checkpoint, and a second run carries
+    on from it without redoing rows, until every row with an image is tagged version 2;
+  - a row whose image is missing is reported as failed and keeps its old tag;
+  - /recognize matches again once the embedding index has been rebuilt;
+  - a checkpoint for another model is not reused.
+Exits with status 1 if any check fails.
+
+Usage: python scripts/check_reembed.py
+"""
+import os
+import sys
+import json
+import time
+import base64
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+USERS = 4
+failures = []
+
+REGISTER = r'''
+import json, sys
+sys.path.insert(0, 'scripts')
+from check_reembed import face_image
+from app import app
+client = app.test_client()
+for seed in range(int(sys.argv[1])):
+    r = client.post('/register', json={'name': f'Reembed {seed}', 'phone': '', 'image': face_image(seed)})
+    print(json.dumps(r.get_json()), flush=True)
+'''
+
+
+def check(name, ok, detail=''):
+    print(f"  {'PASS' if ok else 'FAIL'}  {name}{'  ' + detail if detail else ''}")
+    if not ok:
+        failures.append(name)
+
+
+def face_image(seed):
+    import cv2
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    ok, buf = cv2.imencode('.jpg', (rng.random((120, 120, 3)) * 255).astype(np.uint8))
+    return 'data:image/jpeg;base64,' + base64.b64encode(buf.tobytes()).decode()
+
+
+def tags(models):
+    from sqlalchemy import func, select
+    counts = {}
+    with models.get_engine().connect() as conn:
+        for model in (models.User, models.FaceSample):
+            for tag, n in conn.execute(select(model.embedding_model, func.count()).group_by(model.embedding_model)):
+                counts[tag] = counts.get(tag, 0) + n
+    return counts
+
+
+def reembed(env, *args):
+    proc = subprocess.run([sys.executable, os.path.join('scripts', 'reembed.py'), '--workers', '2',
+                           '--batch-size', '4', *args], cwd=ROOT, env=env, text=True, capture_output=True)
+    if proc.returncode != 0:
+        print(proc.stdout + proc.stderr)
+    return proc
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'reembed.db')}"
+    os.environ.setdefault('SMS_TRANSPORT', 'log')
+    os.environ['EMBEDDING_INDEX_MERGE_SECONDS'] = '0'
+    checkpoint = os.path.join(tmp, 'checkpoint.json')
+    env = dict(os.environ, PYTHONPATH=ROOT, EMBEDDING_VERSION='1')
+    proc = subprocess.run([sys.executable, '-c', REGISTER, str(USERS)], cwd=ROOT, env=env, text=True,
+                          capture_output=True)
+    registered = [json.loads(line) for line in proc.stdout.splitlines() if line.startswith('{')]
+    if len(registered) != USERS or any(r.get('status') != 'ok' for r in registered):
+        print(f'Could not register users: {proc.stdout}{proc.stderr}')
+        sys.exit(1)
+
+    os.environ['EMBEDDING_VERSION'] = '2'
+    env['EMBEDDING_VERSION'] = '2'
+    import app as app_module
+    import face_recog
+    import models
+    import embedding_index
+    from sqlalchemy import insert
+    client = app_module.app.test_client()
+    old_tag, new_tag = face_recog.current_model().replace('/v2', '/v1'), face_recog.current_model()
+    with models.get_engine().begin() as conn:
+        conn.execute(insert(models.FaceSample), [{
+            'user_id': registered[0]['user_id'], 'face_uuid': registered[0]['face_uuid'], 'sample_uuid': 'gone',
+            'image_path': os.path.join(tmp, 'missing.jpg'), 'embedding_json': '[1.0, 0.0]',
+            'embedding_model': old_tag}])
+    before = tags(models)
+    total = sum(before.values())
+    print(f'{USERS} users registered as {old_tag}, {total} embeddings')
+
+    print('model change')
+    check('all rows tagged with the old model', before == {old_tag: total}, str(before))
+    r = client.post('/recognize', json={'image': face_image(1)})
+    check('old embeddings not matched', r.status_code == 404, f'status {r.status_code}')
+
+    print('partial run')
+    proc = reembed(env, '--max-batches', '2', '--checkpoint', checkpoint)
+    partial = tags(models)
+    saved = json.load(open(checkpoint)) if os.path.exists(checkpoint) else {}
+    check('stops after --max-batches', proc.returncode == 0 and partial.get(new_tag) == 8, str(partial))
+    check('checkpoint written', saved.get('model') == new_tag
+          and sum(t['done'] for t in saved['tables'].values()) == 8)
+
+    print('resume')
+    proc = reembed(env, '--checkpoint', checkpoint)
+    after = tags(models)
+    saved = json.load(open(checkpoint))
+    done = sum(t['done'] for t in saved['tables'].values())
+    failed = sum(t['failed'] for t in saved['tables'].values())
+    check('carries on from the checkpoint', proc.returncode == 0 and done == total - 1, f'{done} re-embedded in total')
+    check('every row with an image re-tagged', after == {new_tag: total - 1, old_tag: 1}, str(after))
+    check('missing image reported', failed == 1 and saved['failures'][0][2] == 'image missing'
+          and 'image missing' in proc.stdout, str(saved['failures']))
+    check('throughput reported', 'images/s' in proc.stdout)
+    check('index rebuilt', 'Rebuilt the embedding index' in proc.stdout)
+    time.sleep(embedding_index.CHECK_SECONDS)
+    r = client.post('/recognize', json={'image': face_image(1)})
+    body = r.get_json() or {}
+    check('re-embedded users matched again', r.status_code == 200
+          and body.get('user_id') == registered[1]['face_uuid'], str(body.get('match')))
+
+    print('checkpoint reuse')
+    proc = reembed(env, '--checkpoint', checkpoint)
+    check('finished run has nothing left', 'users: 0 to re-embed' in proc.stdout)
+    saved['model'] = old_tag
+    json.dump(saved, open(checkpoint, 'w'))
+    proc = reembed(env, '--checkpoint', checkpoint, '--max-batches', '1')
+    check('checkpoint for another model ignored', 'starting over' in proc.stdout
+          and json.load(open(checkpoint))['model'] == new_tag)
+
+    if failures:
+        print(f'{len(failures)} check(s) failed')
+        sys.exit(1)
+    print('All checks passed')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,30 @@
 """
 Script to clear all user data and start fresh.
-Deletes all users, face samples, parcels, and tracking variations.
+Deletes all users, face samples and parcels, live and archived.
 """
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from models import get_session, User, Parcel, FaceSample, TrackingVariation
+from models import (get_session, User, Parcel, FaceSample, ParcelCounter, DailyArrival, ArchivedParcel,
+                    ParcelEvent, PendingArrival)
+from versions import bump_all, new_epoch
 import shutil
 
 def clear_database():
     session = get_session()
     
     # Delete all records
-    session.query(TrackingVariation).delete()
     session.query(FaceSample).delete()
     session.query(Parcel).delete()
+    session.query(ArchivedParcel).delete()
+    session.query(PendingArrival).delete()
+    session.query(ParcelEvent).delete()
     session.query(User).delete()
+    session.query(ParcelCounter).delete()
+    session.query(DailyArrival).delete()  # arrival history behind /forecast and /dashboard/summary
+    bump_all(session.connection())  # bulk deletes skip the ORM events that version ETags
+    new_epoch(session.connection())  # user ids get reused: makes the embedding index rebuild
     session.commit()
     
     print("✓ Deleted all database records")
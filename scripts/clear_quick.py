@@ -5,15 +5,23 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from models import get_session, User, Parcel, FaceSample, TrackingVariation
+from models import (get_session, User, Parcel, FaceSample, ParcelCounter, DailyArrival, ArchivedParcel,
+                    ParcelEvent, PendingArrival)
+from versions import bump_all, new_epoch
 
 session = get_session()
 
 # Delete all records
-session.query(TrackingVariation).delete()
 session.query(FaceSample).delete()
 session.query(Parcel).delete()
+session.query(ArchivedParcel).delete()
+session.query(PendingArrival).delete()
+session.query(ParcelEvent).delete()
 session.query(User).delete()
+session.query(ParcelCounter).delete()
+session.query(DailyArrival).delete()  # arrival history behind /forecast and /dashboard/summary
+bump_all(session.connection())  # bulk deletes skip the ORM events that version ETags
+new_epoch(session.connection())  # user ids get reused: makes the embedding index rebuild
 session.commit()
 
 print("✅ Database cleared!")
@@ -7,6 +7,10 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from models import get_session, User, Parcel
+from tracking import canonicalize_tracking_code
+from storage import allocator
+import counters  # keeps parcel_counters in step with the inserts below
+import versions  # bumps data_versions so cached /track_orders etc. responses are refetched
 import uuid
 import random
 from datetime import datetime, timedelta
@@ -70,6 +74,7 @@ def generate_demo_users(count=5):
 def generate_demo_parcels(users, parcels_per_user=2):
     """Create demo parcels for users"""
     session = get_session()
+    allocator.load(session)
     created_parcels = []
     
     for user in users:
@@ -78,12 +83,6 @@ def generate_demo_parcels(users, parcels_per_user=2):
             prefix = random.choice(TRACKING_PREFIXES)
             tracking_code = f"{prefix}{random.randint(100000, 999999)}"
             
-            # Random slot
-            slot = str(random.randint(1, 50))
-            
-            # Random storage location
-            storage_location = random.choice(STORAGE_LOCATIONS)
-            
             # Random delivery estimate (1-10 days)
             delivery_days = random.randint(1, 10)
             
@@ -94,6 +93,12 @@ def generate_demo_parcels(users, parcels_per_user=2):
             # Random status (mostly stored, some collected)
             status = 'stored' if random.random() > 0.3 else 'collected'
             
+            # Stored parcels need a free slot from the allocator; collected ones no longer occupy one
+            if status == 'stored':
+                storage_location, slot = allocator.allocate()
+            else:
+                storage_location, slot = random.choice(STORAGE_LOCATIONS), str(random.randint(1, 50))
+            
             # Notes
             notes = [
                 "Fragile - Handle with care",
@@ -107,6 +112,7 @@ def generate_demo_parcels(users, parcels_per_user=2):
             
             parcel = Parcel(
                 tracking_code=tracking_code,
+                tracking_key=canonicalize_tracking_code(tracking_code),
                 owner_id=user.id,
                 status=status,
                 slot=slot,
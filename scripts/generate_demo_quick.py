@@ -6,6 +6,10 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from models import get_session, User, Parcel
+from tracking import canonicalize_tracking_code
+from storage import allocator
+import counters  # keeps parcel_counters in step with the inserts below
+import versions  # bumps data_versions so cached /track_orders etc. responses are refetched
 import uuid
 import random
 from datetime import datetime, timedelta
@@ -68,6 +72,7 @@ def generate_demo_users(count=5):
 def generate_demo_parcels(users, parcels_per_user=2):
     """Generate demo parcels for users"""
     session = get_session()
+    allocator.load(session)
     created_parcels = []
     
     for name, face_uuid in users:
@@ -85,8 +90,11 @@ def generate_demo_parcels(users, parcels_per_user=2):
             if status == "collected":
                 collected_time = arrival_time + timedelta(days=random.randint(1, 3))
             
-            # Random storage location and estimated days
-            storage_location = random.choice(STORAGE_LOCATIONS)
+            # Stored parcels need a free slot from the allocator; collected ones no longer occupy one
+            if status == "stored":
+                storage_location, slot = allocator.allocate()
+            else:
+                storage_location, slot = random.choice(STORAGE_LOCATIONS), f"S{random.randint(1, 50):02d}"
             estimated_delivery_days = random.randint(1, 10)
             
             # Optional note
@@ -95,9 +103,10 @@ def generate_demo_parcels(users, parcels_per_user=2):
             
             parcel = Parcel(
                 tracking_code=tracking_code,
+                tracking_key=canonicalize_tracking_code(tracking_code),
                 owner_id=face_uuid,
                 status=status,
-                slot=f"S{random.randint(1, 50):02d}",
+                slot=slot,
                 storage_location=storage_location,
                 estimated_delivery_days=estimated_delivery_days,
                 arrival_time=arrival_time,
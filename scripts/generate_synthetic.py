@@ -13,7 +13,7 @@ import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from models import get_session, User, FaceSample, init_db
-from face_recog import get_embedding_from_file
+from face_recog import embed_file
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 UPLOADS = os.path.join(BASE_DIR, 'uploads')
@@ -71,13 +71,14 @@ def generate_for_user(session, user, samples_per_user=5):
         out_path = os.path.join(UPLOADS, fname)
         try:
             augment_image(user.photo_path, out_path)
-            emb = None
+            emb = emb_model = None
             try:
-                emb_arr = get_embedding_from_file(out_path)
+                emb_arr, emb_model = embed_file(out_path)
                 emb = json.dumps(list(map(float, emb_arr.tolist())))
             except Exception as e:
                 print(f'Warning: failed to get embedding for {out_path}: {e}')
-            fs = FaceSample(user_id=user.id, face_uuid=face_uuid, sample_uuid=sample_uuid, image_path=out_path, embedding_json=emb)
+            fs = FaceSample(user_id=user.id, face_uuid=face_uuid, sample_uuid=sample_uuid, image_path=out_path, embedding_json=emb,
+                            embedding_model=emb_model)
             session.add(fs)
             session.commit()
             created += 1
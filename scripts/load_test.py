@@ -0,0 +1,373 @@
+"""
+End-to-end load test with a mailroom traffic mix.
+
+Drives either a running server (--url http://host:port) or, by default, the app
+in-process through the Flask test client against a scratch SQLite database (the
+real data.db is never touched). Steps:
+  1. seed up to --users users and --parcels parcels (only the difference from what
+     the database already holds); --templates users are registered through /register
+     with the sample images, and in-process the rest are copies of them, since a real
+     /register per user takes seconds. Parcels go in through /parcel/add_batch and
+     --collected-fraction of them are collected through /parcel/mark_collected;
+  2. for each --concurrency level, run --duration seconds of weighted random traffic:
+       recognize      POST /recognize with a template user's image
+       add            POST /parcel/add
+       collect        POST /parcel/collect (face + parcel_id) for a template user's parcel
+       track_orders   GET  /track_orders (mostly ?owner_id=)
+       search         POST /search by tracking code and face_uuid
+       forecast       GET  /forecast?days=7
+  3. report throughput and p50/p95/p99 latency per endpoint and the status codes seen.
+
+Sample images come from --images DIR (jpg/png) or are generated. Against a real
+server, make sure storage has room for the seeded and added parcels; 409s are counted
+under their status code.
+
+Usage: python scripts/load_test.py [--url http://localhost:5000] [--users 200] [--parcels 2000]
+           [--concurrency 1,4,16] [--duration 30] [--mix recognize=10,add=20,...] [--json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import base64
+import argparse
+import tempfile
+import threading
+import http.client
+from urllib.parse import urlparse
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_MIX = 'recognize=10,add=20,collect=10,track_orders=35,search=20,forecast=5'
+BATCH_SIZE = 5000  # app.MAX_BATCH_SIZE
+
+
+class HttpClient:
+    """One keep-alive connection per worker thread to a running server."""
+
+    def __init__(self, base_url):
+        url = urlparse(base_url)
+        self.host, self.port = url.hostname, url.port or (443 if url.scheme == 'https' else 80)
+        self.conn_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self.conn = None
+
+    def request(self, method, path, payload=None):
+        body = json.dumps(payload) if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body else {}
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = self.conn_class(self.host, self.port, timeout=120)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+        try:
+            return response.status, json.loads(data) if data else None
+        except ValueError:
+            return response.status, None
+
+
+class TestClient:
+    """The same interface over the Flask test client."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, payload=None):
+        response = self.client.open(path, method=method, json=payload)
+        return response.status_code, response.get_json(silent=True)
+
+
+def load_images(directory, count):
+    if directory:
+        names = sorted(n for n in os.listdir(directory) if n.lower().endswith(('.jpg', '.jpeg', '.png')))
+        images = []
+        for name in names[:count]:
+            with open(os.path.join(directory, name), 'rb') as f:
+                mime = 'png' if name.lower().endswith('.png') else 'jpeg'
+                images.append(f'data:image/{mime};base64,' + base64.b64encode(f.read()).decode())
+        if images:
+            return images
+    import cv2
+    import numpy as np
+    images = []
+    for seed in range(count):
+        rng = np.random.default_rng(seed)
+        ok, buf = cv2.imencode('.jpg', (rng.random((160, 160, 3)) * 255).astype(np.uint8))
+        images.append('data:image/jpeg;base64,' + base64.b64encode(buf.tobytes()).decode())
+    return images
+
+
+class State:
+    """Ids shared by the traffic generators: users, and parcels that can be collected or searched."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.templates = []  # (user_id, face_uuid, image)
+        self.owner_ids = []
+        self.collectable = []  # (parcel_id, tracking_code, template index), stored
+        self.counter = 0
+
+    def tracking_code(self):
+        with self.lock:
+            self.counter += 1
+            return f'LT-{os.getpid()}-{self.counter:08d}'
+
+    def take_collectable(self):
+        with self.lock:
+            if not self.collectable:
+                return None
+            return self.collectable.pop(random.randrange(len(self.collectable)))
+
+    def sample_collectable(self):
+        with self.lock:
+            return random.choice(self.collectable) if self.collectable else None
+
+
+def seed(client_factory, state, args, images, in_process_models):
+    client = client_factory()
+    status, body = client.request('GET', '/status')
+    users, parcels = (body or {}).get('users', 0), (body or {}).get('parcels', 0)
+    print(f'Database has {users} users and {parcels} parcels')
+
+    for i in range(args.templates):
+        status, body = client.request('POST', '/register', {'name': f'Load Test {i}', 'phone': '', 'image': images[i]})
+        if status != 200:
+            raise SystemExit(f'/register failed ({status}): {body}')
+        state.templates.append((body['user_id'], body['face_uuid'], images[i]))
+    users += args.templates
+
+    missing = max(0, args.users - users)
+    if missing and in_process_models:
+        clone_users(in_process_models, state, missing)
+    elif missing:
+        for i in range(missing):
+            t = i % len(images)
+            status, body = client.request('POST', '/register', {'name': f'Load Test {args.templates + i}', 'phone': '', 'image': images[t]})
+            if status == 200:
+                state.owner_ids.append(body['user_id'])
+    state.owner_ids.extend(t[0] for t in state.templates)
+    print(f'Seeded {args.templates + missing} users')
+
+    missing = max(0, args.parcels - parcels)
+    seeded = []
+    while len(seeded) < missing:
+        rows = []
+        for _ in range(min(BATCH_SIZE, missing - len(seeded))):
+            t = random.randrange(len(state.templates)) if random.random() < 0.2 else None
+            owner = state.templates[t][0] if t is not None else random.choice(state.owner_ids)
+            rows.append(({'tracking_code': state.tracking_code(), 'owner_id': owner}, t))
+        status, body = client.request('POST', '/parcel/add_batch', [r for r, _ in rows])
+        if status != 200:
+            raise SystemExit(f'/parcel/add_batch failed ({status}): {body}')
+        for (row, t), result in zip(rows, body['results']):
+            seeded.append((result.get('parcel_id'), row['tracking_code'], t))
+
+    to_collect = [p for p in seeded if p[0] and random.random() < args.collected_fraction]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda p: client_factory().request('POST', '/parcel/mark_collected', {'parcel_id': p[0]}), to_collect))
+    collected = {p[0] for p in to_collect}
+    state.collectable = [p for p in seeded if p[0] and p[0] not in collected and p[2] is not None]
+    print(f'Seeded {len(seeded)} parcels ({len(collected)} collected)')
+
+
+def clone_users(models, state, count):
+    """Insert `count` users copying the template users' embeddings and face samples."""
+    session = models.get_session()
+    templates = [session.get(models.User, t[0]) for t in state.templates]
+    samples = {t.id: session.query(models.FaceSample).filter_by(user_id=t.id).all() for t in templates}
+    created = []
+    for i in range(count):
+        t = templates[i % len(templates)]
+        user = models.User(name=f'Load Test Clone {i}', phone='', face_uuid=f'LT{i:07d}',
+                           embedding_json=t.embedding_json, embedding_model=t.embedding_model,
+                           photo_path=t.photo_path)
+        user.samples = [models.FaceSample(face_uuid=user.face_uuid, sample_uuid=f'{s.sample_uuid}-lt{i}',
+                                          image_path=s.image_path, embedding_json=s.embedding_json,
+                                          embedding_model=s.embedding_model) for s in samples[t.id]]
+        session.add(user)
+        created.append(user)
+        if len(created) % 500 == 0:
+            session.commit()
+    session.commit()
+    state.owner_ids.extend(u.id for u in created)
+    session.close()
+
+
+def make_ops(state):
+    def recognize(client):
+        _, face_uuid, image = random.choice(state.templates)
+        return client.request('POST', '/recognize', {'image': image})
+
+    def add(client):
+        t = random.randrange(len(state.templates))
+        code = state.tracking_code()
+        status, body = client.request('POST', '/parcel/add', {'tracking_code': code, 'owner_id': state.templates[t][0]})
+        if status == 200:
+            with state.lock:
+                state.collectable.append((body['parcel_id'], code, t))
+        return status, body
+
+    def collect(client):
+        parcel = state.take_collectable()
+        if parcel is None:
+            return recognize(client)
+        return client.request('POST', '/parcel/collect', {'image': state.templates[parcel[2]][2], 'parcel_id': parcel[0]})
+
+    def track_orders(client):
+        if random.random() < 0.2:
+            return client.request('GET', '/track_orders')
+        return client.request('GET', f'/track_orders?owner_id={random.choice(state.owner_ids)}')
+
+    def search(client):
+        parcel = state.sample_collectable()
+        if parcel is None:
+            return client.request('POST', '/search', {'tracking_code': 'LT-NONE', 'face_uuid': state.templates[0][1]})
+        return client.request('POST', '/search', {'tracking_code': parcel[1], 'face_uuid': state.templates[parcel[2]][1]})
+
+    def forecast(client):
+        return client.request('GET', '/forecast?days=7')
+
+    return {'recognize': recognize, 'add': add, 'collect': collect,
+            'track_orders': track_orders, 'search': search, 'forecast': forecast}
+
+
+def parse_mix(text, ops):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in ops:
+            raise SystemExit(f'Unknown operation {name!r}; choose from {", ".join(ops)}')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000 if ordered else 0.0
+
+
+def run_level(client_factory, ops, mix, concurrency, duration, warmup):
+    names, weights = list(mix), list(mix.values())
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + warmup + duration
+    measure_from = time.perf_counter() + warmup
+
+    def worker():
+        client = client_factory()
+        rng = random.Random()
+        while True:
+            start = time.perf_counter()
+            if start >= deadline:
+                return
+            name = rng.choices(names, weights)[0]
+            try:
+                status, _ = ops[name](client)
+            except Exception as e:
+                status = type(e).__name__
+            end = time.perf_counter()
+            elapsed = end - start
+            # Completions inside the measured window count, so slow requests are not dropped
+            if measure_from <= end <= deadline:
+                with lock:
+                    latencies[name].append(elapsed)
+                    statuses[name][str(status)] += 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for f in [executor.submit(worker) for _ in range(concurrency)]:
+            f.result()
+
+    report = {'concurrency': concurrency, 'duration_seconds': duration, 'endpoints': {}}
+    total = 0
+    for name in names:
+        ordered = sorted(latencies[name])
+        total += len(ordered)
+        report['endpoints'][name] = {
+            'requests': len(ordered),
+            'throughput_rps': round(len(ordered) / duration, 2),
+            'p50_ms': round(percentile(ordered, 0.50), 2),
+            'p95_ms': round(percentile(ordered, 0.95), 2),
+            'p99_ms': round(percentile(ordered, 0.99), 2),
+            'statuses': dict(statuses[name]),
+        }
+    report['requests'] = total
+    report['throughput_rps'] = round(total / duration, 2)
+    return report
+
+
+def print_level(report):
+    print(f"concurrency {report['concurrency']}: {report['requests']} requests, {report['throughput_rps']} req/s")
+    print(f"  {'endpoint':14s} {'req':>7s} {'req/s':>8s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}  statuses")
+    for name, e in report['endpoints'].items():
+        codes = ' '.join(f'{k}:{v}' for k, v in sorted(e['statuses'].items()))
+        print(f"  {name:14s} {e['requests']:7d} {e['throughput_rps']:8.2f} {e['p50_ms']:9.1f} {e['p95_ms']:9.1f} {e['p99_ms']:9.1f}  {codes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='base URL of a running server (default: in-process test client)')
+    parser.add_argument('--users', type=int, default=200, help='seed the database up to this many users (default 200)')
+    parser.add_argument('--parcels', type=int, default=2000, help='seed the database up to this many parcels (default 2000)')
+    parser.add_argument('--templates', type=int, default=3, help='users registered through /register (default 3)')
+    parser.add_argument('--collected-fraction', type=float, default=0.7, help='share of seeded parcels collected (default 0.7)')
+    parser.add_argument('--images', help='directory of face images for /register and /recognize')
+    parser.add_argument('--concurrency', default='1,4,16', help='concurrent clients per run (default 1,4,16)')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds per concurrency level (default 30)')
+    parser.add_argument('--warmup', type=float, default=3, help='unmeasured seconds before each level (default 3)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'operation weights (default {DEFAULT_MIX})')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the traffic mix')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    models = None
+    if args.url:
+        def client_factory():
+            return HttpClient(args.url)
+    else:
+        tmp = tempfile.mkdtemp()
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'load.db')}"
+        os.environ.setdefault('SMS_TRANSPORT', 'log')
+        import app as app_module
+        import models
+        from storage import allocator
+        session = models.get_session()
+        session.add(models.StorageLocation(name='Load Test Bay', capacity=args.parcels + 100000))
+        session.commit()
+        session.close()
+        allocator.load()
+
+        def client_factory():
+            return TestClient(app_module.app)
+
+    state = State()
+    images = load_images(args.images, max(args.templates, 1))
+    args.templates = min(max(args.templates, 1), len(images))
+    seed(client_factory, state, args, images, models)
+
+    ops = make_ops(state)
+    mix = parse_mix(args.mix, ops)
+    reports = []
+    for concurrency in (int(c) for c in args.concurrency.split(',')):
+        report = run_level(client_factory, ops, mix, concurrency, args.duration, args.warmup)
+        reports.append(report)
+        if not args.json:
+            print_level(report)
+    if args.json:
+        print(json.dumps({'target': args.url or 'in-process', 'users': args.users, 'parcels': args.parcels,
+                          'mix': mix, 'levels': reports}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Add the embedding_model column to users and face_samples and tag existing embeddings.
+
+Matching only compares embeddings produced by the same model (see face_recog.py), so
+untagged rows are never matched. Embeddings stored before the column existed came from
+the then hard-coded VGG-Face model or, for 160x160 = 25600 values, from the OpenCV
+fallback; they are tagged as version 1 of those. Rows whose JSON cannot be read stay
+untagged. Run scripts/reembed.py afterwards if FACE_MODEL or EMBEDDING_VERSION is set to
+something else. Safe to run more than once.
+"""
+import os
+import sys
+import json
+import sqlite3
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy.engine import make_url
+from models import DATABASE_URL, init_db
+
+LEGACY_DEEPFACE_TAG = 'deepface/VGG-Face/v1'
+LEGACY_FALLBACK_TAG = 'opencv/gray160/v1'
+
+
+def legacy_tag(embedding_json):
+    try:
+        size = len(json.loads(embedding_json))
+    except Exception:
+        return None
+    if not size:
+        return None
+    return LEGACY_FALLBACK_TAG if size == 160 * 160 else LEGACY_DEEPFACE_TAG
+
+
+def ensure_column(conn, table):
+    cur = conn.cursor()
+    cur.execute(f'PRAGMA table_info({table})')
+    if 'embedding_model' in [r[1] for r in cur.fetchall()]:
+        print(f'embedding_model already present on {table} table')
+    else:
+        print(f'Adding embedding_model column to {table} table')
+        cur.execute(f'ALTER TABLE {table} ADD COLUMN embedding_model VARCHAR(100)')
+    conn.commit()
+
+
+def backfill(conn, table):
+    conn.create_function('legacy_tag', 1, legacy_tag, deterministic=True)
+    cur = conn.cursor()
+    cur.execute(f"""
+        UPDATE {table} SET embedding_model = legacy_tag(embedding_json)
+        WHERE embedding_model IS NULL AND embedding_json IS NOT NULL
+    """)
+    print(f'Tagged {cur.rowcount} {table} rows')
+    cur.execute(f'SELECT embedding_model, COUNT(*) FROM {table} GROUP BY embedding_model ORDER BY 2 DESC')
+    for tag, count in cur.fetchall():
+        print(f'  {tag or "(untagged)"}: {count}')
+    conn.commit()
+
+
+if __name__ == '__main__':
+    init_db()
+    conn = sqlite3.connect(make_url(DATABASE_URL).database)
+    try:
+        for table in ('users', 'face_samples'):
+            ensure_column(conn, table)
+            backfill(conn, table)
+    finally:
+        conn.close()
+    print('Done. Rebuild the embedding index with scripts/rebuild_embedding_index.py')
@@ -0,0 +1,100 @@
+"""
+Stop SQLite from reusing the ids of archived parcels.
+
+Without AUTOINCREMENT, SQLite hands the id of the newest deleted row to the next insert,
+so once the newest parcel was archived a new parcel could get its id: it then clashed
+with parcels_archive (archive.py refuses to move it), with parcel_events, with the
+owner's data versions and with the parcel's SMS idempotency key. This rebuilds the
+parcels table with AUTOINCREMENT (same rows, ids and indexes) and starts the id sequence
+above every id in parcels and parcels_archive. Live parcels that already reused an
+archived id are given a fresh one (pending_arrivals follows), so archive.py can move them
+later. Run it with the app stopped. Safe to run more than once.
+"""
+import os
+import sys
+import sqlite3
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.schema import CreateIndex, CreateTable
+from models import DATABASE_URL, init_db, Parcel
+
+
+def has_autoincrement(cur):
+    cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'parcels'")
+    return 'AUTOINCREMENT' in cur.fetchone()[0].upper()
+
+
+def rebuild(cur):
+    dialect = sqlite.dialect()
+    table = Parcel.__table__
+    cur.execute('PRAGMA table_info(parcels)')
+    existing = {r[1] for r in cur.fetchall()}
+    columns = ', '.join(c.name for c in table.columns if c.name in existing)
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'parcels' AND sql IS NOT NULL")
+    old_indexes = [r[0] for r in cur.fetchall()]
+    cur.execute('BEGIN IMMEDIATE')
+    try:
+        cur.execute('ALTER TABLE parcels RENAME TO parcels_rebuild')
+        for name in old_indexes:
+            cur.execute(f'DROP INDEX "{name}"')
+        cur.execute(str(CreateTable(table).compile(dialect=dialect)))
+        for index in table.indexes:
+            cur.execute(str(CreateIndex(index).compile(dialect=dialect)))
+        cur.execute(f'INSERT INTO parcels ({columns}) SELECT {columns} FROM parcels_rebuild')
+        cur.execute('DROP TABLE parcels_rebuild')
+        cur.execute('COMMIT')
+    except Exception:
+        cur.execute('ROLLBACK')
+        raise
+    print(f'Rebuilt parcels with AUTOINCREMENT ({len(table.indexes)} indexes)')
+
+
+def seed_sequence(cur):
+    cur.execute('SELECT MAX(m) FROM (SELECT MAX(id) AS m FROM parcels UNION ALL SELECT MAX(id) FROM parcels_archive)')
+    highest = cur.fetchone()[0] or 0
+    cur.execute('BEGIN IMMEDIATE')
+    cur.execute("SELECT seq FROM sqlite_sequence WHERE name = 'parcels'")
+    row = cur.fetchone()
+    if row is None:
+        cur.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('parcels', ?)", (highest,))
+    elif row[0] < highest:
+        cur.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'parcels'", (highest,))
+    cur.execute('COMMIT')
+    print(f'New parcels get ids above {max(highest, row[0] if row else 0)}')
+
+
+def renumber_reused(cur):
+    cur.execute('SELECT p.id, p.tracking_code, a.tracking_code FROM parcels p JOIN parcels_archive a ON a.id = p.id'
+                ' ORDER BY p.id')
+    reused = cur.fetchall()
+    if not reused:
+        return
+    cur.execute('BEGIN IMMEDIATE')
+    cur.execute("SELECT seq FROM sqlite_sequence WHERE name = 'parcels'")
+    seq = cur.fetchone()[0]
+    for old_id, live, archived in reused:
+        seq += 1
+        cur.execute('UPDATE parcels SET id = ? WHERE id = ?', (seq, old_id))
+        cur.execute('UPDATE pending_arrivals SET parcel_id = ? WHERE parcel_id = ?', (seq, old_id))
+        print(f'  Parcel {live} reused the id of archived parcel {archived}: {old_id} -> {seq}')
+    cur.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'parcels'", (seq,))
+    cur.execute('COMMIT')
+    print(f'Renumbered {len(reused)} parcel(s)')
+
+
+if __name__ == '__main__':
+    init_db()
+    conn = sqlite3.connect(make_url(DATABASE_URL).database, isolation_level=None)
+    try:
+        cur = conn.cursor()
+        if has_autoincrement(cur):
+            print('parcels already uses AUTOINCREMENT')
+        else:
+            rebuild(cur)
+        seed_sequence(cur)
+        renumber_reused(cur)
+    finally:
+        conn.close()
+    print('Migration complete')
@@ -0,0 +1,75 @@
+"""
+Move an existing database onto the storage allocator.
+
+Seeds storage_locations, re-slots stored parcels whose (storage_location, slot)
+is unknown, out of range or shared with another stored parcel, then creates
+the partial unique index that keeps concurrent workers from double-assigning
+a slot. Safe to run more than once.
+"""
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import text
+from models import get_session, init_db, Parcel, StorageLocation
+from storage import allocator, ensure_default_locations, StorageFullError
+import versions  # bumps data_versions for re-slotted parcels
+
+
+def invalid_stored_parcels(session):
+    capacity = {loc.name: loc.capacity for loc in session.query(StorageLocation).all()}
+    seen = set()
+    invalid = []
+    for p in session.query(Parcel).filter(Parcel.status == 'stored').order_by(Parcel.id).all():
+        pair = (p.storage_location, p.slot)
+        try:
+            in_range = 1 <= int(p.slot) <= capacity.get(p.storage_location, 0)
+        except (TypeError, ValueError):
+            in_range = False
+        if not in_range or pair in seen:
+            invalid.append(p)
+        else:
+            seen.add(pair)
+    return invalid
+
+
+def reslot(session):
+    invalid = invalid_stored_parcels(session)
+    if not invalid:
+        print('All stored parcels already have valid slots')
+        return True
+    allocator.load(session)
+    try:
+        assignments = allocator.allocate_many(len(invalid))
+    except StorageFullError as e:
+        print(f'Cannot re-slot {len(invalid)} parcels: {e}')
+        return False
+    for p, assignment in zip(invalid, assignments):
+        print(f'Parcel {p.id}: {p.storage_location}/{p.slot} -> {assignment.storage_location}/{assignment.slot}')
+        p.storage_location = assignment.storage_location
+        p.slot = assignment.slot
+    session.commit()
+    return True
+
+
+def create_index(session):
+    session.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_parcels_stored_slot "
+        "ON parcels (storage_location, slot) WHERE status = 'stored'"
+    ))
+    session.commit()
+    print('Unique index ux_parcels_stored_slot present')
+
+
+if __name__ == '__main__':
+    init_db()
+    session = get_session()
+    seeded = ensure_default_locations(session)
+    if seeded:
+        print(f'Seeded {seeded} default storage locations')
+    if reslot(session):
+        create_index(session)
+        print('Migration complete')
+    else:
+        print('Add storage locations or collect parcels, then run again')
+        sys.exit(1)
@@ -0,0 +1,66 @@
+"""
+Collapse the tracking_variations table into parcels.tracking_key.
+
+Older versions stored up to 5 random variations of every tracking code in
+tracking_variations. Search now canonicalizes codes (see tracking.py), so a
+single indexed key per parcel replaces them. Safe to run more than once.
+"""
+import os
+import sqlite3
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy.engine import make_url
+from models import DATABASE_URL, init_db
+from tracking import canonicalize_tracking_code
+
+
+def ensure_column(conn):
+    cur = conn.cursor()
+    cur.execute("PRAGMA table_info(parcels)")
+    cols = [r[1] for r in cur.fetchall()]
+    if 'tracking_key' in cols:
+        print('tracking_key already present on parcels table')
+    else:
+        print('Adding tracking_key column to parcels table')
+        cur.execute('ALTER TABLE parcels ADD COLUMN tracking_key VARCHAR(200)')
+    cur.execute('CREATE INDEX IF NOT EXISTS ix_parcels_tracking_key ON parcels (tracking_key)')
+    conn.commit()
+
+
+def backfill_keys(conn):
+    conn.create_function('canonical_tracking', 1, canonicalize_tracking_code, deterministic=True)
+    cur = conn.cursor()
+    cur.execute("""
+        UPDATE parcels SET tracking_key = canonical_tracking(tracking_code)
+        WHERE tracking_key IS NULL AND tracking_code IS NOT NULL
+    """)
+    print(f'Backfilled tracking_key for {cur.rowcount} parcels')
+
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'tracking_variations'")
+    if cur.fetchone():
+        # Parcels that lost their tracking_code still have the original in their variations
+        cur.execute("""
+            UPDATE parcels SET tracking_key = canonical_tracking(
+                (SELECT tv.original_code FROM tracking_variations tv
+                 WHERE tv.parcel_id = parcels.id ORDER BY tv.id LIMIT 1))
+            WHERE tracking_key IS NULL
+              AND EXISTS (SELECT 1 FROM tracking_variations tv WHERE tv.parcel_id = parcels.id)
+        """)
+        print(f'Recovered tracking_key from variations for {cur.rowcount} parcels')
+        cur.execute('DROP TABLE tracking_variations')
+        print('Dropped tracking_variations table')
+    else:
+        print('tracking_variations table not present; nothing to collapse')
+    conn.commit()
+
+
+if __name__ == '__main__':
+    init_db()
+    conn = sqlite3.connect(make_url(DATABASE_URL).database)
+    try:
+        ensure_column(conn)
+        backfill_keys(conn)
+    finally:
+        conn.close()
+    print('Migration complete')
@@ -0,0 +1,18 @@
+"""
+Recompute the parcel_counters summary table from parcels and users.
+
+The app keeps the counters current on every write; run this after editing the
+database by hand or with bulk deletes that bypass the ORM.
+"""
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import get_session, init_db
+from counters import rebuild_counters
+
+if __name__ == '__main__':
+    init_db()
+    session = get_session()
+    rows = rebuild_counters(session)
+    print(f'Rebuilt parcel_counters ({rows} rows)')
@@ -0,0 +1,38 @@
+"""
+Write a new embedding index snapshot from users and face_samples and make it current.
+
+The app only ever appends embeddings, and merges new ones into the snapshot on its own
+(see embedding_index.py). Run this after editing or deleting embeddings in place, or with
+--merge to fold the pending registrations in right away. Running workers switch to the
+new snapshot within a second. Safe to run while the app is serving.
+
+Usage: python scripts/rebuild_embedding_index.py [--merge] [--dir DIR]
+"""
+import os
+import sys
+import time
+import argparse
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import init_db
+from versions import init_versions
+import embedding_index
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--merge', action='store_true', help='only append embeddings newer than the current snapshot')
+    parser.add_argument('--dir', default=embedding_index.EMBEDDING_INDEX_DIR,
+                        help=f'index directory (default {embedding_index.EMBEDDING_INDEX_DIR})')
+    args = parser.parse_args()
+
+    init_db()
+    init_versions()
+    start = time.perf_counter()
+    name = embedding_index.merge(args.dir) if args.merge else embedding_index.rebuild(args.dir)
+    if name is None:
+        print(f'Nothing to merge; {embedding_index.current_name(args.dir)} is current')
+        sys.exit(0)
+    snapshot = embedding_index.Snapshot(os.path.join(args.dir, name))
+    size = sum(os.path.getsize(os.path.join(snapshot.path, f)) for f in os.listdir(snapshot.path))
+    sizes = ', '.join(f"{g['model']}: {g['rows']} x {g['dim']}" for g in snapshot.meta['groups']) or 'empty'
+    print(f'Wrote {name} ({sizes}; {size / 2 ** 20:.1f} MB) in {time.perf_counter() - start:.1f}s')
@@ -0,0 +1,189 @@
+"""
+Recompute every stored face embedding with the current model and tag it.
+
+Run after changing FACE_MODEL or EMBEDDING_VERSION (see face_recog.py): until a row is
+re-embedded, matching never compares it with new vectors. Every users.photo_path and
+face_samples.image_path is embedded again by a pool of --workers processes that load the
+model once each, --batch-size images per task. The main process writes each batch in one
+transaction and then records its progress in a checkpoint file, so the job can be
+stopped at any point (Ctrl-C, --max-batches) and re-run to carry on where it left off.
+Rows already tagged with the target model are skipped. Rows whose image is missing or
+cannot be embedded keep their old vector and tag and are listed at the end; --restart
+forgets the checkpoint and tries them again. Throughput is reported per batch. The
+embedding index is rebuilt at the end, since rows were changed in place.
+
+Usage: python scripts/reembed.py [--workers N] [--batch-size 16] [--max-batches N]
+           [--checkpoint FILE] [--restart]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import bindparam, func, or_, select, update
+from sqlalchemy.engine import make_url
+
+from models import DATABASE_URL, get_engine, init_db, User, FaceSample
+
+# table name -> (model, image path column)
+TABLES = {
+    'users': (User, User.photo_path),
+    'face_samples': (FaceSample, FaceSample.image_path),
+}
+MAX_LISTED_FAILURES = 1000
+
+
+def default_checkpoint():
+    return os.path.join(os.path.dirname(os.path.abspath(make_url(DATABASE_URL).database)), 'reembed_checkpoint.json')
+
+
+def init_worker():
+    import face_recog
+    face_recog.load_model()
+
+
+def embed_batch(batch):
+    """[(row id, embedding_json, model tag, error)] for [(row id, image path)]."""
+    from face_recog import embed_file
+    results = []
+    for row_id, path in batch:
+        if path and not os.path.isabs(path):
+            path = os.path.join(ROOT, path)
+        if not path or not os.path.exists(path):
+            results.append((row_id, None, None, 'image missing'))
+            continue
+        try:
+            # Same detection setting as /register, so DeepFace never falls back to OpenCV
+            vec, tag = embed_file(path, enforce_detection=False)
+            results.append((row_id, json.dumps(list(map(float, vec.tolist()))), tag, None))
+        except Exception as e:
+            results.append((row_id, None, None, str(e)))
+    return results
+
+
+def load_checkpoint(path, target, restart):
+    fresh = {'model': target, 'tables': {t: {'after_id': 0, 'done': 0, 'failed': 0} for t in TABLES},
+             'failures': [], 'seconds': 0.0}
+    if restart or not os.path.exists(path):
+        return fresh
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('model') != target:
+        print(f"Checkpoint {path} is for {checkpoint.get('model')}, starting over for {target}")
+        return fresh
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp, path)
+
+
+def pending_rows(engine, table, target, after_id):
+    model, path_column = TABLES[table]
+    with engine.connect() as conn:
+        return conn.execute(select(model.id, path_column)
+                            .where(model.id > after_id,
+                                   or_(model.embedding_model.is_(None), model.embedding_model != target))
+                            .order_by(model.id)).all()
+
+
+def fmt_duration(seconds):
+    seconds = int(seconds)
+    return f'{seconds // 3600}h{seconds // 60 % 60:02d}m' if seconds >= 3600 else f'{seconds // 60}m{seconds % 60:02d}s'
+
+
+def reembed(args):
+    import face_recog
+    target = face_recog.current_model()
+    checkpoint = load_checkpoint(args.checkpoint, target, args.restart)
+    engine = get_engine()
+    print(f'Re-embedding with {target} on {args.workers} worker(s), {args.batch_size} images per batch')
+
+    batches_run = 0
+    stopped = False
+    ctx = multiprocessing.get_context('spawn')  # TensorFlow does not survive fork
+    with ctx.Pool(args.workers, initializer=init_worker) as pool:
+        for table, (model, _) in TABLES.items():
+            progress = checkpoint['tables'][table]
+            rows = pending_rows(engine, table, target, progress['after_id'])
+            with engine.connect() as conn:
+                total = conn.execute(select(func.count()).select_from(model)).scalar()
+            print(f'{table}: {len(rows)} to re-embed of {total}')
+            if not rows:
+                continue
+            stmt = (update(model).where(model.id == bindparam('row_id'))
+                    .values(embedding_json=bindparam('embedding'), embedding_model=bindparam('tag')))
+            batches = [rows[i:i + args.batch_size] for i in range(0, len(rows), args.batch_size)]
+            if args.max_batches is not None:
+                batches = batches[:max(0, args.max_batches - batches_run)]
+                stopped = batches_run + len(batches) >= args.max_batches
+            started = time.perf_counter()
+            processed = 0
+            try:
+                for batch, results in zip(batches, pool.imap(embed_batch, batches)):
+                    batch_start = time.perf_counter()
+                    ok = [{'row_id': r, 'embedding': e, 'tag': t} for r, e, t, err in results if err is None]
+                    if ok:
+                        with engine.begin() as conn:
+                            conn.execute(stmt, ok)
+                    failed = [(table, r, err) for r, _, _, err in results if err is not None]
+                    progress['after_id'] = batch[-1][0]
+                    progress['done'] += len(ok)
+                    progress['failed'] += len(failed)
+                    room = MAX_LISTED_FAILURES - len(checkpoint['failures'])
+                    checkpoint['failures'].extend(failed[:max(0, room)])
+                    checkpoint['seconds'] += time.perf_counter() - batch_start
+                    save_checkpoint(args.checkpoint, checkpoint)
+                    batches_run += 1
+                    processed += len(batch)
+                    elapsed = time.perf_counter() - started
+                    rate = processed / elapsed if elapsed else 0.0
+                    eta = (len(rows) - processed) / rate if rate else 0.0
+                    print(f'  {table}: {processed}/{len(rows)} ({processed / len(rows):.0%})  '
+                          f'{rate:.1f} images/s  ETA {fmt_duration(eta)}  failed {progress["failed"]}', flush=True)
+            except KeyboardInterrupt:
+                pool.terminate()
+                print('Interrupted; run again to resume from the checkpoint')
+                stopped = True
+            if stopped:
+                break
+    return checkpoint, stopped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='embedding processes (default: half the CPUs)')
+    parser.add_argument('--batch-size', type=int, default=16, help='images per task and per transaction (default 16)')
+    parser.add_argument('--max-batches', type=int, default=None, help='stop after this many batches')
+    parser.add_argument('--checkpoint', default=default_checkpoint(), help='progress file (default next to the database)')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and retry earlier failures')
+    args = parser.parse_args()
+
+    init_db()
+    start = time.perf_counter()
+    checkpoint, stopped = reembed(args)
+    for table, progress in checkpoint['tables'].items():
+        print(f"{table}: {progress['done']} re-embedded, {progress['failed']} failed")
+    for table, row_id, error in checkpoint['failures'][:10]:
+        print(f'  {table} {row_id}: {error}')
+    if len(checkpoint['failures']) > 10:
+        print(f"  ... {len(checkpoint['failures']) - 10} more in {args.checkpoint}")
+    print(f"{'Stopped' if stopped else 'Finished'} after {fmt_duration(time.perf_counter() - start)}")
+
+    import embedding_index
+    if embedding_index.EMBEDDING_INDEX:
+        name = embedding_index.rebuild()
+        print(f'Rebuilt the embedding index ({name})')
+
+
+if __name__ == '__main__':
+    main()
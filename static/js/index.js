@@ -0,0 +1,181 @@
+const video = document.getElementById("video");
+const canvas = document.getElementById("canvas");
+const ctx = canvas.getContext("2d");
+const result = document.getElementById("result");
+const cameraStatus = document.getElementById("cameraStatus");
+const startCameraBtn = document.getElementById("startCameraBtn");
+const stopCameraBtn = document.getElementById("stopCameraBtn");
+const recognizedIdBox = document.getElementById("recognizedIdBox");
+const cameraSelect = document.getElementById("cameraSelect");
+let stream = null;
+let cameraActive = false;
+let availableCameras = [];
+
+// Get list of available cameras
+async function getCameras() {
+  try {
+    const devices = await navigator.mediaDevices.enumerateDevices();
+    availableCameras = devices.filter(device => device.kind === 'videoinput');
+
+    cameraSelect.innerHTML = '';
+    if (availableCameras.length === 0) {
+      cameraSelect.innerHTML = '<option value="">No cameras found</option>';
+    } else {
+      availableCameras.forEach((camera, index) => {
+        const option = document.createElement('option');
+        option.value = camera.deviceId;
+        option.text = camera.label || `Camera ${index + 1}`;
+        cameraSelect.appendChild(option);
+      });
+    }
+  } catch (err) {
+    console.error('Error getting cameras:', err);
+    cameraSelect.innerHTML = '<option value="">Error loading cameras</option>';
+  }
+}
+
+async function startCamera(){
+  try{
+    if(stream){
+      stream.getTracks().forEach(t=>t.stop())
+    }
+
+    const selectedDeviceId = cameraSelect.value;
+    const constraints = {
+      video: {
+        deviceId: selectedDeviceId ? {exact: selectedDeviceId} : undefined,
+        width: {ideal: 640},
+        height: {ideal: 480}
+      }
+    };
+
+    stream=await navigator.mediaDevices.getUserMedia(constraints);
+    video.srcObject=stream;
+    cameraActive=true;
+    cameraStatus.textContent="Camera Active";
+    cameraStatus.className="camera-status active";
+    startCameraBtn.disabled=true;
+    stopCameraBtn.disabled=false;
+    console.log("Camera started with device:", selectedDeviceId);
+  }catch(err){
+    showError("Camera Error: "+err.message+"<br><br>Please ensure:<br>Camera permissions are granted<br>Camera is not being used by another app");
+    cameraStatus.textContent="Camera Failed";
+    cameraStatus.className="camera-status inactive"
+  }
+}
+
+function stopCamera(){if(stream){stream.getTracks().forEach(t=>t.stop());stream=null}video.srcObject=null;cameraActive=false;cameraStatus.textContent="Camera Off";cameraStatus.className="camera-status inactive";startCameraBtn.disabled=false;stopCameraBtn.disabled=true;console.log("Camera stopped")}
+
+startCameraBtn.addEventListener("click",startCamera);
+stopCameraBtn.addEventListener("click",stopCamera);
+cameraSelect.addEventListener("change", () => {
+  if (cameraActive) {
+    stopCamera();
+    setTimeout(() => startCamera(), 300);
+  }
+});
+
+window.addEventListener("load",()=>{
+  getCameras().then(() => {
+    setTimeout(startCamera,500);
+  });
+});
+function captureImage(){if(!cameraActive){throw new Error("Camera is not active")}canvas.width=video.videoWidth;canvas.height=video.videoHeight;ctx.drawImage(video,0,0);return canvas.toDataURL("image/jpeg",0.8)}
+async function postJson(url,body){return fetch(url,{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify(body)})}
+function showLoading(msg){result.innerHTML="<div class=\"loading\"><div class=\"spinner\"></div><p>"+(msg||"Processing...")+"</p></div>"}
+function showSuccess(title,content){result.innerHTML="<div class=\"success-card\"><h2>"+title+"</h2>"+content+"</div>"}
+function showError(msg){result.innerHTML="<div class=\"error-card\"><h2>Error</h2><p>"+msg+"</p></div>"}
+function updateRecognizedIdBox(id){
+  recognizedIdBox.className="";
+  recognizedIdBox.innerHTML="<div class=\"id-label\">YOUR ID (Click to Copy)</div><div class=\"id-value\">"+id+"</div>";
+  recognizedIdBox.onclick = () => {
+    navigator.clipboard.writeText(id).then(() => {
+      const original = recognizedIdBox.innerHTML;
+      recognizedIdBox.innerHTML="<div class=\"id-label\" style=\"color:var(--green)\">COPIED!</div><div class=\"id-value\">"+id+"</div>";
+      setTimeout(() => {
+        recognizedIdBox.innerHTML = original;
+      }, 1500);
+    }).catch(err => {
+      console.error('Copy failed:', err);
+    });
+  };
+}
+function clearRecognizedIdBox(){recognizedIdBox.className="empty";recognizedIdBox.innerHTML="<div style=\"font-size:0.75rem\">Your ID will<br>appear here</div>"}
+document.getElementById("registerBtn").addEventListener("click",async function(){if(!cameraActive){showError("Please start the camera first!");return}const name=document.getElementById("name").value.trim();const phone=document.getElementById("phone").value.trim();if(!name){showError("Please enter your name");return}showLoading("Capturing and registering your face...");try{const img=captureImage();const res=await postJson("/register",{name:name,phone:phone,image:img});const data=await res.json();if(data.error){showError(data.error)}else{const faceUuid=data.face_uuid||"N/A";updateRecognizedIdBox(faceUuid);showSuccess("Registration Successful","<h2 class=\"welcome-text\">Welcome, "+name+"!</h2><p style=\"color:var(--text-secondary);margin-top:0.75rem\">Your Unique ID:</p><div class=\"unique-id\">"+faceUuid+"</div><div class=\"instruction-text\">Your face has been registered<br>"+(data.synthetic_samples_created||0)+" training samples created<br>Use \"Identify Me\" button to recognize yourself<br>Your ID is now displayed next to the Identify button!</div>");document.getElementById("name").value="";document.getElementById("phone").value=""}}catch(err){showError("Registration failed: "+err.message)}});
+document.getElementById("recognizeBtn").addEventListener("click",async function(){if(!cameraActive){showError("Please start the camera first!");return}showLoading("Recognizing your face...");try{const img=captureImage();const res=await postJson("/recognize",{image:img});if(res.status===404){clearRecognizedIdBox();showError("Face not recognized. Please register first.");return}if(res.status===500){const errorData=await res.json();const errorMsg=errorData.error||"Unknown error";if(errorMsg.includes("could not be detected")||errorMsg.includes("Face could not")){clearRecognizedIdBox();showError("Could not detect face clearly. Please ensure:<br><br>Your face is well-lit<br>You are looking at the camera<br>Your face is close enough to the camera<br>Remove any obstructions")}else{clearRecognizedIdBox();showError("Recognition failed: "+errorMsg)}return}const data=await res.json();if(data.match){const faceUuid=data.match.face_uuid||"N/A";updateRecognizedIdBox(faceUuid);showSuccess("Recognition Successful","<h2 class=\"welcome-text\">Hello, "+data.match.name+"!</h2><p style=\"color:var(--text-secondary);margin-top:0.75rem\">Your Unique ID:</p><div class=\"unique-id\">"+faceUuid+"</div><div class=\"instruction-text\">Confidence Score: "+(data.match.score*100).toFixed(1)+"%<br>Your ID is now displayed next to the button!</div>")}else{clearRecognizedIdBox();showError("Could not recognize face. Please try again or register.")}}catch(err){clearRecognizedIdBox();showError("Recognition failed: "+err.message)}});
+document.getElementById("addParcelBtn").addEventListener("click",async function(){
+  const tracking=document.getElementById("tracking").value.trim();
+  const owner_id=document.getElementById("owner_id").value.trim();
+  const note=document.getElementById("note").value.trim();
+  showLoading("Adding parcel...");
+  const res=await postJson("/parcel/add",{tracking_code:tracking,owner_id:owner_id||null,note:note});
+  const data=await res.json();
+  if(data.error){
+    showError(data.error)
+  }else{
+    showSuccess("Parcel Added",
+      `<p style="font-size:1rem;color:var(--text-primary)">Parcel ID: <strong>${data.parcel_id}</strong></p>
+       <p style="font-size:1rem;color:var(--text-primary)">Slot: <strong>${data.slot}</strong></p>
+       <div style="background:var(--accent-muted);border:1px solid var(--accent-border);color:var(--text-primary);padding:1rem;border-radius:var(--radius-md);margin:1rem 0">
+         <strong>Storage Location:</strong> ${data.storage_location}
+       </div>
+       <div style="background:var(--amber-muted);border:1px solid oklch(0.75 0.15 75 / 0.25);padding:1rem;border-radius:var(--radius-md);margin:1rem 0">
+         <strong>Estimated Ready for Pickup:</strong> ${data.estimated_delivery_days} days
+       </div>`);
+    document.getElementById("tracking").value="";
+    document.getElementById("owner_id").value="";
+    document.getElementById("note").value=""
+  }
+});
+document.getElementById("listMyParcelsBtn").addEventListener("click",async function(){if(!cameraActive){showError("Please start the camera first!");return}showLoading("Identifying and fetching your parcels...");try{const img=captureImage();const res=await postJson("/parcel/collect",{image:img});if(res.status===404){showError("Face not recognized or no parcels found");return}const data=await res.json();if(data.parcels){const select=document.getElementById("parcelsSelect");select.innerHTML="<option value=\"\">-- Select a parcel --</option>";data.parcels.forEach(function(p){const opt=document.createElement("option");opt.value=p.id;opt.textContent="#"+p.id+" - "+(p.tracking_code||"No tracking")+" - Slot "+p.slot+" - "+p.status;select.appendChild(opt)});let parcelsList=data.parcels.map(function(p){return "<div style=\"background:var(--bg-elevated);border:1px solid var(--border-subtle);padding:1rem;border-radius:var(--radius-md);margin:0.75rem 0;text-align:left\"><strong>Parcel #"+p.id+"</strong><br>Tracking: "+(p.tracking_code||"N/A")+"<br>Slot: "+p.slot+"<br>Status: <span class=\"status-badge status-"+p.status+"\">"+p.status.toUpperCase()+"</span></div>"}).join("");showSuccess("Your Parcels ("+data.parcels.length+")",parcelsList)}}catch(err){showError("Failed to fetch parcels: "+err.message)}});
+document.getElementById("collectParcelBtn").addEventListener("click",async function(){if(!cameraActive){showError("Please start the camera first!");return}const parcelId=document.getElementById("parcelsSelect").value;if(!parcelId){showError("Please select a parcel first");return}showLoading("Verifying face and collecting parcel...");try{const img=captureImage();const res=await postJson("/parcel/collect",{image:img,parcel_id:parseInt(parcelId)});const data=await res.json();if(data.error){showError(data.error)}else{showSuccess("Parcel Collected","<p style=\"font-size:1rem;color:var(--text-primary)\">Parcel <strong>#"+parcelId+"</strong> has been collected successfully!</p><p style=\"margin-top:0.75rem\">Status: <span class=\"status-badge status-collected\">COLLECTED</span></p>")}}catch(err){showError("Collection failed: "+err.message)}});
+document.getElementById("trackBtn").addEventListener("click",async function(){
+  const trackId=document.getElementById("trackId").value.trim().toUpperCase();
+  if(!trackId){showError("Please enter your 6-character ID");return}
+  showLoading("Tracking your orders...");
+  try{
+    const res=await fetch("/track/"+trackId);
+    const data=await res.json();
+    if(res.status===404){
+      showError(data.error||"No parcels found for this ID")
+    }else{
+      let parcelsList=data.parcels.map(function(p){
+        let timeInfo = "";
+        if(p.status === 'stored'){
+          if(p.days_remaining !== null && p.days_remaining !== undefined){
+            timeInfo = `<div style="background:var(--amber-muted);border:1px solid oklch(0.75 0.15 75 / 0.25);padding:0.75rem;border-radius:var(--radius-sm);margin:0.75rem 0">
+              <strong>Pickup Time:</strong><br>
+              ${p.days_remaining === 0 ? '<span style="color:var(--red)">Ready for pickup NOW!</span>' : 
+                p.days_remaining === 1 ? '<span style="color:var(--amber)">Tomorrow</span>' :
+                `${p.days_remaining} days remaining`}
+            </div>`;
+          }
+        }
+
+        let locationInfo = p.storage_location ? 
+          `<div style="background:var(--accent-muted);border:1px solid var(--accent-border);padding:0.75rem;border-radius:var(--radius-sm);margin:0.75rem 0">
+            <strong>Location:</strong> ${p.storage_location}
+          </div>` : '';
+
+        return `<div style="background:var(--bg-elevated);border:1px solid var(--border-subtle);padding:1.25rem;border-radius:var(--radius-md);margin:0.75rem 0;text-align:left">
+          <strong style="font-size:1rem">Parcel #${p.id}</strong><br>
+          <strong>Tracking:</strong> ${p.tracking_code||'N/A'}<br>
+          <strong>Slot:</strong> ${p.slot}<br>
+          ${locationInfo}
+          ${timeInfo}
+          <strong>Status:</strong> <span class="status-badge status-${p.status}">${p.status.toUpperCase()}</span><br>
+          ${p.note ? `<strong>Note:</strong> ${p.note}<br>` : ''}
+          <small style="color:var(--text-muted)">In storage: ${p.days_in_storage||0} days</small>
+        </div>`
+      }).join("");
+
+      showSuccess(`Parcels for ID: ${trackId} (${data.total_parcels} total)`, 
+        `<div style="text-align:left;width:100%"><strong>User:</strong> ${data.user.name}</div><br>` + parcelsList)
+    }
+  }catch(err){
+    showError("Tracking failed: "+err.message)
+  }
+});
+document.getElementById("searchBtn").addEventListener("click",async function(){const searchTracking=document.getElementById("searchTracking").value.trim();const searchId=document.getElementById("searchId").value.trim().toUpperCase();if(!searchTracking||!searchId){showError("Please enter both tracking code and your ID");return}showLoading("Searching for parcel...");try{const res=await postJson("/search",{tracking_code:searchTracking,face_uuid:searchId});const data=await res.json();if(res.status===404){showError(data.error||"Parcel not found")}else{const p=data.parcel;showSuccess("Parcel Found","<div style=\"background:var(--bg-elevated);border:1px solid var(--border-subtle);padding:1.25rem;border-radius:var(--radius-md);text-align:left;width:100%\"><strong style=\"font-size:1.125rem\">Parcel #"+p.id+"</strong><br><br><strong>Tracking:</strong> "+(p.tracking_code||"N/A")+"<br><strong>Slot:</strong> "+p.slot+"<br><strong>Status:</strong> <span class=\"status-badge status-"+p.status+"\">"+p.status.toUpperCase()+"</span><br>"+(p.note?"<strong>Note:</strong> "+p.note+"<br>":"")+"</div>")}}catch(err){showError("Search failed: "+err.message)}});
+document.getElementById("trackId").addEventListener("input",function(e){e.target.value=e.target.value.toUpperCase()});
+document.getElementById("searchId").addEventListener("input",function(e){e.target.value=e.target.value.toUpperCase()});
@@ -0,0 +1,664 @@
+// State
+let regStream = null;
+let handoverStream = null;
+let verifiedStudentId = null;
+let verifiedStudentName = "";
+let allParcels = [];
+let currentFilter = "all";
+let searchQuery = "";
+
+// Show message
+function showMessage(type, text) {
+  const container = document.getElementById('alertContainer');
+  const alert = document.createElement('div');
+  alert.className = `alert alert-${type}`;
+  alert.innerHTML = `
+    <svg width="20" height="20" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">
+      <circle cx="12" cy="12" r="10"/>
+      <line x1="12" y1="8" x2="12" y2="12"/>
+      <line x1="12" y1="16" x2="12.01" y2="16"/>
+    </svg>
+    <span>${text}</span>
+  `;
+  container.appendChild(alert);
+  setTimeout(() => alert.remove(), 4000);
+}
+
+// Tab switching
+document.querySelectorAll('.tab-trigger').forEach(btn => {
+  btn.addEventListener('click', () => {
+    const tab = btn.dataset.tab;
+
+    // Update buttons
+    document.querySelectorAll('.tab-trigger').forEach(b => b.classList.remove('active'));
+    btn.classList.add('active');
+
+    // Update content
+    document.querySelectorAll('.tab-content').forEach(c => c.classList.remove('active'));
+    document.getElementById('tab-' + tab).classList.add('active');
+
+    // Load data for specific tabs
+    if (tab === 'receive' || tab === 'parcels' || tab === 'shelf') {
+      loadAllParcels();
+    }
+    if (tab === 'users') {
+      loadAllUsers();
+    }
+  });
+});
+
+// Live updates: reload the open tab when parcels or users change (no polling). The
+// stream is only open while a tab that lists parcels or users is showing, since each
+// one holds a server thread
+const LIVE_TABS = ['receive', 'parcels', 'shelf', 'users'];
+let parcelEvents = null;
+let refreshTimer = null;
+let reconnectTimer = null;
+
+function activeTab() {
+  const active = document.querySelector('.tab-trigger.active');
+  return active ? active.dataset.tab : null;
+}
+
+function refreshActiveTab() {
+  clearTimeout(refreshTimer);
+  // A courier batch sends many events at once; reload once they settle
+  refreshTimer = setTimeout(() => {
+    const tab = activeTab();
+    if (tab === 'receive' || tab === 'parcels' || tab === 'shelf') {
+      loadAllParcels();
+    }
+    if (tab === 'users') {
+      loadAllUsers();
+    }
+  }, 300);
+}
+
+function updateLiveEvents() {
+  if (!window.EventSource) return;
+  const wanted = LIVE_TABS.includes(activeTab()) && document.visibilityState === 'visible';
+  if (!wanted) {
+    clearTimeout(reconnectTimer);
+    if (parcelEvents) {
+      parcelEvents.close();
+      parcelEvents = null;
+    }
+    return;
+  }
+  if (parcelEvents) return;
+  parcelEvents = new EventSource('/events');
+  ['parcel-added', 'parcel-collected', 'user-registered'].forEach(type => {
+    parcelEvents.addEventListener(type, refreshActiveTab);
+  });
+  parcelEvents.addEventListener('error', () => {
+    // The browser retries dropped streams itself, but not a 503 when the server is busy
+    if (parcelEvents && parcelEvents.readyState === EventSource.CLOSED) {
+      parcelEvents = null;
+      clearTimeout(reconnectTimer);
+      reconnectTimer = setTimeout(() => {
+        refreshActiveTab();  // catch up on what changed while disconnected
+        updateLiveEvents();
+      }, 5000);
+    }
+  });
+}
+
+document.querySelectorAll('.tab-trigger').forEach(btn => {
+  btn.addEventListener('click', updateLiveEvents);
+});
+document.addEventListener('visibilitychange', () => {
+  if (document.visibilityState === 'visible' && !parcelEvents && LIVE_TABS.includes(activeTab())) {
+    refreshActiveTab();  // changes made while hidden were not streamed
+  }
+  updateLiveEvents();
+});
+updateLiveEvents();
+
+// Camera setup
+async function getCameras(selectId) {
+  // Check if browser supports camera API
+  if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {
+    showMessage('error', 'Camera not supported in this browser. Please use Chrome, Edge, or Firefox.');
+    console.error('MediaDevices API not supported. Browser:', navigator.userAgent);
+    console.error('Protocol:', location.protocol, 'Hostname:', location.hostname);
+    return;
+  }
+
+  // Check if page is served securely (HTTPS or localhost)
+  const isSecure = location.protocol === 'https:' || 
+                  location.hostname === 'localhost' || 
+                  location.hostname === '127.0.0.1' ||
+                  location.hostname.startsWith('192.168.') ||
+                  location.hostname.startsWith('10.');
+
+  if (!isSecure) {
+    showMessage('error', 'Camera requires HTTPS or localhost. Current: ' + location.protocol + '//' + location.hostname);
+    console.error('Camera requires secure context. Current:', location.href);
+    return;
+  }
+
+  try {
+    // Request permission first to get device labels
+    await navigator.mediaDevices.getUserMedia({ video: true })
+      .then(stream => stream.getTracks().forEach(track => track.stop()));
+
+    const devices = await navigator.mediaDevices.enumerateDevices();
+    const videoDevices = devices.filter(d => d.kind === 'videoinput');
+    const sel = document.getElementById(selectId);
+    sel.innerHTML = '';
+
+    if (videoDevices.length === 0) {
+      showMessage('error', 'No cameras found. Please connect a camera and refresh.');
+      return;
+    }
+
+    videoDevices.forEach((dev, idx) => {
+      const opt = document.createElement('option');
+      opt.value = dev.deviceId;
+      opt.textContent = dev.label || `Camera ${idx + 1}`;
+      sel.appendChild(opt);
+    });
+  } catch (err) {
+    console.error('Camera access error:', err);
+    if (err.name === 'NotAllowedError') {
+      showMessage('error', 'Camera permission denied. Please allow camera access.');
+    } else if (err.name === 'NotFoundError') {
+      showMessage('error', 'No camera found. Please connect a camera.');
+    } else {
+      showMessage('error', 'Could not access cameras: ' + err.message);
+    }
+  }
+}
+
+async function startCamera(videoId, selectId, streamVar) {
+  // Check if browser supports camera API
+  if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {
+    showMessage('error', 'Camera not supported in this browser.');
+    return;
+  }
+
+  if (streamVar) {
+    streamVar.getTracks().forEach(t => t.stop());
+  }
+  const sel = document.getElementById(selectId);
+  const deviceId = sel.value;
+  try {
+    const stream = await navigator.mediaDevices.getUserMedia({
+      video: { 
+        deviceId: deviceId ? { exact: deviceId } : undefined,
+        width: { ideal: 1280 },
+        height: { ideal: 720 }
+      }
+    });
+
+    if (videoId === 'regWebcam') regStream = stream;
+    if (videoId === 'handoverWebcam') handoverStream = stream;
+
+    const video = document.getElementById(videoId);
+    video.srcObject = stream;
+
+    // Ensure video plays
+    video.onloadedmetadata = () => {
+      video.play().catch(err => {
+        console.error('Video play error:', err);
+        showMessage('error', 'Could not start video playback');
+      });
+    };
+  } catch (err) {
+    console.error('Camera start error:', err);
+    if (err.name === 'NotAllowedError') {
+      showMessage('error', 'Camera permission denied. Please allow camera access.');
+    } else if (err.name === 'NotFoundError') {
+      showMessage('error', 'Selected camera not found. Trying default camera...');
+      // Try with default camera
+      try {
+        const stream = await navigator.mediaDevices.getUserMedia({ video: true });
+        if (videoId === 'regWebcam') regStream = stream;
+        if (videoId === 'handoverWebcam') handoverStream = stream;
+        document.getElementById(videoId).srcObject = stream;
+      } catch (retryErr) {
+        showMessage('error', 'Could not access any camera.');
+      }
+    } else {
+      showMessage('error', 'Could not start camera: ' + err.message);
+    }
+  }
+}
+
+// Initialize cameras
+getCameras('regCameraSelect').then(() => startCamera('regWebcam', 'regCameraSelect', regStream));
+getCameras('handoverCameraSelect').then(() => startCamera('handoverWebcam', 'handoverCameraSelect', handoverStream));
+
+document.getElementById('regCameraSelect').addEventListener('change', () => 
+  startCamera('regWebcam', 'regCameraSelect', regStream)
+);
+document.getElementById('handoverCameraSelect').addEventListener('change', () => 
+  startCamera('handoverWebcam', 'handoverCameraSelect', handoverStream)
+);
+
+// Register student
+async function registerStudent() {
+  const name = document.getElementById('studentName').value.trim();
+  const phone = document.getElementById('studentPhone').value.trim();
+
+  if (!name) {
+    showMessage('error', 'Please enter student name');
+    return;
+  }
+
+  const video = document.getElementById('regWebcam');
+  const canvas = document.createElement('canvas');
+  canvas.width = video.videoWidth;
+  canvas.height = video.videoHeight;
+  canvas.getContext('2d').drawImage(video, 0, 0);
+  const imageBase64 = canvas.toDataURL('image/jpeg');
+
+  document.getElementById('registerSpinner').style.display = 'inline-block';
+  document.getElementById('registerText').textContent = 'Registering...';
+  document.getElementById('registerBtn').disabled = true;
+
+  try {
+    const res = await fetch('/register', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ name, phone, image: imageBase64 })
+    });
+    const data = await res.json();
+
+    if (data.error) {
+      showMessage('error', data.error);
+    } else {
+      document.getElementById('registeredId').textContent = data.face_uuid || '---';
+      document.getElementById('registeredCard').style.display = 'block';
+      showMessage('success', `Student ${name} registered successfully!`);
+      document.getElementById('studentName').value = '';
+      document.getElementById('studentPhone').value = '';
+    }
+  } catch (err) {
+    showMessage('error', 'Registration failed');
+  } finally {
+    document.getElementById('registerSpinner').style.display = 'none';
+    document.getElementById('registerText').textContent = 'Register Student';
+    document.getElementById('registerBtn').disabled = false;
+  }
+}
+
+// Add parcel
+async function addParcel() {
+  const tracking = document.getElementById('trackingCode').value.trim();
+  const owner = document.getElementById('ownerId').value.trim();
+  const note = document.getElementById('parcelNote').value.trim();
+
+  document.getElementById('addParcelSpinner').style.display = 'inline-block';
+  document.getElementById('addParcelText').textContent = 'Storing...';
+  document.getElementById('addParcelBtn').disabled = true;
+
+  try {
+    const res = await fetch('/parcel/add', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        tracking_code: tracking || undefined,
+        owner_id: owner || undefined,
+        note: note
+      })
+    });
+    const data = await res.json();
+
+    if (data.error) {
+      showMessage('error', data.error);
+    } else {
+      showMessage('success', `Parcel stored at ${data.storage_location}, Slot ${data.slot}`);
+      document.getElementById('trackingCode').value = '';
+      document.getElementById('ownerId').value = '';
+      document.getElementById('parcelNote').value = '';
+      loadAllParcels();
+    }
+  } catch (err) {
+    showMessage('error', 'Failed to add parcel');
+  } finally {
+    document.getElementById('addParcelSpinner').style.display = 'none';
+    document.getElementById('addParcelText').textContent = 'Store Parcel';
+    document.getElementById('addParcelBtn').disabled = false;
+  }
+}
+
+// Verify student
+async function verifyStudent() {
+  const video = document.getElementById('handoverWebcam');
+  const canvas = document.createElement('canvas');
+  canvas.width = video.videoWidth;
+  canvas.height = video.videoHeight;
+  canvas.getContext('2d').drawImage(video, 0, 0);
+  const imageBase64 = canvas.toDataURL('image/jpeg').split(',')[1];
+
+  document.getElementById('verifySpinner').style.display = 'inline-block';
+  document.getElementById('verifyText').textContent = 'Verifying...';
+  document.getElementById('verifyBtn').disabled = true;
+
+  try {
+    const res = await fetch('/recognize', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ image: imageBase64 })
+    });
+    const data = await res.json();
+
+    if (data.recognized) {
+      verifiedStudentId = data.match?.id || null;
+      verifiedStudentName = data.name || "";
+      const displayId = data.user_id || data.match?.face_uuid || "---";
+
+      document.getElementById('verifiedId').textContent = displayId;
+      document.getElementById('verifiedName').textContent = verifiedStudentName;
+      document.getElementById('verifiedCard').style.display = 'block';
+      document.getElementById('handoverDesc').textContent = `Parcels for ${verifiedStudentName}`;
+
+      showMessage('success', `Verified: ${verifiedStudentName}`);
+
+      // Load student parcels
+      if (verifiedStudentId) {
+        loadStudentParcels(verifiedStudentId);
+      }
+    } else {
+      showMessage('error', 'Face not recognized');
+      document.getElementById('verifiedCard').style.display = 'none';
+      document.getElementById('studentParcels').innerHTML = `
+        <div class="empty-state">
+          <svg class="empty-icon" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">
+            <path d="M11 12h2a2 2 0 1 0 0-4h-3c-.6 0-1.1.2-1.4.6L3 14"/>
+            <path d="m7 18 1.6-1.4c.3-.4.8-.6 1.4-.6h4c1.1 0 2.1-.4 2.8-1.2l4.6-4.4a2 2 0 0 0-2.75-2.91l-4.2 3.9"/>
+            <path d="m2 13 6 6"/>
+          </svg>
+          <p style="font-size: 0.875rem;">Verify student to see their parcels</p>
+        </div>
+      `;
+    }
+  } catch (err) {
+    showMessage('error', 'Verification failed');
+  } finally {
+    document.getElementById('verifySpinner').style.display = 'none';
+    document.getElementById('verifyText').textContent = 'Verify Student';
+    document.getElementById('verifyBtn').disabled = false;
+  }
+}
+
+// Load student parcels
+async function loadStudentParcels(studentId) {
+  try {
+    const res = await fetch(`/track_orders?owner_id=${studentId}`);
+    const data = await res.json();
+    const parcels = (data.parcels || []).filter(p => p.status === 'stored');
+
+    const container = document.getElementById('studentParcels');
+    if (parcels.length === 0) {
+      container.innerHTML = `
+        <div class="empty-state">
+          <svg class="empty-icon" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">
+            <path d="M21 16V8a2 2 0 0 0-1-1.73l-7-4a2 2 0 0 0-2 0l-7 4A2 2 0 0 0 3 8v8a2 2 0 0 0 1 1.73l7 4a2 2 0 0 0 2 0l7-4A2 2 0 0 0 21 16z"/>
+          </svg>
+          <p style="font-size: 0.875rem;">No parcels to collect</p>
+        </div>
+      `;
+    } else {
+      container.innerHTML = `<div class="scrollable">${parcels.map(p => createParcelCardWithCollect(p)).join('')}</div>`;
+    }
+  } catch (err) {
+    document.getElementById('studentParcels').innerHTML = '<p style="color: oklch(0.65 0.22 15); text-align: center;">Failed to load parcels</p>';
+  }
+}
+
+// Collect parcel
+async function collectParcel(parcelId) {
+  try {
+    const res = await fetch('/parcel/mark_collected', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ parcel_id: parcelId })
+    });
+    const data = await res.json();
+
+    if (data.error) {
+      showMessage('error', data.error);
+    } else {
+      showMessage('success', 'Parcel collected successfully! ✅');
+      // Refresh all data to update shelf and parcel lists
+      if (verifiedStudentId) {
+        loadStudentParcels(verifiedStudentId);
+      }
+      await loadAllParcels();
+
+    }
+  } catch (err) {
+    console.error('Collection error:', err);
+    showMessage('error', 'Collection failed');
+  }
+}
+
+// Load all parcels
+async function loadAllParcels() {
+  try {
+    const res = await fetch('/track_orders');
+    const data = await res.json();
+    allParcels = data.parcels || [];
+
+    // Update recent parcels
+    const recent = allParcels.filter(p => p.status === 'stored').slice(0, 5);
+    const recentContainer = document.getElementById('recentParcels');
+    if (recent.length === 0) {
+      recentContainer.innerHTML = `
+        <div class="empty-state">
+          <svg class="empty-icon" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">
+            <path d="M21 16V8a2 2 0 0 0-1-1.73l-7-4a2 2 0 0 0-2 0l-7 4A2 2 0 0 0 3 8v8a2 2 0 0 0 1 1.73l7 4a2 2 0 0 0 2 0l7-4A2 2 0 0 0 21 16z"/>
+          </svg>
+          <p style="font-size: 0.875rem;">No recent parcels</p>
+        </div>
+      `;
+    } else {
+      recentContainer.innerHTML = recent.map(p => createParcelCard(p)).join('');
+    }
+
+    // Update stats
+    const stored = allParcels.filter(p => p.status === 'stored');
+    const ready = stored.filter(p => p.days_remaining !== undefined && p.days_remaining <= 0);
+    document.getElementById('statTotal').textContent = allParcels.length;
+    document.getElementById('statStored').textContent = stored.length;
+    document.getElementById('statReady').textContent = ready.length;
+
+    // Update shelf grid
+    updateShelfGrid(stored);
+
+    // Update table
+    updateTable();
+  } catch (err) {
+    allParcels = [];
+  }
+}
+
+// Create parcel card
+function createParcelCard(parcel) {
+  return `
+    <div class="parcel-card">
+      <div class="parcel-header">
+        <div class="tracking-code">${parcel.tracking_code}</div>
+        <span class="status-badge status-${parcel.status}">${parcel.status}</span>
+      </div>
+      <div class="parcel-details">
+        <strong>Slot:</strong> ${parcel.slot || 'N/A'}<br>
+        ${parcel.note ? `<strong>Note:</strong> ${parcel.note}<br>` : ''}
+        ${parcel.storage_location ? `<strong>Location:</strong> ${parcel.storage_location}<br>` : ''}
+      </div>
+    </div>
+  `;
+}
+
+function createParcelCardWithCollect(parcel) {
+  return `
+    <div class="parcel-card">
+      <div class="parcel-header">
+        <div class="tracking-code">${parcel.tracking_code}</div>
+        <span class="status-badge status-${parcel.status}">${parcel.status}</span>
+      </div>
+      <div class="parcel-details">
+        <strong>Slot:</strong> ${parcel.slot || 'N/A'}<br>
+        ${parcel.note ? `<strong>Note:</strong> ${parcel.note}<br>` : ''}
+        ${parcel.storage_location ? `<strong>Location:</strong> ${parcel.storage_location}<br>` : ''}
+      </div>
+      <button class="btn-collect w-full" style="margin-top: 1rem;" onclick="collectParcel(${parcel.id})">
+        <svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">
+          <polyline points="20 6 9 17 4 12"/>
+        </svg>
+        Collect Parcel
+      </button>
+    </div>
+  `;
+}
+
+// Update shelf grid
+function updateShelfGrid(stored) {
+  const grid = document.getElementById('shelfGrid');
+  if (stored.length === 0) {
+    grid.innerHTML = '<div class="empty-state"><p style="font-size: 0.875rem;">No parcels in storage</p></div>';
+    grid.style.display = 'block';
+  } else {
+    grid.style.display = 'grid';
+    grid.innerHTML = stored.map(p => {
+      const ready = p.days_remaining !== undefined && p.days_remaining <= 0;
+      return `
+        <div class="shelf-item ${ready ? 'ready' : 'waiting'}">
+          <div class="shelf-slot">${p.slot}</div>
+          <div class="shelf-tracking">${p.tracking_code}</div>
+          <div class="shelf-badge">${p.storage_location}</div>
+        </div>
+      `;
+    }).join('');
+  }
+}
+
+// Update table
+function updateTable() {
+  const filtered = allParcels.filter(p => {
+    if (currentFilter === 'stored' && p.status !== 'stored') return false;
+    if (currentFilter === 'collected' && p.status !== 'collected') return false;
+    if (searchQuery) {
+      const query = searchQuery.toLowerCase();
+      return (
+        p.tracking_code?.toLowerCase().includes(query) ||
+        p.storage_location?.toLowerCase().includes(query) ||
+        p.slot?.toLowerCase().includes(query)
+      );
+    }
+    return true;
+  });
+
+  const tbody = document.getElementById('parcelsTableBody');
+  if (filtered.length === 0) {
+    tbody.innerHTML = '<tr><td colspan="5" style="text-align: center; padding: 3rem; color: oklch(0.6 0.01 260);">No parcels found</td></tr>';
+  } else {
+    tbody.innerHTML = filtered.map(p => `
+      <tr>
+        <td style="font-family: 'Courier New', monospace;">${p.tracking_code}</td>
+        <td>${p.storage_location || '-'}</td>
+        <td>${p.slot || '-'}</td>
+        <td><span class="status-badge status-${p.status}">${p.status}</span></td>
+        <td style="color: oklch(0.7 0.01 260);">${p.arrival_time ? new Date(p.arrival_time).toLocaleDateString() : '-'}</td>
+      </tr>
+    `).join('');
+  }
+}
+
+// Filter buttons
+document.querySelectorAll('[data-filter]').forEach(btn => {
+  btn.addEventListener('click', () => {
+    document.querySelectorAll('[data-filter]').forEach(b => b.classList.remove('active'));
+    btn.classList.add('active');
+    currentFilter = btn.dataset.filter;
+    updateTable();
+  });
+});
+
+// Search
+document.getElementById('searchQuery').addEventListener('input', (e) => {
+  searchQuery = e.target.value;
+  updateTable();
+});
+
+// Copy ID
+function copyId(elementId) {
+  const id = document.getElementById(elementId).textContent;
+  navigator.clipboard.writeText(id).then(() => {
+    showMessage('success', 'ID copied to clipboard!');
+  });
+}
+
+// Event listeners
+document.getElementById('registerBtn').addEventListener('click', registerStudent);
+document.getElementById('addParcelBtn').addEventListener('click', addParcel);
+document.getElementById('verifyBtn').addEventListener('click', verifyStudent);
+
+// Users tab
+let allUsers = [];
+let userSearchQuery = '';
+
+async function loadAllUsers() {
+  try {
+    const res = await fetch('/api/users');
+    const data = await res.json();
+    allUsers = data.users || [];
+    renderUsersTable();
+  } catch (err) {
+    document.getElementById('usersTableBody').innerHTML = '<tr><td colspan="6" style="text-align: center; padding: 3rem; color: oklch(0.65 0.22 15);">Failed to load users</td></tr>';
+  }
+}
+
+function renderUsersTable() {
+  const filtered = allUsers.filter(u => {
+    if (!userSearchQuery) return true;
+    const q = userSearchQuery.toLowerCase();
+    return u.name.toLowerCase().includes(q) || u.phone.toLowerCase().includes(q) || u.face_uuid.toLowerCase().includes(q);
+  });
+
+  const tbody = document.getElementById('usersTableBody');
+  if (filtered.length === 0) {
+    tbody.innerHTML = '<tr><td colspan="6" style="text-align: center; padding: 3rem; color: oklch(0.6 0.01 260);">No users found</td></tr>';
+  } else {
+    tbody.innerHTML = filtered.map(u => `
+      <tr>
+        <td>${u.id}</td>
+        <td style="font-weight: 500;">${u.name}</td>
+        <td>${u.phone || '-'}</td>
+        <td style="font-family: 'Courier New', monospace; font-size: 0.8125rem;">${u.face_uuid || '-'}</td>
+        <td>${u.parcel_count}</td>
+        <td>${u.stored_count > 0 ? '<span class="status-badge status-stored">' + u.stored_count + ' stored</span>' : '<span style="color: oklch(0.5 0.01 260);">0</span>'}</td>
+      </tr>
+    `).join('');
+  }
+}
+
+document.getElementById('userSearchQuery').addEventListener('input', (e) => {
+  userSearchQuery = e.target.value;
+  renderUsersTable();
+});
+
+// Smooth Tab Animation
+const tabs = document.querySelectorAll('.tab-button');
+tabs.forEach(tab => {
+  tab.addEventListener('mouseenter', function() {
+    this.style.transform = 'translateY(-2px)';
+  });
+  tab.addEventListener('mouseleave', function() {
+    if (!this.classList.contains('active')) {
+      this.style.transform = 'translateY(0)';
+    }
+  });
+});
+
+// Card interactions
+document.querySelectorAll('.stat-card, .shelf-cell').forEach(card => {
+  card.addEventListener('mouseenter', function() {
+    this.style.transform = 'translateY(-4px) scale(1.02)';
+  });
+  card.addEventListener('mouseleave', function() {
+    this.style.transform = 'translateY(0) scale(1)';
+  });
+});
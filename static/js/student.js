@@ -0,0 +1,345 @@
+let currentStream = null;
+let currentStudentId = null;
+let currentOwnerId = null;
+let studentName = "";
+
+// Show alert message
+function showMessage(type, text) {
+  const container = document.getElementById('alertContainer');
+  const alert = document.createElement('div');
+  alert.className = `alert alert-${type}`;
+  alert.innerHTML = `
+    <svg width="20" height="20" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">
+      <circle cx="12" cy="12" r="10"/>
+      <line x1="12" y1="8" x2="12" y2="12"/>
+      <line x1="12" y1="16" x2="12.01" y2="16"/>
+    </svg>
+    <span>${text}</span>
+  `;
+  container.appendChild(alert);
+  setTimeout(() => alert.remove(), 4000);
+}
+
+// Get available cameras
+async function getCameras() {
+  // Check if browser supports camera API
+  if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {
+    showMessage('error', 'Camera not supported in this browser. Please use Chrome, Edge, or Firefox.');
+    console.error('MediaDevices API not supported. Browser:', navigator.userAgent);
+    console.error('Protocol:', location.protocol, 'Hostname:', location.hostname);
+    return;
+  }
+
+  // Check if page is served securely (HTTPS or localhost)
+  const isSecure = location.protocol === 'https:' || 
+                  location.hostname === 'localhost' || 
+                  location.hostname === '127.0.0.1' ||
+                  location.hostname.startsWith('192.168.') ||
+                  location.hostname.startsWith('10.');
+
+  if (!isSecure) {
+    showMessage('error', 'Camera requires HTTPS or localhost. Current: ' + location.protocol + '//' + location.hostname);
+    console.error('Camera requires secure context. Current:', location.href);
+    return;
+  }
+
+  try {
+    // Request permission first to get device labels
+    await navigator.mediaDevices.getUserMedia({ video: true })
+      .then(stream => stream.getTracks().forEach(track => track.stop()));
+
+    const devices = await navigator.mediaDevices.enumerateDevices();
+    const videoDevices = devices.filter(d => d.kind === 'videoinput');
+    const sel = document.getElementById('cameraSelect');
+    sel.innerHTML = '';
+
+    if (videoDevices.length === 0) {
+      showMessage('error', 'No cameras found. Please connect a camera and refresh.');
+      return;
+    }
+
+    videoDevices.forEach((dev, idx) => {
+      const opt = document.createElement('option');
+      opt.value = dev.deviceId;
+      opt.textContent = dev.label || `Camera ${idx + 1}`;
+      sel.appendChild(opt);
+    });
+
+    if (videoDevices.length > 0) {
+      startCamera();
+    }
+  } catch (err) {
+    console.error('Camera access error:', err);
+    if (err.name === 'NotAllowedError') {
+      showMessage('error', 'Camera permission denied. Please allow camera access and refresh.');
+    } else if (err.name === 'NotFoundError') {
+      showMessage('error', 'No camera found. Please connect a camera.');
+    } else {
+      showMessage('error', 'Could not access cameras: ' + err.message);
+    }
+  }
+}
+
+// Start camera
+async function startCamera() {
+  // Check if browser supports camera API
+  if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {
+    showMessage('error', 'Camera not supported in this browser.');
+    return;
+  }
+
+  if (currentStream) {
+    currentStream.getTracks().forEach(t => t.stop());
+  }
+  const sel = document.getElementById('cameraSelect');
+  const deviceId = sel.value;
+  try {
+    const stream = await navigator.mediaDevices.getUserMedia({
+      video: { 
+        deviceId: deviceId ? { exact: deviceId } : undefined,
+        width: { ideal: 1280 },
+        height: { ideal: 720 }
+      }
+    });
+    currentStream = stream;
+    const video = document.getElementById('webcam');
+    video.srcObject = stream;
+
+    // Ensure video plays
+    video.onloadedmetadata = () => {
+      video.play().catch(err => {
+        console.error('Video play error:', err);
+        showMessage('error', 'Could not start video playback');
+      });
+    };
+  } catch (err) {
+    console.error('Camera start error:', err);
+    if (err.name === 'NotAllowedError') {
+      showMessage('error', 'Camera permission denied. Please allow camera access.');
+    } else if (err.name === 'NotFoundError') {
+      showMessage('error', 'Selected camera not found. Trying default camera...');
+      // Try with default camera
+      try {
+        const stream = await navigator.mediaDevices.getUserMedia({ video: true });
+        currentStream = stream;
+        document.getElementById('webcam').srcObject = stream;
+      } catch (retryErr) {
+        showMessage('error', 'Could not access any camera.');
+      }
+    } else {
+      showMessage('error', 'Could not start camera: ' + err.message);
+    }
+  }
+}
+
+// Capture image and identify
+async function captureImage() {
+  const video = document.getElementById('webcam');
+
+  // Check if video is ready
+  if (!video.videoWidth || !video.videoHeight) {
+    showMessage('error', 'Camera not ready. Please wait for video to start.');
+    console.error('Video not ready:', video.videoWidth, video.videoHeight);
+    return;
+  }
+
+  const canvas = document.createElement('canvas');
+  canvas.width = video.videoWidth;
+  canvas.height = video.videoHeight;
+  const ctx = canvas.getContext('2d');
+  ctx.drawImage(video, 0, 0);
+
+  const imageDataUrl = canvas.toDataURL('image/jpeg', 0.9);
+  const imageBase64 = imageDataUrl.split(',')[1];
+
+  // Validate image data
+  if (!imageBase64 || imageBase64.length < 100) {
+    showMessage('error', 'Failed to capture image. Please try again.');
+    console.error('Invalid image data:', imageBase64?.length);
+    return;
+  }
+
+  // Show loading state
+  document.getElementById('captureSpinner').style.display = 'inline-block';
+  document.getElementById('captureText').textContent = 'Identifying...';
+  document.getElementById('captureBtn').disabled = true;
+
+  try {
+    const res = await fetch('/recognize', { 
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ image: imageBase64 })
+    });
+
+    if (!res.ok) {
+      const errorData = await res.json();
+      throw new Error(errorData.error || `Server error: ${res.status}`);
+    }
+
+    const data = await res.json();
+
+    if (data.recognized) {
+      currentOwnerId = data.match?.id || null;
+      currentStudentId = data.user_id || data.match?.face_uuid || "---";
+      studentName = data.name || "";
+
+      document.getElementById('studentIdValue').textContent = currentStudentId;
+      document.getElementById('studentName').textContent = studentName;
+      document.getElementById('addOrderStudentId').textContent = currentStudentId;
+      document.getElementById('studentIdCard').style.display = 'block';
+
+      showMessage('success', `Welcome, ${studentName}!`);
+
+      if (currentOwnerId) {
+        loadParcels(currentOwnerId);
+      }
+    } else {
+      showMessage('error', 'Face not recognized. Please register first.');
+    }
+  } catch (err) {
+    console.error('Recognition error:', err);
+    showMessage('error', 'Identification failed: ' + err.message);
+  } finally {
+    document.getElementById('captureSpinner').style.display = 'none';
+    document.getElementById('captureText').textContent = 'Capture & Identify';
+    document.getElementById('captureBtn').disabled = false;
+  }
+}
+
+// Load student parcels
+async function loadParcels(studentId) {
+  try {
+    const res = await fetch(`/track_orders?owner_id=${studentId}`);
+    const data = await res.json();
+    const parcels = data.parcels || [];
+    const container = document.getElementById('parcelsList');
+    const countEl = document.getElementById('parcelCount');
+
+    countEl.textContent = parcels.length > 0 
+      ? `${parcels.length} parcel${parcels.length === 1 ? '' : 's'}`
+      : 'No parcels found';
+
+    if (parcels.length > 0) {
+      container.innerHTML = `<div class="parcels-scroll">${parcels.map(p => createParcelCard(p)).join('')}</div>`;
+    } else {
+      container.innerHTML = `
+        <div class="empty-state">
+          <svg class="empty-icon" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">
+            <path d="M21 16V8a2 2 0 0 0-1-1.73l-7-4a2 2 0 0 0-2 0l-7 4A2 2 0 0 0 3 8v8a2 2 0 0 0 1 1.73l7 4a2 2 0 0 0 2 0l7-4A2 2 0 0 0 21 16z"/>
+          </svg>
+          <p style="font-size: 0.875rem;">No parcels found</p>
+        </div>
+      `;
+    }
+  } catch (err) {
+    document.getElementById('parcelsList').innerHTML = 
+      '<div class="empty-state"><p style="color: oklch(0.65 0.22 15);">Failed to load parcels</p></div>';
+  }
+}
+
+// Create parcel card HTML
+function createParcelCard(parcel) {
+  let timeInfo = '';
+  let timeBadgeClass = 'time-badge';
+
+  if (parcel.status === 'stored' && parcel.days_remaining !== undefined) {
+    if (parcel.days_remaining <= 0) {
+      timeInfo = 'Ready for pickup NOW!';
+      timeBadgeClass += ' urgent';
+    } else if (parcel.days_remaining === 1) {
+      timeInfo = 'Ready tomorrow';
+    } else {
+      timeInfo = `Ready in ${parcel.days_remaining} days`;
+    }
+  }
+
+  return `
+    <div class="parcel-card">
+      <div class="parcel-header">
+        <div class="tracking-code">${parcel.tracking_code}</div>
+        <span class="status-badge status-${parcel.status}">${parcel.status}</span>
+      </div>
+      <div class="parcel-details">
+        <strong>Slot:</strong> ${parcel.slot || 'N/A'}<br>
+        ${parcel.note ? `<strong>Note:</strong> ${parcel.note}<br>` : ''}
+        ${parcel.arrival_time ? `<strong>Arrived:</strong> ${new Date(parcel.arrival_time).toLocaleString()}<br>` : ''}
+        ${parcel.collected_time ? `<strong>Collected:</strong> ${new Date(parcel.collected_time).toLocaleString()}<br>` : ''}
+      </div>
+      <div class="badge-row">
+        ${parcel.storage_location ? `<span class="location-badge">${parcel.storage_location}</span>` : ''}
+        ${timeInfo ? `<span class="${timeBadgeClass}">${timeInfo}</span>` : ''}
+      </div>
+    </div>
+  `;
+}
+
+// Copy student ID
+function copyStudentId() {
+  const id = document.getElementById('studentIdValue').textContent;
+  navigator.clipboard.writeText(id).then(() => {
+    showMessage('success', 'Student ID copied to clipboard!');
+  });
+}
+
+// Add order
+async function addOrder() {
+  const tracking = document.getElementById('trackingCode').value.trim();
+  const note = document.getElementById('orderNote').value.trim();
+
+  if (!currentOwnerId) {
+    showMessage('error', 'Please identify yourself first.');
+    return;
+  }
+  if (!currentOwnerId) {
+    showMessage('error', 'Please identify yourself with face recognition first.');
+    return;
+  }
+
+  if (!tracking) {
+    showMessage('error', 'Please enter a tracking code.');
+    return;
+  }
+
+  // Show loading state
+  document.getElementById('addOrderSpinner').style.display = 'inline-block';
+  document.getElementById('addOrderIcon').style.display = 'none';
+  document.getElementById('addOrderText').textContent = 'Adding...';
+  document.getElementById('addOrderBtn').disabled = true;
+
+  try {
+    const res = await fetch('/parcel/add', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        tracking_code: tracking,
+        owner_id: currentOwnerId,
+        note: note
+      })
+    });
+    const data = await res.json();
+
+    if (data.status === 'ok') {
+      showMessage('success', `Parcel added to ${data.storage_location}, Slot ${data.slot}`);
+      document.getElementById('trackingCode').value = '';
+      document.getElementById('orderNote').value = '';
+      loadParcels(currentOwnerId);
+    } else {
+      showMessage('error', 'Failed to add parcel.');
+    }
+  } catch (err) {
+    showMessage('error', 'Failed to add parcel.');
+  } finally {
+    document.getElementById('addOrderSpinner').style.display = 'none';
+    document.getElementById('addOrderIcon').style.display = 'inline-block';
+    document.getElementById('addOrderText').textContent = 'Add Order';
+    document.getElementById('addOrderBtn').disabled = false;
+  }
+}
+
+// Event listeners
+document.getElementById('cameraSelect').addEventListener('change', startCamera);
+document.getElementById('captureBtn').addEventListener('click', captureImage);
+document.getElementById('addOrderBtn').addEventListener('click', addOrder);
+
+// Initialize
+getCameras();
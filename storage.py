@@ -0,0 +1,197 @@
+import os
+import threading
+import logging
+from collections import deque, namedtuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from models import get_session, StorageLocation, Parcel
+
+logger = logging.getLogger(__name__)
+
+# Physical storage seeded into an empty storage_locations table: (name, capacity)
+DEFAULT_LOCATIONS = (
+    [("Shelf A-{}".format(i), 10) for i in range(1, 6)] +
+    [("Shelf B-{}".format(i), 10) for i in range(1, 6)] +
+    [("Locker {}".format(i), 1) for i in range(10, 20)] +
+    [("Bay C-{}".format(i), 20) for i in range(1, 4)]
+)
+
+# How many times intake retries when another worker committed the same slot first
+ALLOCATION_RETRIES = 5
+
+Assignment = namedtuple('Assignment', ['storage_location', 'slot'])
+
+
+class StorageFullError(Exception):
+    """Raised when every slot of every storage location is occupied."""
+
+
+def ensure_default_locations(session):
+    """Seed DEFAULT_LOCATIONS if no storage locations have been configured yet."""
+    if session.query(StorageLocation.id).first() is not None:
+        return 0
+    session.add_all([StorageLocation(name=name, capacity=capacity) for name, capacity in DEFAULT_LOCATIONS])
+    session.commit()
+    return len(DEFAULT_LOCATIONS)
+
+
+class SlotAllocator:
+    """In-memory free-list of (storage_location, slot) pairs.
+
+    Slots are numbered 1..capacity within each location. The free-list is rebuilt from
+    storage_locations and the currently stored parcels, so allocate() and release() are
+    O(1) and never query the database. Within a process a lock makes them atomic; across
+    gunicorn workers the partial unique index on parcels (storage_location, slot) rejects
+    a double assignment and the caller retries with the next free slot (see commit_with_slot).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._free = deque()
+        self._free_set = set()
+        self._capacity = {}
+
+    def load(self, session=None):
+        """(Re)build the free-list from the database."""
+        own_session = session is None
+        session = session or get_session()
+        try:
+            ensure_default_locations(session)
+            locations = session.query(StorageLocation).order_by(StorageLocation.id).all()
+            occupied = set(
+                session.query(Parcel.storage_location, Parcel.slot)
+                .filter(Parcel.status == 'stored')
+                .all()
+            )
+            capacity = {}
+            free = deque()
+            for loc in locations:
+                capacity[loc.name] = loc.capacity
+                for n in range(1, loc.capacity + 1):
+                    pair = (loc.name, str(n))
+                    if pair not in occupied:
+                        free.append(Assignment(*pair))
+            # Start each worker at a different point of the list so concurrent workers
+            # rarely race for the same slot
+            if free:
+                free.rotate(-(os.getpid() % len(free)))
+        finally:
+            if own_session:
+                session.close()
+
+        with self._lock:
+            self._capacity = capacity
+            self._free = free
+            self._free_set = set(free)
+        logger.info('Storage allocator loaded: %d locations, %d free slots', len(capacity), len(free))
+        return len(free)
+
+    def allocate(self):
+        """Pop a free slot. Raises StorageFullError if none are free."""
+        return self.allocate_many(1)[0]
+
+    def allocate_many(self, count):
+        """Atomically pop `count` free slots, or none at all if fewer are available.
+
+        If the local list runs short it is rebuilt once from the database first, since
+        other workers may have released slots in the meantime.
+        """
+        for attempt in range(2):
+            with self._lock:
+                if len(self._free) >= count:
+                    taken = [self._free.popleft() for _ in range(count)]
+                    self._free_set.difference_update(taken)
+                    return taken
+            if attempt == 0:
+                self.load()
+        raise StorageFullError(f'Only {self.free_count()} free storage slots for {count} parcels')
+
+    def release(self, storage_location, slot):
+        """Return a slot to the free-list. Ignores slots that are unknown or already free."""
+        assignment = Assignment(storage_location, str(slot) if slot is not None else None)
+        with self._lock:
+            capacity = self._capacity.get(assignment.storage_location)
+            if capacity is None or assignment in self._free_set:
+                return False
+            try:
+                if not 1 <= int(assignment.slot) <= capacity:
+                    return False
+            except (TypeError, ValueError):
+                return False
+            self._free.append(assignment)
+            self._free_set.add(assignment)
+            return True
+
+    def free_count(self):
+        with self._lock:
+            return len(self._free)
+
+    def capacities(self):
+        with self._lock:
+            return dict(self._capacity)
+
+
+allocator = SlotAllocator()
+
+
+def commit_with_slot(session, parcel):
+    """Assign a free slot to `parcel`, add it and commit.
+
+    If another worker committed the same slot first, the unique index rejects the insert;
+    the free-list is rebuilt from the database (dropping that worker's slots too) and the
+    next free slot is tried. Raises StorageFullError only when a fresh load finds no free
+    slot; the IntegrityError is re-raised if every retry lost its race.
+    """
+    for attempt in range(ALLOCATION_RETRIES):
+        assignment = allocator.allocate()
+        parcel.storage_location = assignment.storage_location
+        parcel.slot = assignment.slot
+        session.add(parcel)
+        try:
+            session.commit()
+            return assignment
+        except IntegrityError:
+            session.rollback()
+            if attempt == ALLOCATION_RETRIES - 1:
+                raise
+            logger.info('Slot %s/%s taken by another worker; retrying', *assignment)
+            allocator.load()
+
+
+def _next_parcel_id(session):
+    """Lowest parcel id above every id ever used, live, archived or deleted."""
+    return session.execute(text(
+        "SELECT 1 + MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'parcels'), 0),"
+        " COALESCE((SELECT MAX(id) FROM parcels), 0), COALESCE((SELECT MAX(id) FROM parcels_archive), 0))"
+    )).scalar()
+
+
+def commit_batch_with_slots(session, parcels):
+    """Assign ids and free slots to all `parcels`, add them and commit in one transaction.
+
+    All slots are taken from the allocator at once, and the ids are reserved up front so
+    the flush inserts the whole batch with one executemany instead of one INSERT ...
+    RETURNING per parcel. If another worker committed one of the slots or ids first, the
+    transaction is rolled back, the free-list is rebuilt from the database and the whole
+    batch is retried. Returns the assignments in the order of `parcels`. As in
+    commit_with_slot, StorageFullError means a fresh load had too few free slots.
+    """
+    for attempt in range(ALLOCATION_RETRIES):
+        assignments = allocator.allocate_many(len(parcels))
+        first_id = _next_parcel_id(session)
+        for i, (parcel, assignment) in enumerate(zip(parcels, assignments)):
+            parcel.id = first_id + i
+            parcel.storage_location = assignment.storage_location
+            parcel.slot = assignment.slot
+        session.add_all(parcels)
+        try:
+            session.commit()
+            return assignments
+        except IntegrityError:
+            session.rollback()
+            if attempt == ALLOCATION_RETRIES - 1:
+                raise
+            logger.info('Batch of %d parcels hit a slot or id taken by another worker; retrying', len(parcels))
+            allocator.load()
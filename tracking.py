@@ -0,0 +1,20 @@
+import re
+import unicodedata
+
+# Anything that is not a letter or digit is formatting, not part of the code
+_NON_ALNUM = re.compile(r'[^0-9A-Z]')
+
+
+def canonicalize_tracking_code(code):
+    """Return the canonical lookup key for a tracking code, or None if nothing usable is left.
+
+    Labels, couriers and people write the same code with different case, spacing and
+    separators ("1z 999-aa1", "1Z999AA1"), so the key is the NFKC-normalized, upper-cased
+    code with everything except letters and digits removed. Parcel intake stores this key
+    and search applies the same function to its input, so a lookup is one indexed equality probe.
+    """
+    if not code:
+        return None
+    text = unicodedata.normalize('NFKC', str(code)).upper()
+    key = _NON_ALNUM.sub('', text)
+    return key or None
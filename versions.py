@@ -0,0 +1,156 @@
+import hashlib
+import random
+from datetime import datetime
+from functools import wraps
+
+from flask import Response, make_response, request
+from sqlalchemy import event, inspect, select, update, text
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import get_engine, Parcel, User, FaceSample, DataVersion
+
+# data_versions holds one row per scope with a number bumped by every write to it:
+#   parcels          any parcel inserted, changed or deleted
+#   users            any user registered, changed or deleted
+#   owner/<user id>  that user's record or any of their parcels
+#   embeddings       any user or face sample deleted; the embedding index rebuilds then,
+#                    since the deleted ids can be handed to new users
+#   epoch            random value set once per database (and again when it is cleared),
+#                    so ETags from a deleted and recreated data.db never match
+# Rows are bumped by the flush listener below in the same transaction as the write.
+# Read endpoints wrapped in @conditional build a strong ETag from the versions they depend
+# on and answer 304 Not Modified without loading or serializing anything.
+
+_engine = None
+
+
+def _get_engine():
+    global _engine
+    if _engine is None:
+        _engine = get_engine()
+    return _engine
+
+
+def owner_scope(owner_id):
+    return f'owner/{owner_id}'
+
+
+def _changed_scopes(session):
+    scopes = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Parcel):
+            if obj in session.dirty and not session.is_modified(obj):
+                continue
+            scopes.add('parcels')
+            history = inspect(obj).attrs.owner_id.history
+            for owner_id in (obj.owner_id, *history.deleted):
+                if owner_id is not None:
+                    scopes.add(owner_scope(owner_id))
+        elif isinstance(obj, User):
+            if obj in session.dirty and not session.is_modified(obj):
+                continue
+            scopes.add('users')
+            scopes.add(owner_scope(obj.id))
+    if any(isinstance(obj, (User, FaceSample)) for obj in session.deleted):
+        scopes.add('embeddings')
+    return scopes
+
+
+def bump(connection, scopes):
+    """Increment the version of each scope in `scopes`, creating rows as needed."""
+    rows = [{'scope': s, 'version': 1} for s in sorted(scopes)]
+    if not rows:
+        return
+    stmt = sqlite_insert(DataVersion)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['scope'],
+        set_={'version': DataVersion.version + 1},
+    )
+    connection.execute(stmt, rows)
+
+
+def bump_all(connection):
+    """Increment every scope; for bulk deletes and imports that bypass the ORM."""
+    connection.execute(update(DataVersion).where(DataVersion.scope != 'epoch').values(version=DataVersion.version + 1))
+    bump(connection, ['parcels', 'users', 'embeddings'])
+
+
+def new_epoch(connection):
+    """Give the database a new epoch, after clearing it: ETags and embedding index snapshots
+    (embedding_index.py) of the old contents then never match it."""
+    epoch = random.getrandbits(31)
+    connection.execute(sqlite_insert(DataVersion)
+                       .values(scope='epoch', version=epoch)
+                       .on_conflict_do_update(index_elements=['scope'], set_={'version': epoch}))
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_versions(session, flush_context):
+    bump(session.connection(), _changed_scopes(session))
+
+
+def init_versions():
+    """Create the epoch row for this database if it does not exist yet."""
+    with _get_engine().begin() as conn:
+        conn.execute(sqlite_insert(DataVersion)
+                     .values(scope='epoch', version=random.getrandbits(31))
+                     .on_conflict_do_nothing(index_elements=['scope']))
+
+
+def read_versions(scopes):
+    """Return {scope: version} for `scopes` (0 for scopes never written) with one query."""
+    scopes = sorted(set(scopes) | {'epoch'})
+    with _get_engine().connect() as conn:
+        found = dict(conn.execute(select(DataVersion.scope, DataVersion.version)
+                                  .where(DataVersion.scope.in_(scopes))).all())
+    return {s: found.get(s, 0) for s in scopes}
+
+
+def user_id_for_face_uuid(face_uuid):
+    """users.id for a face_uuid without going through the ORM, or None."""
+    with _get_engine().connect() as conn:
+        return conn.execute(text('SELECT id FROM users WHERE face_uuid = :u'), {'u': face_uuid}).scalar()
+
+
+def etag_for(scopes, daily=False):
+    """Strong ETag for the data in `scopes`. With `daily`, the UTC date is included as well,
+    for responses with values such as days_in_storage that change without any write."""
+    versions = read_versions(scopes)
+    key = ';'.join(f'{s}={v}' for s, v in versions.items())
+    if daily:
+        key += f';date={datetime.utcnow().date().isoformat()}'
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+def _client_has(etag):
+    # Flask-Compress appends ':gzip' (etc.) to strong ETags of compressed responses
+    if request.if_none_match.star_tag:
+        return True
+    return any(tag == etag or tag.startswith(etag + ':') for tag in request.if_none_match.as_set())
+
+
+def conditional(scopes_for, daily=False):
+    """Decorator for GET views whose output depends only on the scopes returned by
+    `scopes_for(*view_args, **view_kwargs)`. Sets a strong ETag on 200 responses and
+    returns 304 when the client already has the current version. If `scopes_for`
+    returns None the view runs unconditionally."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            scopes = scopes_for(*args, **kwargs)
+            if scopes is None:
+                return view(*args, **kwargs)
+            etag = etag_for(scopes, daily=daily)
+            if _client_has(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            # Let browsers keep the body but revalidate on every fetch
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator